@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+'''
+Created on 18/10/2026
+
+Measures line splitting throughput of timberslide.s3repository.BZ2KeyIterator against the
+previous list.pop(0) based implementation over a synthetic single stream bz2 file (see
+benchmarks.synthetic), which is all the previous implementation can read, and of
+ParallelBZ2KeyIterator over the same lines split in pbzip2-like streams:
+
+    python -m benchmarks.bz2_bench --mb 64 --bufsize 102400 --threads 4
+
+Results are reported per decompressed MB, so they extrapolate to multi-GB files. Every case
+must split the same number of lines.
+'''
+
+import sys
+from argparse import ArgumentParser
+from bz2 import BZ2Decompressor
+from benchmarks.results import Results, add_common_arguments, timeit
+from benchmarks.synthetic import synthetic_bz2
+from timberslide.s3repository import BZ2KeyIterator, ParallelBZ2KeyIterator
+
+
+# Stand-in for an S3 Key that returns a given compressed string in 'size' byte reads.
+class _MemoryKey(object):
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, size):
+        if self.pos >= len(self.data):
+            return None
+        retval = self.data[self.pos:self.pos+size]
+        self.pos = self.pos + size
+        return retval
+
+
+# The implementation of BZ2KeyIterator before it was rewritten, kept for comparison. Unlike
+# it, an empty last line is not returned, so both split files in the same number of lines.
+class _ListBZ2KeyIterator(object):
+    def __init__(self, key, bufsize=100*1024):
+        self.key = key
+        self.bufsize = bufsize
+        self._decomp = BZ2Decompressor()
+        self._lines = []
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while True:
+            if len(self._lines) > 1:
+                return self._lines.pop(0) + '\n'
+            elif self._done and len(self._lines) == 1 and self._lines[0] != '':
+                return self._lines.pop(0)
+            elif self._done and len(self._lines) <= 1:
+                raise StopIteration
+            else:
+                chunk = self.key.read(self.bufsize)
+                if chunk is not None:
+                    try:
+                        lines = self._decomp.decompress(chunk).split('\n')
+                        if len(self._lines) > 0:
+                            self._lines[len(self._lines)-1] = self._lines[len(self._lines)-1] + lines.pop(0)
+                        for line in lines:
+                            self._lines.append(line)
+                    except EOFError:
+                        self._done = True
+                else:
+                    self._done = True
+
+
+def _run(factory, data, bufsize, batch):
+    it = factory(_MemoryKey(data), bufsize)
+    count = 0
+    try:
+        if batch:
+            while True:
+                count = count + len(it.nextbatch())
+        else:
+            while True:
+                it.next()
+                count = count + 1
+    except StopIteration:
+        pass
+    return count
+
+
+def add_arguments(parser):
+    parser.add_argument('--mb', type=int, default=16, help='decompressed size of the synthetic file')
+    parser.add_argument('--bufsize', type=int, default=100*1024, help='compressed bytes read at a time')
+    parser.add_argument('--threads', type=int, default=4, help='threads used by ParallelBZ2KeyIterator')
+
+
+def run(args, results):
+    def parallel(key, bufsize):
+        return ParallelBZ2KeyIterator(key, workers=args.threads, bufsize=bufsize)
+
+    # both files have the same lines, only the streams they are compressed in differ
+    single, size = synthetic_bz2(args.mb, args.seed)
+    multi, size = synthetic_bz2(args.mb, args.seed, streammb=0.9)
+    lines = None
+    for name, factory, data, batch in [('pop(0)', _ListBZ2KeyIterator, single, False),
+                                       ('next', BZ2KeyIterator, single, False),
+                                       ('nextbatch', BZ2KeyIterator, single, True),
+                                       ('parallel', parallel, multi, True)]:
+        elapsed, count = timeit(lambda: _run(factory, data, args.bufsize, batch), args.repeat)
+        if lines is not None and count != lines:
+            raise Exception('{0} split {1} lines instead of {2}'.format(name, count, lines))
+        lines = count
+        results.record('bz2', name, elapsed, lines=count, bytes=size, mb_per_s=size / elapsed / 1024 / 1024,
+                       s_per_gb=elapsed * 1024 * 1024 * 1024 / size)
+
+
+def main():
+    parser = ArgumentParser(description='BZ2KeyIterator line splitting benchmark')
+    add_common_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    run(args, Results(args.output, vars(args)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+'''
+Created on 18/10/2026
+
+Compares the results of two runs of the benchmarks, as JSON lines files written by them,
+printing the change in time of every case they have in common. If a file has several
+results for a case, the latest one is used. Exits with status 1 if any case got slower by
+more than --threshold percent, so it can be used to catch regressions:
+
+    python -m benchmarks.compare baseline.jsonl results.jsonl --threshold 10
+'''
+
+import json
+import sys
+from argparse import ArgumentParser
+
+
+# Returns the latest result of each (benchmark, case) in a JSON lines file.
+def _latest(path):
+    retval = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                retval[(record['benchmark'], record['case'])] = record
+    return retval
+
+
+def main():
+    parser = ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('results')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percentage by which a case may get slower before it is reported as a regression')
+    args = parser.parse_args()
+
+    baseline = _latest(args.baseline)
+    results = _latest(args.results)
+    regressions = 0
+    for key in sorted(set(baseline.keys()) & set(results.keys())):
+        before = baseline[key]['seconds']
+        after = results[key]['seconds']
+        change = (after - before) * 100.0 / before if before > 0 else 0.0
+        regressed = change > args.threshold
+        regressions = regressions + (1 if regressed else 0)
+        print('{0:>6} {1:>16}: {2:.4f}s -> {3:.4f}s ({4:+.1f}%){5}'.format(
+            key[0], key[1], before, after, change, ' REGRESSION' if regressed else ''))
+    return 1 if regressions > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
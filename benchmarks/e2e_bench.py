@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+'''
+Created on 18/10/2026
+
+Times bin/timberscript end to end: synthetic bz2 files (see benchmarks.synthetic) are
+uploaded to a bucket of a local S3 stand-in such as moto_server or MinIO, one per hour, and
+then loaded into PostgreSQL by running timberscript with --overwrite. Needs both, e.g.:
+
+    moto_server -p 5000 &
+    python -m benchmarks.e2e_bench --endpoint localhost:5000 -s localhost:5432 -u postgres -p secret
+
+The boto credentials are taken from the environment, and set to dummy values if missing
+since stand-ins do not check them.
+'''
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from benchmarks.results import Results, add_common_arguments, add_db_arguments, timeit
+from benchmarks.synthetic import synthetic_bz2
+from timberslide.s3repository import S3Repository
+from timberslide.slots import Slot
+
+_timberscript = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin', 'timberscript')
+
+
+# Uploads one synthetic file per hour starting at 'first', returning their total
+# decompressed and compressed sizes.
+def _upload(repo, first, files, mb, seed):
+    conn = repo._connect()
+    bucket = conn.lookup(repo.bucket)
+    if bucket is None:
+        bucket = conn.create_bucket(repo.bucket)
+    size = 0
+    compressed = 0
+    for i in range(files):
+        slot = first + i
+        data, datasize = synthetic_bz2(mb, seed + i, streammb=0.9, slot=slot.slot)
+        key = bucket.new_key(repo.get_slot_prefix(slot) + 'bench-{0:04d}.tsv.bz2'.format(i))
+        key.set_contents_from_string(data)
+        size = size + datasize
+        compressed = compressed + len(data)
+    return size, compressed
+
+
+def add_arguments(parser):
+    parser.add_argument('--endpoint', help='S3-compatible endpoint as <host>[:<port>], the benchmark is skipped if not given')
+    parser.add_argument('-r', '--repository', default='s3://timberslide-bench/niddel-aggregated/',
+                        help='S3 directory the synthetic files are uploaded to')
+    parser.add_argument('--files', type=int, default=8, help='number of synthetic files, one per hour')
+    parser.add_argument('--file-mb', type=int, default=8, help='decompressed size of each synthetic file')
+    parser.add_argument('--workers', type=int, default=2, help='timberscript worker processes')
+    parser.add_argument('--method', action='append', help='timberscript --method to time, can be used multiple times (default: all)')
+
+
+def run(args, results):
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'timberslide')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'timberslide')
+
+    first = Slot('2015010100')
+    repo = S3Repository(args.repository, endpoint=args.endpoint)
+    size, compressed = _upload(repo, first, args.files, args.file_mb, args.seed)
+    slots = '{0}:{1}'.format(first, first + (args.files - 1))
+
+    for method in args.method or ['insert', 'copy', 'copy-binary']:
+        handle, metrics = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        command = [sys.executable, _timberscript, '-r', args.repository, '--endpoint', args.endpoint,
+                   '-s', args.server, '-d', args.database, '-u', args.user, '-p', args.password,
+                   '--sslmode', args.sslmode, '-t', args.table, '--overwrite', '-m', method,
+                   '-w', str(args.workers), '--metrics-json', metrics, slots]
+        try:
+            elapsed, code = timeit(lambda: subprocess.call(command), args.repeat)
+            if code != 0:
+                raise Exception('timberscript exited with status {0}'.format(code))
+            with open(metrics) as f:
+                records = [json.loads(line) for line in f]
+            # each run appends its totals, keep the last one
+            totals = [r for r in records if r['type'] == 'totals'][-1]['workers']
+            rows = sum([w['rows_written'] for w in totals.values()])
+        finally:
+            os.remove(metrics)
+        results.record('e2e', method, elapsed, files=args.files, rows=rows, rows_per_s=rows / elapsed,
+                       mb_per_s=size / elapsed / 1024 / 1024, compressed_mb_per_s=compressed / elapsed / 1024 / 1024)
+
+
+def main():
+    parser = ArgumentParser(description='timberscript end to end benchmark')
+    add_common_arguments(parser)
+    add_db_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.server is None or args.endpoint is None:
+        parser.error('a PostgreSQL server and an S3 endpoint are needed, see --server and --endpoint')
+    run(args, Results(args.output, dict(vars(args), password=None)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
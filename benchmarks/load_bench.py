@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+'''
+Created on 18/10/2026
+
+Compares the time it takes to write the same synthetic rows (see benchmarks.synthetic) to
+PostgreSQL using timberslide.db.insert, timberslide.db.copy and timberslide.db.copy_binary.
+Needs a server to write to, e.g.:
+
+    python -m benchmarks.load_bench -s localhost:5432 -u postgres -p secret --rows 200000
+'''
+
+import sys
+from argparse import ArgumentParser
+from benchmarks.results import Results, add_common_arguments, add_db_arguments, timeit
+from benchmarks.synthetic import synthetic_tsv
+from timberslide.db import connect, createtable, droptable, insert, copy, copy_binary
+from timberslide.parse import TSVIterator
+# Python 3 shim
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def add_arguments(parser):
+    parser.add_argument('--rows', type=int, default=100000)
+
+
+def run(args, results):
+    text = synthetic_tsv(args.rows, args.seed)
+    conn = connect(args.server, args.user, args.password, args.database, args.sslmode)
+    try:
+        for name, load in [('insert', insert), ('copy', copy), ('copy-binary', copy_binary)]:
+            def once():
+                droptable(conn, args.table)
+                createtable(conn, args.table)
+                conn.commit()
+                return load(conn, args.table, TSVIterator(StringIO(text)))
+
+            # the table is created anew every time, which takes next to nothing next to the load
+            elapsed, count = timeit(once, args.repeat)
+            results.record('load', name, elapsed, rows=count, rows_per_s=count / elapsed,
+                           mb_per_s=len(text) / elapsed / 1024 / 1024)
+        droptable(conn, args.table)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = ArgumentParser(description='INSERT versus COPY (text and binary) load benchmark')
+    add_common_arguments(parser)
+    add_db_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.server is None:
+        parser.error('a PostgreSQL server to write to is needed, see --server')
+    run(args, Results(args.output, dict(vars(args), password=None)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
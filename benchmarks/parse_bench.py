@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+'''
+Created on 18/10/2026
+
+Measures how fast timberslide.parse.TSVIterator turns synthetic lines (see
+benchmarks.synthetic) into rows, one row at a time with next() and in batches with
+nextbatch() as the loader pipeline does, and how fast timberslide.columnar.ColumnarTSVReader
+turns them into columns if NumPy is installed:
+
+    python -m benchmarks.parse_bench --rows 200000
+'''
+
+import sys
+from argparse import ArgumentParser
+from benchmarks.results import Results, add_common_arguments, timeit
+from benchmarks.synthetic import synthetic_tsv
+from timberslide.parse import TSVIterator
+# numpy is an optional dependency
+try:
+    from timberslide.columnar import ColumnarTSVReader
+except ImportError:
+    ColumnarTSVReader = None
+
+
+def _run(lines, batch, factory=TSVIterator):
+    it = factory(iter(lines))
+    count = 0
+    try:
+        if batch:
+            while True:
+                count = count + len(it.nextbatch(batch))
+        else:
+            while True:
+                it.next()
+                count = count + 1
+    except StopIteration:
+        pass
+    return count
+
+
+def add_arguments(parser):
+    parser.add_argument('--rows', type=int, default=100000)
+
+
+def run(args, results):
+    text = synthetic_tsv(args.rows, args.seed)
+    lines = text.splitlines(True)
+    cases = [('next', None, TSVIterator), ('nextbatch', 1024, TSVIterator)]
+    if ColumnarTSVReader is not None:
+        cases.append(('columnar', 65536, ColumnarTSVReader))
+    for name, batch, factory in cases:
+        elapsed, count = timeit(lambda: _run(lines, batch, factory), args.repeat)
+        results.record('parse', name, elapsed, rows=count, rows_per_s=count / elapsed,
+                       mb_per_s=len(text) / elapsed / 1024 / 1024)
+
+
+def main():
+    parser = ArgumentParser(description='TSVIterator parsing benchmark')
+    add_common_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    run(args, Results(args.output, vars(args)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
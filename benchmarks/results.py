@@ -0,0 +1,112 @@
+'''
+Created on 18/10/2026
+
+Machine-readable benchmark results. Every measurement is appended to a JSON lines file as
+one object with the benchmark and case names, the best time in seconds, any throughput
+figures, the parameters of the run and a description of the environment (git commit,
+Python version, platform and host), so results can be compared across commits with
+benchmarks.compare.
+'''
+
+import json
+import os
+import platform
+import socket
+import subprocess
+from time import time
+
+
+# Returns the git commit of the working tree the benchmarks run from, or None.
+def _git_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=devnull,
+                                          cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+'''
+Returns a dictionary describing the environment benchmarks run in.
+'''
+
+
+def environment():
+    return {'commit': _git_commit(), 'python': platform.python_version(),
+            'implementation': platform.python_implementation(), 'platform': platform.platform(),
+            'host': socket.gethostname()}
+
+
+'''
+Calls 'func' 'repeat' times and returns the shortest time it took, in seconds, along with
+the value it returned the last time.
+'''
+
+
+def timeit(func, repeat=1):
+    best = None
+    retval = None
+    for i in range(repeat):
+        start = time()
+        retval = func()
+        elapsed = time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, retval
+
+
+'''
+This class records benchmark results, printing each one and appending it as a JSON line to
+the file at 'path', if given. Parameters given as 'params' are recorded with every result.
+'''
+
+
+class Results(object):
+    def __init__(self, path=None, params=None):
+        self.path = path
+        self.params = params or {}
+        self.env = environment()
+        self.records = []
+
+    # Records the best time in seconds of a case of a benchmark, with any other figures
+    # (e.g. rows or MB per second) given as keyword arguments.
+    def record(self, benchmark, case, seconds, **values):
+        record = dict(values, benchmark=benchmark, case=case, seconds=seconds, time=time(),
+                      params=self.params, env=self.env)
+        self.records.append(record)
+        figures = ', '.join(['{0} {1}'.format(k, _format(values[k])) for k in sorted(values.keys())])
+        print('{0:>6} {1:>16}: {2:.4f}s{3}'.format(benchmark, case, seconds, ' (' + figures + ')' if figures else ''))
+        if self.path is not None:
+            with open(self.path, 'a') as out:
+                out.write(json.dumps(record, sort_keys=True) + '\n')
+        return record
+
+
+def _format(value):
+    return '{0:.1f}'.format(value) if isinstance(value, float) else str(value)
+
+
+'''
+Adds the arguments shared by every benchmark to an ArgumentParser.
+'''
+
+
+def add_common_arguments(parser):
+    parser.add_argument('-o', '--output', default='benchmark-results.jsonl',
+                        help='JSON lines file the results are appended to')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times each case is timed, the best is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+
+
+'''
+Adds the arguments of the PostgreSQL server benchmarks write to, if any, to an ArgumentParser.
+'''
+
+
+def add_db_arguments(parser):
+    parser.add_argument('-s', '--server', help='PostgreSQL server as <host>[:<port>], the benchmarks that need one are skipped if not given')
+    parser.add_argument('-d', '--database', default='postgres')
+    parser.add_argument('-u', '--user', default='timberslide')
+    parser.add_argument('-p', '--password', default='')
+    parser.add_argument('--sslmode', default='disable')
+    parser.add_argument('-t', '--table', default='timberslide_bench')
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+'''
+Created on 18/10/2026
+
+Runs every benchmark with the same synthetic data and appends all results to a single
+JSON lines file. The benchmarks that need a PostgreSQL server (load) or also an S3
+stand-in (e2e) are skipped unless --server and --endpoint are given:
+
+    python -m benchmarks.run -o results.jsonl
+    python -m benchmarks.run --only load --only e2e -s localhost:5432 -u postgres -p secret --endpoint localhost:5000
+
+Options of the individual benchmarks (see their --help) can be given here too.
+'''
+
+import sys
+from argparse import ArgumentParser
+from benchmarks import bz2_bench, e2e_bench, load_bench, parse_bench, slots_bench
+from benchmarks.results import Results, add_common_arguments, add_db_arguments
+
+# benchmarks by name, in the order they run
+_benchmarks = [('slots', slots_bench), ('parse', parse_bench), ('bz2', bz2_bench), ('load', load_bench),
+               ('e2e', e2e_bench)]
+
+
+def main():
+    # benchmarks share options such as --rows, which are only added once
+    parser = ArgumentParser(description='timberslide benchmarks', conflict_handler='resolve')
+    add_common_arguments(parser)
+    add_db_arguments(parser)
+    parser.add_argument('--only', action='append', choices=[name for name, module in _benchmarks],
+                        help='benchmark to run, can be used multiple times (default: all)')
+    for name, module in _benchmarks:
+        module.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = Results(args.output, dict(vars(args), password=None))
+    for name, module in _benchmarks:
+        if args.only is not None and name not in args.only:
+            continue
+        if name in ('load', 'e2e') and args.server is None:
+            print('Skipping {0}, it needs a PostgreSQL server (--server)'.format(name))
+        elif name == 'e2e' and args.endpoint is None:
+            print('Skipping {0}, it needs an S3 endpoint (--endpoint)'.format(name))
+        else:
+            module.run(args, results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
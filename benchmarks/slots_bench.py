@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+'''
+Created on 18/10/2026
+
+Times the Slot operations used when planning a run, over a multi-year range:
+
+    python -m benchmarks.slots_bench --years 10
+'''
+
+import sys
+from argparse import ArgumentParser
+from random import Random
+from benchmarks.results import Results, add_common_arguments, timeit
+from timberslide.slots import Slot, mergeSlotSets
+
+
+def add_arguments(parser):
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--ranges', type=int, default=200, help='number of overlapping ranges to merge')
+
+
+def run(args, results):
+    first = Slot("2010010105")
+    last = Slot(format(2010 + args.years - 1, "04") + "123118")
+    hours = args.years * 365 * 24
+    rnd = Random(args.seed)
+    ranges = []
+    for i in range(args.ranges):
+        start = first + rnd.randint(0, hours - 1)
+        ranges.append((start, start + rnd.randint(0, 24 * 90)))
+
+    def construct():
+        for i in range(hours // 10):
+            Slot("2015061512")
+
+    def add():
+        slot = first
+        for i in range(hours // 10):
+            slot = slot + 1
+
+    def family():
+        for slot in Slot(format(2010, "04")).children():
+            for day in slot.children():
+                day.children()
+                day.parents()
+
+    def rangeto():
+        first.rangeto(last)
+
+    def merge():
+        mergeSlotSets([s.rangeto(e) for s, e in ranges])
+
+    for name, func in [('construct', construct), ('add', add), ('children', family), ('rangeto', rangeto),
+                       ('mergeSlotSets', merge)]:
+        results.record('slots', name, timeit(func, args.repeat)[0])
+
+
+def main():
+    parser = ArgumentParser(description='Slot range operations benchmark')
+    add_common_arguments(parser)
+    add_arguments(parser)
+    args = parser.parse_args()
+    run(args, Results(args.output, vars(args)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
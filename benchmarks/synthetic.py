@@ -0,0 +1,170 @@
+'''
+Created on 18/10/2026
+
+Generates synthetic data shaped like the Niddel-aggregated logs: TSV files with a header of
+the dotted column names (e.g. 'net.dst.ip.mmgeo_country', as in parse._default_func) for
+every column of the db._create_table_query schema, with values drawn from skewed
+distributions and the share of 'NA' values typical of each column, compressed with bzip2.
+'''
+
+from bz2 import BZ2Compressor
+from random import Random
+from re import sub
+from timberslide.db import _column_def, _create_table_query, sqlcolnames
+
+# names of the columns of the table schema, in order
+sqlcolumns = [m.group('name') for m in _column_def.finditer(_create_table_query)]
+
+
+'''
+Returns the dotted TSV column name of a table column name, keeping the underscores that
+are part of a name component (e.g. 'mmgeo_country' or 'domain_0').
+'''
+
+
+def dotted(sqlname):
+    return sub('\\.(mmgeo|domain)\\.', '.\\1_', sqlname.replace('_', '.'))
+
+
+# TSV column names of the schema, in order
+columns = [dotted(c) for c in sqlcolumns]
+assert [c.lower() for c in sqlcolnames(columns)] == [c.lower() for c in sqlcolumns]
+
+# share of 'NA' values of the columns of an IP address, by the components of their names
+# after 'net.src.ip.' or 'net.dst.ip.', the default is 0
+_na = {'asname': 0.05, 'asnumber': 0.05, 'bgpPrefix': 0.05, 'datacenter.name': 0.97, 'datacenter.url': 0.97,
+       'mmgeo_areaCode': 0.9, 'mmgeo_city': 0.45, 'mmgeo_country': 0.03, 'mmgeo_latitude': 0.03,
+       'mmgeo_locationId': 0.03, 'mmgeo_longitude': 0.03, 'mmgeo_metroCode': 0.9, 'mmgeo_postalCode': 0.6,
+       'mmgeo_region': 0.4, 'mmgeo_regionName': 0.4, 'rdomain': 0.35, 'rdomain.domain_0': 0.35,
+       'rdomain.domain_1': 0.35, 'rdomain.domain_2': 0.6, 'torExitNode': 0.02}
+
+_asns = [(16509, 'AMAZON-02'), (15169, 'GOOGLE'), (8075, 'MICROSOFT-CORP-MSN-AS-BLOCK'),
+         (13335, 'CLOUDFLARENET'), (7922, 'COMCAST-7922'), (20940, 'AKAMAI-ASN1'), (4134, 'CHINANET-BACKBONE'),
+         (3356, 'LEVEL3'), (32934, 'FACEBOOK'), (14618, 'AMAZON-AES')]
+_geo = [('US', 'Seattle', 'WA', 'Washington', 47.6062, -122.3321, '206', '98101', '819'),
+        ('US', 'Ashburn', 'VA', 'Virginia', 39.0438, -77.4874, '703', '20147', '511'),
+        ('BR', 'Sao Paulo', '27', 'Sao Paulo', -23.5475, -46.6361, 'NA', 'NA', 'NA'),
+        ('DE', 'Frankfurt', '05', 'Hessen', 50.1155, 8.6842, 'NA', '60311', 'NA'),
+        ('CN', 'Beijing', '22', 'Beijing', 39.9289, 116.3883, 'NA', 'NA', 'NA'),
+        ('IE', 'Dublin', '07', 'Dublin', 53.3331, -6.2489, 'NA', 'NA', 'NA')]
+_domains = ['amazonaws.com', 'googleusercontent.com', '1e100.net', 'akamaitechnologies.com', 'comcast.net',
+            'cloudfront.net', 'facebook.com', 'msn.com']
+_ports = [443] * 12 + [80] * 6 + [53] * 3 + [123, 22, 25, 8080, 3389]
+
+
+# Returns a skewed random index below n, where low values are the most common.
+def _skewed(rnd, n):
+    return min(int(rnd.expovariate(3.0 / n)), n - 1)
+
+
+def _ip(rnd, internal):
+    if internal:
+        return '10.{0}.{1}.{2}'.format(rnd.randint(0, 3), rnd.randint(0, 255), rnd.randint(1, 254))
+    if rnd.random() < 0.03:
+        return '2600:1f14:{0:x}::{1:x}'.format(rnd.randint(0, 65535), rnd.randint(1, 65535))
+    return '{0}.{1}.{2}.{3}'.format(rnd.randint(1, 223), rnd.randint(0, 255), rnd.randint(0, 255),
+                                    rnd.randint(1, 254))
+
+
+# Returns a dictionary with the values of one side (src or dst) of a connection, by the
+# components of the column names after 'net.src.ip.' or 'net.dst.ip.' ('' for the address
+# itself and 'port' for the port).
+def _endpoint(rnd, internal, server):
+    ip = _ip(rnd, internal)
+    asn = _asns[_skewed(rnd, len(_asns))]
+    geo = _geo[_skewed(rnd, len(_geo))]
+    domain = _domains[_skewed(rnd, len(_domains))]
+    prefix = '.'.join(ip.split('.')[0:2]) + '.0.0/16' if ':' not in ip else ip.split('::')[0] + '::/32'
+    values = {'': ip, 'asname': asn[1], 'asnumber': str(asn[0]), 'bgpPrefix': prefix,
+              'datacenter.name': 'Amazon AWS', 'datacenter.url': 'https://aws.amazon.com/',
+              'mmgeo_country': geo[0], 'mmgeo_city': geo[1], 'mmgeo_region': geo[2], 'mmgeo_regionName': geo[3],
+              'mmgeo_latitude': repr(geo[4]), 'mmgeo_longitude': repr(geo[5]), 'mmgeo_areaCode': geo[6],
+              'mmgeo_postalCode': geo[7], 'mmgeo_metroCode': geo[8], 'mmgeo_locationId': str(rnd.randint(1, 400000)),
+              'rdomain': 'ec2-{0}.compute.{1}'.format(ip.replace('.', '-'), domain),
+              'rdomain.domain_0': domain.split('.')[-1], 'rdomain.domain_1': domain,
+              'rdomain.domain_2': 'compute.' + domain,
+              'torExitNode': 'TRUE' if rnd.random() < 0.001 else 'FALSE',
+              'port': str(rnd.choice(_ports)) if server else str(rnd.randint(1024, 65535))}
+    if internal:
+        for k in values.keys():
+            if k not in ('', 'port', 'torExitNode'):
+                values[k] = 'NA'
+    return values
+
+
+'''
+Generates 'rows' synthetic rows (or an endless sequence if None) as lists of strings in
+the order of 'columns', all in the hour of the given slot.
+'''
+
+
+def synthetic_rows(rows, seed=0, slot='2015010100'):
+    rnd = Random(seed)
+    count = 0
+    while rows is None or count < rows:
+        count = count + 1
+        outbound = rnd.random() < 0.7
+        sides = {'src': _endpoint(rnd, outbound, False), 'dst': _endpoint(rnd, not outbound, True)}
+        first = '{0:02d}:{1:02d}'.format(rnd.randint(0, 59), rnd.randint(0, 59))
+        row = []
+        for column in columns:
+            parts = column.split('.')
+            if column == 'agg.count':
+                value = str(1 + _skewed(rnd, 500))
+            elif column in ('agg.first', 'agg.last'):
+                value = first
+            elif column == 'net.blocked':
+                value = 'TRUE' if rnd.random() < 0.02 else 'FALSE'
+            elif column == 'net.l4proto':
+                value = rnd.choice(['tcp'] * 8 + ['udp'] * 2)
+            elif column == 'yyyymmddhh':
+                value = slot
+            else:
+                name = '.'.join(parts[3:]) if parts[2] == 'ip' else parts[2]
+                value = sides[parts[1]][name]
+                if rnd.random() < _na.get(name, 0.0):
+                    value = 'NA'
+            row.append(value)
+        yield row
+
+
+'''
+Returns the text of a synthetic TSV file with a header line and the given number of rows.
+'''
+
+
+def synthetic_tsv(rows, seed=0, slot='2015010100'):
+    lines = ['\t'.join(columns)] + ['\t'.join(row) for row in synthetic_rows(rows, seed, slot)]
+    return '\n'.join(lines) + '\n'
+
+
+'''
+Returns a bz2 compressed synthetic TSV file with roughly 'mb' megabytes of rows, along with
+its exact decompressed size. A new stream is started every 'streammb' megabytes, the way
+pbzip2 does (with 0.9 MB by default), or never if it is None.
+'''
+
+
+def synthetic_bz2(mb, seed=0, streammb=None, slot='2015010100'):
+    comp = BZ2Compressor()
+    parts = []
+    block = ['\t'.join(columns) + '\n']
+    size = len(block[0])
+    streamsize = size
+    for row in synthetic_rows(None, seed, slot):
+        if size >= mb * 1024 * 1024:
+            break
+        line = '\t'.join(row) + '\n'
+        block.append(line)
+        size = size + len(line)
+        streamsize = streamsize + len(line)
+        if len(block) >= 1000:
+            parts.append(comp.compress(''.join(block)))
+            block = []
+            if streammb is not None and streamsize >= streammb * 1024 * 1024:
+                parts.append(comp.flush())
+                comp = BZ2Compressor()
+                streamsize = 0
+    parts.append(comp.compress(''.join(block)))
+    parts.append(comp.flush())
+    return ''.join(parts), size
@@ -11,6 +11,7 @@ config = {
     'author_email': 'davidski@deadheaven.com',
     'version': '0.1',
     'install_requires': ['nose'],
+    'extras_require': {'columnar': ['numpy'], 'parquet': ['pyarrow']},
     'packages': ['timberslide'],
     'scripts': ['bin/timberscript'],
     'name': 'timberslide',
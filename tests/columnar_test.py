@@ -0,0 +1,59 @@
+'''
+Created on 18/10/2026
+'''
+import unittest
+from timberslide.parse import TSVIterator
+# numpy is an optional dependency
+try:
+    from timberslide.columnar import ColumnarTSVReader
+except ImportError:
+    ColumnarTSVReader = None
+# Python 3 shim
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+@unittest.skipIf(ColumnarTSVReader is None, 'numpy is not installed')
+class ColumnarTest(unittest.TestCase):
+    def testColumnar(self):
+        text = ('"a"\t"b"\t"c"\t"d"\t"e"\n'
+                '""\t"NA"\t12.5\t"12"\tTRUE\n'
+                '\n'
+                'x\tNA\tNA\t""\t\n'
+                'y\tz\t-1\t3\tFALSE\n')
+        func = {'c': float, 'd': int, 'e': bool}
+        nonevals = set(["", "NA"])
+        reader = ColumnarTSVReader(StringIO(text), func, nonevals)
+        self.assertEquals(reader.colnames, ['a', 'b', 'c', 'd', 'e'])
+        batch = reader.nextbatch(2)
+        self.assertEquals(batch.size, 1)
+        batch = reader.nextbatch(10)
+        self.assertEquals(batch.size, 2)
+        with self.assertRaises(StopIteration):
+            reader.nextbatch()
+
+        # same values as TSVIterator, with invalid values replaced by zeros
+        rows = list(TSVIterator(StringIO(text), func, nonevals))
+        batches = list(ColumnarTSVReader(StringIO(text), func, nonevals))
+        self.assertEquals(len(batches), 1)
+        batch = batches[0]
+        self.assertEquals(batch.columns['c'].dtype.kind, 'f')
+        self.assertEquals(batch.columns['d'].dtype.kind, 'i')
+        self.assertEquals(batch.columns['e'].dtype.kind, 'b')
+        self.assertEquals(batch.columns['a'].dtype.kind, 'O')
+        for i, name in enumerate(batch.colnames):
+            self.assertEquals(list(batch.valid[name]), [row[i] is not None for row in rows])
+            self.assertEquals(list(batch.columns[name]),
+                              [row[i] if row[i] is not None or batch.columns[name].dtype.kind == 'O' else 0
+                               for row in rows])
+
+    def testColumnarError(self):
+        reader = ColumnarTSVReader(StringIO('a\tb\n1\tNA\n2\tx\n'), {'b': int})
+        with self.assertRaises(ValueError):
+            reader.nextbatch()
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -4,8 +4,66 @@ Created on 02/01/2015
 @author: asieira
 '''
 import unittest
-from timberslide.db import is_valid_id, escape, connection_string
+from timberslide.db import is_valid_id, escape, connection_string, copy_value, CopyTextReader, copy, \
+    column_types, CopyBinaryReader, copy_binary, record_load, loaded_keys, createpartitioned, createpartitions, \
+    partition_slot, partition_name, createstaging, logstaging, createindexes, swaptable, \
+    replace_slot, PostgresSink
+from timberslide.slots import Slot
+from timberslide.parse import TSVIterator
 from argparse import ArgumentTypeError
+# Python 3 shim
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+import sys
+if sys.version_info > (3,):
+    long = int
+
+
+# Minimal stand-in for a psycopg2 connection that records what is sent with COPY
+class _DummyCursor(object):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+
+    def fetchall(self):
+        return self.conn.results
+
+    def copy_expert(self, sql, f, size):
+        self.conn.sql = sql
+        self.conn.data = ''
+        chunk = f.read(size)
+        while len(chunk) > 0:
+            self.conn.data = self.conn.data + chunk
+            chunk = f.read(size)
+
+    def close(self):
+        pass
+
+
+class _DummyConnection(object):
+    def __init__(self):
+        self.sql = None
+        self.data = None
+        self.committed = False
+        self.executed = []
+        self.results = []
+        self.server_version = 120000
+
+    def cursor(self):
+        return _DummyCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.executed.append(('ROLLBACK', None))
+
+    def close(self):
+        self.executed.append(('CLOSE', None))
 
 
 class Test(unittest.TestCase):
@@ -34,6 +92,198 @@ class Test(unittest.TestCase):
         self.assertEquals(connection_string('localhost:65000', 'username', 'password', 'database', 'sslmode'),
                           "user='username' password='password' host='localhost' port=65000 dbname='database' sslmode='sslmode'")
 
+    def testCopyValue(self):
+        self.assertEquals(copy_value(None), '\\N')
+        self.assertEquals(copy_value(True), 't')
+        self.assertEquals(copy_value(False), 'f')
+        self.assertEquals(copy_value(12), '12')
+        self.assertEquals(copy_value(12.5), '12.5')
+        self.assertEquals(copy_value('blah'), 'blah')
+        self.assertEquals(copy_value('bl\\ah'), 'bl\\\\ah')
+        self.assertEquals(copy_value('bl\tah\r\n'), 'bl\\tah\\r\\n')
+        self.assertEquals(copy_value('\\N'), '\\\\N')
+
+    def testCopyTextReader(self):
+        text = 'a\tb\n1\tx\nNA\ty\\z\n'
+        reader = CopyTextReader(TSVIterator(StringIO(text), {'a': int}))
+        self.assertEquals(reader.readline(), '1\tx\n')
+        self.assertEquals(reader.read(3), '\\N\t')
+        self.assertEquals(reader.read(), 'y\\\\z\n')
+        self.assertEquals(reader.read(), '')
+        self.assertEquals(reader.count, 2)
+
+    def testCopy(self):
+        text = 'net.src.port\tnet.blocked\n80\tTRUE\n\tNA\n'
+        conn = _DummyConnection()
+        self.assertEquals(copy(conn, 'logs', TSVIterator(StringIO(text)), 4), 2)
+        self.assertEquals(conn.sql, 'COPY logs (net_src_port, net_blocked) FROM STDIN;')
+        self.assertEquals(conn.data, '80\tt\n\\N\t\\N\n')
+        self.assertTrue(conn.committed)
+        self.assertIsNone(copy(_DummyConnection(), 'logs', TSVIterator(StringIO('a\tb\n'))))
+
+    def testColumnTypes(self):
+        types = column_types()
+        self.assertEquals(types['agg_count'], 'integer')
+        self.assertEquals(types['agg_first'], 'varchar')
+        self.assertEquals(types['net_dst_ip_asnumber'], 'bigint')
+        self.assertEquals(types['net_dst_ip_bgpprefix'], 'cidr')
+        self.assertEquals(types['yyyymmddhh'], 'varchar')
+        self.assertEquals(len(types), 50)
+
+    def testCopyBinaryReader(self):
+        text = 'i\tb\tf\tl\tn\tc\tt\n1\tTRUE\t0.5\t2\t10.0.0.1\t10.0.0.0/8\tab\nNA\t\t\t\t::1\tNA\tNA\n'
+        types = {'i': 'integer', 'b': 'boolean', 'f': 'real', 'l': 'bigint', 'n': 'inet', 'c': 'cidr'}
+        func = {'i': int, 'b': bool, 'f': float, 'l': int}
+        reader = CopyBinaryReader(TSVIterator(StringIO(text), func), types, bufsize=16)
+        data = ''
+        chunk = reader.read(7)
+        while len(chunk) > 0:
+            self.assertTrue(len(chunk) <= 7)
+            data = data + chunk
+            chunk = reader.read(7)
+        expected = ('PGCOPY\n\xff\r\n\x00' + '\x00' * 8 +
+                    '\x00\x07' + '\x00\x00\x00\x04\x00\x00\x00\x01' + '\x00\x00\x00\x01\x01' +
+                    '\x00\x00\x00\x04\x3f\x00\x00\x00' + '\x00\x00\x00\x08' + '\x00' * 7 + '\x02' +
+                    '\x00\x00\x00\x08\x02\x20\x00\x04\x0a\x00\x00\x01' +
+                    '\x00\x00\x00\x08\x02\x08\x01\x04\x0a\x00\x00\x00' + '\x00\x00\x00\x02ab' +
+                    '\x00\x07' + '\xff\xff\xff\xff' * 4 +
+                    '\x00\x00\x00\x14\x03\x80\x00\x10' + '\x00' * 15 + '\x01' + '\xff\xff\xff\xff' * 2 +
+                    '\xff\xff')
+        self.assertEquals(data, expected)
+        self.assertEquals(reader.count, 2)
+
+    def testCopyBinaryOutOfRange(self):
+        types = {'i': 'integer', 'l': 'bigint', 'f': 'real'}
+        func = {'i': int, 'l': long, 'f': float}
+        for text, column in [('i\tl\tf\n1\t2\t0.5\n3000000000\t1\t0.5\n', 'i'),
+                             ('i\tl\tf\n1\t18446744073709551616\t0.5\n', 'l'),
+                             ('i\tl\tf\n1\t2\t1e300\n', 'f')]:
+            reader = CopyBinaryReader(TSVIterator(StringIO(text), func), types, bufsize=16)
+            with self.assertRaises(ValueError) as cm:
+                reader.read()
+            self.assertTrue('of column {0} is out of range'.format(column) in str(cm.exception))
+            self.assertTrue(len(reader._buf) <= 128)
+
+    def testCopyBinary(self):
+        text = 'net.src.port\tnet.blocked\tyyyymmddhh\n80\tTRUE\t2015010100\n'
+        conn = _DummyConnection()
+        self.assertEquals(copy_binary(conn, 'logs', TSVIterator(StringIO(text))), 1)
+        self.assertEquals(conn.sql, 'COPY logs (net_src_port, net_blocked, yyyymmddhh) FROM STDIN WITH (FORMAT binary);')
+        self.assertEquals(conn.data[19:], '\x00\x03\x00\x00\x00\x04\x00\x00\x00\x50\x00\x00\x00\x01\x01'
+                                          '\x00\x00\x00\x0a2015010100\xff\xff')
+        self.assertTrue(conn.committed)
+
+    def testManifest(self):
+        class Key(object):
+            name = 'prefix/2015/01/01/00/file.tsv.bz2'
+            etag = '"abc"'
+            size = 123
+
+        conn = _DummyConnection()
+        text = 'net.src.port\n80\n'
+        self.assertEquals(copy(conn, 'logs', TSVIterator(StringIO(text)), commit=False), 1)
+        self.assertFalse(conn.committed)
+        record_load(conn, 'loaded', 'logs', Key(), None)
+        self.assertTrue(conn.executed[0][0].startswith('INSERT INTO loaded (tablename, keyname, etag, size, rowcount)'))
+        self.assertEquals(conn.executed[0][1], ('logs', Key.name, '"abc"', 123, 0))
+        self.assertFalse(conn.committed)
+
+        conn.results = [(Key.name, '"abc"', 123)]
+        self.assertEquals(loaded_keys(conn, 'loaded', 'logs'), {Key.name: ('"abc"', 123)})
+        self.assertEquals(conn.executed[1], ('SELECT keyname, etag, size FROM loaded WHERE tablename = %s;', ('logs',)))
+
+    def testPartitions(self):
+        conn = _DummyConnection()
+        createpartitioned(conn, 'logs')
+        self.assertTrue(conn.executed[0][0].startswith('\n    CREATE TABLE IF NOT EXISTS logs\n'))
+        self.assertTrue(conn.executed[0][0].endswith('yyyymmddhh varchar(10)\n    ) PARTITION BY RANGE (yyyymmddhh);'))
+
+        self.assertEquals(partition_slot(Slot('2015123123'), 'day'), Slot('20151231'))
+        self.assertEquals(partition_slot(Slot('2015123123'), 'month'), Slot('201512'))
+        self.assertEquals(partition_name('logs', Slot('201512')), 'logs_201512')
+
+        conn = _DummyConnection()
+        createpartitions(conn, 'logs', set([Slot('201512'), Slot('201511')]))
+        self.assertEquals([sql for sql, params in conn.executed], [
+            "CREATE TABLE IF NOT EXISTS logs_201511 PARTITION OF logs FOR VALUES FROM ('201511') TO ('201512');",
+            "CREATE TABLE IF NOT EXISTS logs_201512 PARTITION OF logs FOR VALUES FROM ('201512') TO ('201601');"])
+        conn = _DummyConnection()
+        createpartitions(conn, 'logs', [Slot('20151231')])
+        self.assertTrue(conn.executed[0][0].endswith("FROM ('20151231') TO ('20160101');"))
+
+    def testStaging(self):
+        conn = _DummyConnection()
+        createstaging(conn, 'logs_staging')
+        self.assertEquals(conn.executed[0][0], 'DROP TABLE IF EXISTS logs_staging;')
+        self.assertTrue(conn.executed[1][0].startswith('\n    CREATE UNLOGGED TABLE IF NOT EXISTS logs_staging\n'))
+
+        conn = _DummyConnection()
+        createindexes(conn, 'logs_staging', ['net_src_ip', 'yyyymmddhh'], 4)
+        self.assertEquals([sql for sql, params in conn.executed], [
+            'SET max_parallel_maintenance_workers = 4;',
+            'CREATE INDEX IF NOT EXISTS logs_staging_net_src_ip_idx ON logs_staging (net_src_ip);',
+            'CREATE INDEX IF NOT EXISTS logs_staging_yyyymmddhh_idx ON logs_staging (yyyymmddhh);'])
+        conn = _DummyConnection()
+        conn.server_version = 100000
+        createindexes(conn, 'logs', ['yyyymmddhh'], 4)
+        self.assertEquals(len(conn.executed), 1)
+
+        conn = _DummyConnection()
+        logstaging(conn, 'logs_staging')
+        self.assertEquals(conn.executed, [('ALTER TABLE logs_staging SET LOGGED;', None), ('ANALYZE logs_staging;', None)])
+        self.assertFalse(conn.committed)
+
+        conn = _DummyConnection()
+        swaptable(conn, 'logs_staging', 'logs', ['yyyymmddhh'], 'loaded')
+        self.assertEquals(conn.executed, [
+            ('DROP TABLE IF EXISTS logs;', None),
+            ('ALTER TABLE logs_staging RENAME TO logs;', None),
+            ('ALTER INDEX logs_staging_yyyymmddhh_idx RENAME TO logs_yyyymmddhh_idx;', None),
+            ('DELETE FROM loaded WHERE tablename = %s;', ('logs',)),
+            ('UPDATE loaded SET tablename = %s WHERE tablename = %s;', ('logs', 'logs_staging'))])
+        self.assertTrue(conn.committed)
+
+    def testReplaceSlot(self):
+        conn = _DummyConnection()
+        replace_slot(conn, 'logs', Slot('20151231'))
+        replace_slot(conn, 'logs', Slot('20151231'), 'day')
+        replace_slot(conn, 'logs', Slot('2015123123'), 'day')
+        self.assertEquals(conn.executed, [
+            ('DELETE FROM logs WHERE yyyymmddhh >= %s AND yyyymmddhh < %s;', ('20151231', '20160101')),
+            ('TRUNCATE logs_20151231;', None),
+            ('DELETE FROM logs WHERE yyyymmddhh >= %s AND yyyymmddhh < %s;', ('2015123123', '2016010100'))])
+        self.assertFalse(conn.committed)
+
+    def testPostgresSink(self):
+        class _Key(object):
+            name = 'p/2015/12/31/23/a.bz2'
+            etag = '"e"'
+            size = 10
+
+        loads = []
+
+        def load(conn, table, rows, commit=True):
+            loads.append((table, list(rows), commit))
+            return 2
+
+        conn = _DummyConnection()
+        sink = PostgresSink(conn, load, 'logs', 'day', 'manifest')
+        sink.begin(Slot('20151231'))
+        self.assertEquals(sink.write(_Key(), Slot('2015123123'), iter([1, 2])), 2)
+        self.assertEquals(loads, [('logs_20151231', [1, 2], False)])
+        self.assertFalse(conn.committed)
+        sink.commit()
+        self.assertTrue(conn.committed)
+        sink.abort()
+        sink.close()
+        self.assertEquals(conn.executed[0], ('TRUNCATE logs_20151231;', None))
+        self.assertEquals(conn.executed[-2:], [('ROLLBACK', None), ('CLOSE', None)])
+        # keys outside hour directories go to the parent table
+        sink = PostgresSink(_DummyConnection(), load, 'logs', 'day')
+        sink.write(_Key(), None, iter([]))
+        self.assertEquals(loads[-1][0], 'logs')
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
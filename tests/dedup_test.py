@@ -0,0 +1,111 @@
+'''
+Created on 18/10/2026
+'''
+import unittest
+from timberslide.dedup import Deduplicator, DedupSink, _BloomFilter
+from timberslide.parse import TSVIterator
+from timberslide.slots import Slot
+# Python 3 shim
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+# Sink that records the calls a DedupSink makes to it, along with the rows left by it
+class _DedupTestSink(object):
+    def __init__(self):
+        self.calls = []
+
+    def begin(self, slot):
+        self.calls.append(('begin', slot))
+
+    def write(self, key, slot, rows, first=None):
+        self.calls.append(('write', key, rows.colnames, list(rows)))
+        return len(self.calls[-1][3])
+
+    def commit(self):
+        self.calls.append(('commit',))
+
+    def abort(self):
+        self.calls.append(('abort',))
+
+    def close(self):
+        self.calls.append(('close',))
+
+
+def _dedup_rows(text):
+    return TSVIterator(StringIO('a\tb\n' + text))
+
+
+class DedupTest(unittest.TestCase):
+    def testDeduplicator(self):
+        dedup = Deduplicator(1024 * 1024)
+        rows = list(dedup.filter(_dedup_rows('x\t1\ny\t1\nx\t1\nx\tNA\nx\t\ny\t2\n')))
+        self.assertEquals(rows, [['x', '1'], ['y', '1'], ['x', None], ['y', '2']])
+        self.assertEquals((dedup.rows, dedup.dropped, dedup.error_rate()), (6, 2, 0.0))
+        self.assertEquals(list(dedup.filter(_dedup_rows('y\t2\nz\t3\n'))), [['z', '3']])
+        self.assertEquals(list(dedup.filter(_dedup_rows(''))), [])
+        # rows are told apart by a digest of their values, not by hash() which is the same for
+        # -1 and -2
+        self.assertFalse(dedup.seen([-1]))
+        self.assertFalse(dedup.seen([-2]))
+        self.assertTrue(dedup.seen([-1]))
+        self.assertFalse(dedup.seen([None]))
+        self.assertFalse(dedup.seen(['']))
+
+    def testBloomFilter(self):
+        bloom = _BloomFilter(1024)
+        self.assertFalse(bloom.add(12345))
+        self.assertTrue(bloom.add(12345))
+        self.assertFalse(bloom.add(-12345))
+        self.assertEquals(bloom.count, 2)
+        self.assertTrue(0 < bloom.error_rate() < 1e-10)
+        # rows seen before the set was spilled are still duplicates, and few new rows are lost
+        dedup = Deduplicator(64 * 100)
+        for i in range(100):
+            self.assertFalse(dedup.seen([i]))
+        self.assertEquals(dedup._bloom, None)
+        self.assertFalse(dedup.seen([100]))
+        self.assertNotEqual(dedup._bloom, None)
+        self.assertEquals(len([i for i in range(101) if not dedup.seen([i])]), 0)
+        self.assertTrue(len([i for i in range(101, 201) if dedup.seen([i])]) <= 1)
+        self.assertTrue(0 < dedup.error_rate() < 1e-3)
+
+    def testSink(self):
+        inner = _DedupTestSink()
+        sink = DedupSink(inner, 1024 * 1024)
+        sink.begin('slot')
+        self.assertEquals(sink.write('k1', None, _dedup_rows('x\t1\nx\t1\n')), 1)
+        self.assertEquals(sink.dropped, 1)
+        self.assertEquals(sink.write('k2', None, _dedup_rows('x\t1\ny\t2\n')), 1)
+        self.assertEquals(sink.dropped, 1)
+        sink.commit()
+        self.assertEquals(inner.calls, [('begin', 'slot'), ('write', 'k1', ['a', 'b'], [['x', '1']]),
+                                        ('write', 'k2', ['a', 'b'], [['y', '2']]), ('commit',)])
+        # rows of other units are not duplicates
+        sink.begin('other')
+        self.assertEquals(sink.write('k1', None, _dedup_rows('x\t1\n')), 1)
+        sink.abort()
+        sink.write('k1', None, _dedup_rows('x\t1\n'))
+        self.assertEquals(sink.dropped, 0)
+        sink.close()
+        self.assertEquals(inner.calls[-2:], [('write', 'k1', ['a', 'b'], [['x', '1']]), ('close',)])
+
+    def testSinkHours(self):
+        inner = _DedupTestSink()
+        sink = DedupSink(inner, 1024 * 1024)
+        sink.begin(Slot('20150101'))
+        self.assertEquals(sink.write('k1', Slot('2015010100'), _dedup_rows('x\t1\n')), 1)
+        self.assertEquals(sink.write('k2', Slot('2015010100'), _dedup_rows('x\t1\n')), 0)
+        # rows of the previous hour are forgotten when the hour changes
+        self.assertEquals(sink.write('k3', Slot('2015010101'), _dedup_rows('x\t1\ny\t2\n')), 2)
+        self.assertEquals(sink.write('k4', Slot('2015010101'), _dedup_rows('y\t2\n')), 0)
+        self.assertEquals(sink.write('k5', Slot('2015010100'), _dedup_rows('x\t1\n')), 1)
+        sink.commit()
+        self.assertEquals([c[0] for c in inner.calls], ['begin'] + ['write'] * 5 + ['commit'])
+
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
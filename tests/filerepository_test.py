@@ -0,0 +1,83 @@
+'''
+Created on 18/10/2026
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from bz2 import compress
+from timberslide.filerepository import FileRepository, FileKey
+from timberslide.s3repository import BZ2KeyIterator, BZ2RangeIterator, ParallelBZ2KeyIterator
+from timberslide.slots import Slot
+
+
+class FileRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.files = {'2014/11/30/05/a.bz2': compress('h\na\n'), '2014/12/31/23/b.bz2': compress('h\nb\n'),
+                      '2015/02/03/11/f.bz2': compress('h\nf\n'), '2015/02/03/11/g.bz2': '',
+                      '2015/02/03/12/sub/h.bz2': compress('h\nh\n'), '2014/.keep': ''}
+        os.makedirs(os.path.join(self.root, '2016/01/01/00'))
+        for name, data in self.files.items():
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(data)
+        self.repo = FileRepository('file://' + self.root + '/')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def testInit(self):
+        self.assertEquals(FileRepository('file:///data/prefix').prefix, '/data/prefix/')
+        self.assertRaises(ValueError, FileRepository, 's3://bucket/prefix')
+        self.assertRaises(ValueError, FileRepository, 'file://relative/prefix')
+
+    def testMinMaxSlot(self):
+        self.assertEquals(self.repo.get_min_slot(), Slot('2014113005'))
+        self.assertEquals(self.repo.get_max_slot(), Slot('2015020312'))
+        empty = tempfile.mkdtemp()
+        try:
+            self.assertRaises(Exception, FileRepository('file://' + empty).get_min_slot)
+        finally:
+            os.rmdir(empty)
+
+    def testSlotKeys(self):
+        keys = self.repo.get_slot_keys([Slot('2014'), Slot('20150203')])
+        names = sorted([k.name[len(self.repo.prefix):] for k in keys])
+        self.assertEquals(names, ['2014/.keep', '2014/11/30/05/a.bz2', '2014/12/31/23/b.bz2', '2015/02/03/11/f.bz2',
+                                  '2015/02/03/11/g.bz2', '2015/02/03/12/sub/h.bz2'])
+        self.assertEquals(len(self.repo.get_slot_keys(Slot('2016'))), 0)
+        key = self.repo.get_prefix_key(self.repo.prefix + '2014/11/30/05/a.bz2')
+        self.assertEquals(key.size, len(self.files['2014/11/30/05/a.bz2']))
+        self.assertEquals(self.repo.get_key_slot(key.name), Slot('2014113005'))
+        self.assertEquals(self.repo.get_key_slot(self.repo.prefix + '2014/.keep'), None)
+
+    def testETag(self):
+        path = os.path.join(self.root, '2014/11/30/05/a.bz2')
+        etag = FileKey(path).etag
+        self.assertEquals(FileKey(path).etag, etag)
+        os.utime(path, (0, 1000))
+        self.assertNotEqual(FileKey(path).etag, etag)
+
+    def testRead(self):
+        text = ''.join(['line {0}\n'.format(i) for i in range(20000)])
+        data = compress(text[0:len(text) // 2]) + compress(text[len(text) // 2:])
+        path = os.path.join(self.root, '2015/02/03/11/big.bz2')
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.assertEquals(''.join(BZ2KeyIterator(FileKey(path), 1000)), text)
+        self.assertEquals(''.join(ParallelBZ2KeyIterator(FileKey(path), workers=2, bufsize=1000)), text)
+        lines = []
+        for start, end in [(0, 1000), (1000, len(data))]:
+            lines.extend(list(BZ2RangeIterator(FileKey(path), start, end, 100))[1 if start > 0 else 0:])
+        self.assertEquals(''.join(lines), text)
+        self.assertEquals(self.repo.get_range(FileKey(path), 3, 9), data[3:10])
+        key = FileKey(os.path.join(self.root, '2015/02/03/11/g.bz2'))
+        self.assertEquals(key.read(100), '')
+
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
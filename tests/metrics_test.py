@@ -0,0 +1,71 @@
+'''
+Created on 18/10/2026
+'''
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from timberslide.metrics import MeteredReader, MeteredSource, MetricsAggregator, fields
+from timberslide.s3repository import BZ2KeyIterator
+from bz2 import compress
+
+
+class _MetricsTestKey(object):
+    def __init__(self, data):
+        self.data = data
+        self.name = 'test'
+
+    def read(self, size):
+        retval = self.data[0:size]
+        self.data = self.data[size:]
+        return retval
+
+
+class MetricsTest(unittest.TestCase):
+    def testMetered(self):
+        text = "".join(["line {0}\n".format(i) for i in range(1000)])
+        data = compress(text)
+        reader = MeteredReader(_MetricsTestKey(data))
+        self.assertEquals(reader.name, 'test')
+        source = MeteredSource(BZ2KeyIterator(reader, 100), reader)
+        lines = []
+        try:
+            while True:
+                lines.extend(source.nextbatch())
+        except StopIteration:
+            pass
+        self.assertEquals(lines, text.splitlines(True))
+        self.assertEquals(reader.bytes, len(data))
+        self.assertEquals(source.bytes, len(text))
+        self.assertTrue(reader.seconds >= 0 and source.seconds >= 0)
+
+    def testAggregator(self):
+        path = tempfile.mkdtemp()
+        try:
+            metrics = MetricsAggregator(os.path.join(path, 'metrics.json'), os.path.join(path, 'metrics.prom'))
+            record = dict([(f, 1) for f in fields])
+            metrics.add(dict(record, worker='Worker0', key='a'))
+            metrics.add(dict(record, worker='Worker0', key='b', parse_seconds=0.5))
+            metrics.add(dict(record, worker='Worker1', key='c'))
+            metrics.close()
+
+            lines = [json.loads(line) for line in open(os.path.join(path, 'metrics.json'))]
+            self.assertEquals([line['type'] for line in lines], ['key', 'key', 'key', 'totals'])
+            self.assertEquals(lines[1]['key'], 'b')
+            self.assertEquals(lines[3]['workers']['Worker0']['keys'], 2)
+            self.assertEquals(lines[3]['workers']['Worker0']['parse_seconds'], 1.5)
+
+            prom = open(os.path.join(path, 'metrics.prom')).read().splitlines()
+            self.assertTrue('# TYPE timberslide_rows_written_total counter' in prom)
+            self.assertTrue('timberslide_keys_total{worker="Worker0"} 2' in prom)
+            self.assertTrue('timberslide_parse_seconds_total{worker="Worker0"} 1.5' in prom)
+            self.assertTrue('timberslide_rows_parsed_total{worker="Worker1"} 1' in prom)
+            self.assertFalse(os.path.exists(os.path.join(path, 'metrics.prom.tmp')))
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,102 @@
+'''
+Created on 18/10/2026
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from timberslide.parse import TSVIterator
+from timberslide.slots import Slot
+# pyarrow is an optional dependency
+try:
+    import pyarrow.parquet as pq
+    from timberslide.parquet import ParquetSink
+except ImportError:
+    ParquetSink = None
+# Python 3 shim
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+_query = '''CREATE TABLE t (
+    yyyymmddhh varchar(10),
+    n integer,
+    b bigint,
+    r real,
+    f boolean,
+    ip inet
+);'''
+
+
+class _ParquetTestKey(object):
+    def __init__(self, name):
+        self.name = name
+
+
+def _parquet_rows(text):
+    return TSVIterator(StringIO(text), {}, set(['', 'NA']))
+
+
+@unittest.skipIf(ParquetSink is None, 'pyarrow is not installed')
+class ParquetTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sink = ParquetSink(self.directory, _query, rowgroup=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _read(self, name):
+        return pq.read_table(os.path.join(self.directory, name)).to_pydict()
+
+    def _files(self):
+        return sorted([os.path.relpath(os.path.join(path, f), self.directory)
+                       for path, dirs, files in os.walk(self.directory) for f in files])
+
+    def testWrite(self):
+        text = 'yyyymmddhh\tn\tb\tr\tf\n2015123123\t1\t4294967296\t0.5\tTRUE\n2015123123\tNA\t2\t\tfalse\nx\t3\t3\t1\tt\n'
+        count = self.sink.write(_ParquetTestKey('p/2015/12/31/23/a.bz2'), Slot('2015123123'), _parquet_rows(text))
+        self.assertEquals(count, 3)
+        # not visible until committed
+        self.assertEquals(len([f for f in self._files() if '.tmp-' not in f]), 0)
+        self.sink.write(_ParquetTestKey('p/2015/12/31/23/a.bz2'), Slot('2015123123'), _parquet_rows('N\n'), 100)
+        self.sink.write(_ParquetTestKey('p/b.bz2'), None, _parquet_rows('n\n7\n'))
+        self.sink.commit()
+        self.assertEquals(self._files(), ['2015/12/31/23/a.bz2.100.parquet', '2015/12/31/23/a.bz2.parquet',
+                                          'b.bz2.parquet'])
+        table = self._read('2015/12/31/23/a.bz2.parquet')
+        self.assertEquals(table['yyyymmddhh'], ['2015123123', '2015123123', 'x'])
+        self.assertEquals(table['n'], [1, None, 3])
+        self.assertEquals(table['b'], [4294967296, 2, 3])
+        self.assertEquals(table['r'], [0.5, None, 1.0])
+        self.assertEquals(table['f'], [True, False, True])
+        self.assertEquals(table['ip'], [None, None, None])
+        self.assertEquals(self._read('b.bz2.parquet')['n'], [7])
+        self.assertRaises(ValueError, self.sink.write, _ParquetTestKey('p/c.bz2'), None, _parquet_rows('n\tz\n1\t2\n'))
+        self.sink.close()
+        self.assertEquals(len(self._files()), 3)
+
+    def testSlot(self):
+        slot = Slot('2015123123')
+        self.sink.begin(slot)
+        self.sink.write(_ParquetTestKey('p/2015/12/31/23/a.bz2'), slot, _parquet_rows('n\n1\n2\n3\n'))
+        self.sink.write(_ParquetTestKey('p/2015/12/31/23/b.bz2'), slot, _parquet_rows('n\n4\n'))
+        self.sink.commit()
+        self.assertEquals(self._files(), ['2015/12/31/23/2015123123.parquet'])
+        self.assertEquals(self._read('2015/12/31/23/2015123123.parquet')['n'], [1, 2, 3, 4])
+        # replaced on commit, and left alone on abort
+        self.sink.begin(slot)
+        self.sink.write(_ParquetTestKey('p/2015/12/31/23/a.bz2'), slot, _parquet_rows('n\n5\n'))
+        self.sink.abort()
+        self.assertEquals(self._read('2015/12/31/23/2015123123.parquet')['n'], [1, 2, 3, 4])
+        self.sink.begin(slot)
+        self.sink.write(_ParquetTestKey('p/2015/12/31/23/a.bz2'), slot, _parquet_rows('n\n5\n'))
+        self.sink.commit()
+        self.assertEquals(self._read('2015/12/31/23/2015123123.parquet')['n'], [5])
+        self.assertEquals(self._files(), ['2015/12/31/23/2015123123.parquet'])
+
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
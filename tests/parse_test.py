@@ -4,7 +4,8 @@ Created on 31/12/2014
 @author: asieira
 '''
 import unittest
-from timberslide.parse import TSVIterator
+import logging
+from timberslide.parse import TSVIterator, row_converter
 # Python 3 shim
 try:
     from StringIO import StringIO
@@ -24,6 +25,40 @@ class ParseTest(unittest.TestCase):
         with self.assertRaises(StopIteration):
             tsv.next()
 
+    def testRowConverter(self):
+        convert = row_converter([None, int, None, float], set(["", "NA"]))
+        row = ["a", "1", "NA", ""]
+        self.assertEquals(convert(row), ["a", 1, None, None])
+        self.assertEquals(row, ["a", "1", "NA", ""])
+        self.assertEquals(row_converter([None, None])(["NA", "b"]), [None, "b"])
+
+    def testParseError(self):
+        text = 'a\tb\n1\t2\n\n1\tx\n'
+        tsv = TSVIterator(StringIO(text), {'b': int})
+        self.assertEquals(tsv.next(), ['1', 2])
+        messages = []
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                messages.append(record.getMessage())
+        handler = Handler()
+        logging.getLogger().addHandler(handler)
+        try:
+            with self.assertRaises(ValueError):
+                tsv.next()
+        finally:
+            logging.getLogger().removeHandler(handler)
+        self.assertEquals(messages, ['Error in row 3 processing column b with value x'])
+
+    def testParseBatch(self):
+        text = 'a\tb\n' + ''.join(['{0}\tNA\n\n'.format(i) for i in range(10)])
+        tsv = TSVIterator(StringIO(text), {'a': int})
+        self.assertEquals(tsv.nextbatch(4), [[i, None] for i in range(4)])
+        self.assertEquals(tsv.next(), [4, None])
+        self.assertEquals(tsv.nextbatch(10), [[i, None] for i in range(5, 10)])
+        with self.assertRaises(StopIteration):
+            tsv.nextbatch(10)
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
@@ -0,0 +1,102 @@
+'''
+Created on 18/10/2026
+'''
+import unittest
+from timberslide.pipeline import Pipeline
+from time import sleep
+
+
+# Source of line batches for a task, like BZ2KeyIterator.nextbatch().
+class _PipelineTestSource(object):
+    def __init__(self, lines, size, delay=0):
+        self.lines = lines
+        self.size = size
+        self.delay = delay
+
+    def nextbatch(self):
+        if len(self.lines) == 0:
+            raise StopIteration
+        sleep(self.delay)
+        retval = self.lines[0:self.size]
+        self.lines = self.lines[self.size:]
+        return retval
+
+
+def _pipeline_lines(task):
+    return ["a\tb\n"] + ["{0}\t{1}\n".format(task, i) for i in range(task * 100)]
+
+
+class PipelineTest(unittest.TestCase):
+    def testRun(self):
+        written = []
+
+        def write(task, rows):
+            self.assertEquals(rows.colnames, ['a', 'b'])
+            written.append((task, list(rows)))
+            self.assertEquals(rows.parsed, task * 100)
+            self.assertTrue(rows.parse_seconds >= 0)
+
+        p = Pipeline(iter(range(1, 8)), lambda t: _PipelineTestSource(_pipeline_lines(t), 7), write,
+                     depth=2, batchsize=10)
+        p.run()
+        self.assertEquals([t for t, rows in written], range(1, 8))
+        for task, rows in written:
+            self.assertEquals(rows, [[str(task), str(i)] for i in range(task * 100)])
+        stats = p.stats()
+        self.assertEquals(stats['tasks'], 7)
+        self.assertTrue(stats['lines_maxdepth'] <= 2 and stats['rows_maxdepth'] <= 2)
+        for stage in ['read', 'parse', 'write']:
+            self.assertTrue(stats[stage + '_busy'] >= 0)
+
+    def testPrefetch(self):
+        events = []
+
+        def open(task):
+            events.append(('open', task))
+            return _PipelineTestSource(_pipeline_lines(task), 50)
+
+        def write(task, rows):
+            list(rows)
+            sleep(0.2)
+            events.append(('commit', task))
+
+        Pipeline(iter([1, 2]), open, write).run()
+        self.assertTrue(events.index(('open', 2)) < events.index(('commit', 1)))
+
+    def testReadBusy(self):
+        # like InserterProcess._tasks, which blocks on the queue of units
+        def tasks():
+            for t in [1, 2]:
+                sleep(0.3)
+                yield t
+
+        p = Pipeline(tasks(), lambda t: _PipelineTestSource(_pipeline_lines(t), 50), lambda task, rows: list(rows))
+        p.run()
+        self.assertTrue(p.stats()['read_busy'] < 0.3)
+
+    def testError(self):
+        def write(task, rows):
+            list(rows)
+            if task == 2:
+                raise ValueError("write failed")
+
+        p = Pipeline(iter(range(1, 50)), lambda t: _PipelineTestSource(_pipeline_lines(1), 10, 0.001), write,
+                     depth=1)
+        with self.assertRaises(ValueError):
+            p.run()
+        self.assertTrue(p.stats()['tasks'] == 1)
+        self.assertEquals(list(p.pending), range(3, 3 + len(p.pending)))
+
+        def open(task):
+            if task == 3:
+                raise IOError("read failed")
+            return _PipelineTestSource(_pipeline_lines(task), 10)
+
+        p = Pipeline(iter(range(1, 10)), open, lambda task, rows: list(rows))
+        with self.assertRaises(IOError):
+            p.run()
+
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,178 @@
+'''
+Created on 18/10/2026
+'''
+import unittest
+from argparse import ArgumentTypeError
+from timberslide.rollup import Rollup, parse_rollup, aggregator, RollupSink
+from timberslide.parse import TSVIterator
+from timberslide.slots import Slot
+# Python 3 shim
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+# Connection whose cursors record the statements a Rollup executes, with mogrify() quoting
+# parameters like psycopg2 closely enough to check the upserts
+class _RollupTestCursor(object):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+
+    def mogrify(self, sql, params):
+        return sql % tuple([repr(p) for p in params])
+
+    def close(self):
+        pass
+
+
+class _RollupTestConnection(object):
+    def __init__(self, server_version=120000):
+        self.executed = []
+        self.server_version = server_version
+
+    def cursor(self):
+        return _RollupTestCursor(self)
+
+
+# Stand-in for the sink a RollupSink writes to, which reads all rows it is given
+class _RollupTestSink(object):
+    def __init__(self):
+        self.calls = []
+
+    def begin(self, slot):
+        self.calls.append(('begin', slot))
+
+    def write(self, key, slot, rows, first=None):
+        self.calls.append(('write', key, len(list(rows))))
+        return len(self.calls)
+
+    def commit(self):
+        self.calls.append(('commit',))
+
+    def abort(self):
+        self.calls.append(('abort',))
+
+    def close(self):
+        self.calls.append(('close',))
+
+
+_text = ('yyyymmddhh\tnet.src.ip.mmgeo_country\tnet.blocked\tagg.count\tnet.dst.port\n'
+         '2015123123\tUS\tTRUE\t2\t80\n'
+         '2015123123\tUS\tTRUE\t3\t443\n'
+         '2015123123\tNA\tTRUE\tNA\t22\n'
+         '2015123122\tUS\tTRUE\t1\tNA\n')
+
+
+def _rollup_rows():
+    return TSVIterator(StringIO(_text))
+
+
+class RollupTest(unittest.TestCase):
+    def testInit(self):
+        rollup = Rollup('hourly', ['net_src_ip_mmgeo_country', 'yyyymmddhh', 'NET_BLOCKED'])
+        self.assertEquals(rollup.dimensions, ['yyyymmddhh', 'net_src_ip_mmgeo_country', 'net_blocked'])
+        self.assertEquals(rollup.columns, [('yyyymmddhh', 'varchar'), ('net_src_ip_mmgeo_country', 'varchar'),
+                                           ('net_blocked', 'boolean'), ('sum_agg_count', 'bigint')])
+        rollup = Rollup('hourly', [], ['count', 'max(net_dst_port)', 'sum(net_dst_ip_asnumber)'])
+        self.assertEquals(rollup.columns, [('yyyymmddhh', 'varchar'), ('row_count', 'bigint'),
+                                           ('max_net_dst_port', 'integer'), ('sum_net_dst_ip_asnumber', 'numeric')])
+        self.assertRaises(ValueError, Rollup, 'hourly', ['nonexistent'])
+        self.assertRaises(ValueError, Rollup, 'hourly', ['net_blocked', 'net_blocked'])
+        self.assertRaises(ValueError, Rollup, 'hourly', [], ['sum(net_src_ip)'])
+        self.assertRaises(ValueError, Rollup, 'hourly', [], ['avg(agg_count)'])
+        self.assertRaises(ValueError, Rollup, 'hourly', [], ['count', 'count'])
+        self.assertRaises(ValueError, Rollup, 'hourly', [], [])
+
+    def testParse(self):
+        rollup = parse_rollup('hourly:net_blocked')
+        self.assertEquals((rollup.table, rollup.dimensions), ('hourly', ['yyyymmddhh', 'net_blocked']))
+        self.assertEquals([m[2] for m in rollup.measures], ['sum_agg_count'])
+        rollup = parse_rollup('hourly::count,min(agg_count)')
+        self.assertEquals([c for c, t in rollup.columns], ['yyyymmddhh', 'row_count', 'min_agg_count'])
+        self.assertRaises(ArgumentTypeError, parse_rollup, 'hourly')
+        self.assertRaises(ArgumentTypeError, parse_rollup, 'hourly:a:b:c')
+        self.assertRaises(ArgumentTypeError, parse_rollup, 'hourly:nonexistent')
+        self.assertRaises(ArgumentTypeError, parse_rollup, 'bad-name:net_blocked')
+
+    def testAggregator(self):
+        rollups = [Rollup('a', ['net_src_ip_mmgeo_country']),
+                   Rollup('b', ['net_dst_ip_mmgeo_country'], ['count', 'sum(agg_count)', 'min(net_dst_port)',
+                                                              'max(net_dst_port)', 'max(net_src_port)'])]
+        groups = [{}, {}]
+        rows = _rollup_rows()
+        update = aggregator(rollups, rows.colnames, groups)
+        for row in rows:
+            update(row)
+        self.assertEquals(groups[0], {('2015123123', 'US'): [5], ('2015123123', None): [None],
+                                      ('2015123122', 'US'): [1]})
+        # the missing column is a NULL dimension or measure
+        self.assertEquals(groups[1], {('2015123123', None): [3, 5, 22, 443, None],
+                                      ('2015123122', None): [1, 1, None, None, None]})
+        # string values are converted to the type of the column
+        groups = [{}]
+        update = aggregator([Rollup('a', [], ['sum(net_dst_port)'])], ['yyyymmddhh', 'net.dst.port'], groups)
+        update(['2015123123', '80'])
+        update(['2015123123', '443'])
+        self.assertEquals(groups[0], {('2015123123',): [523]})
+
+    def testCreate(self):
+        rollup = Rollup('hourly', ['net_blocked'], ['count'])
+        conn = _RollupTestConnection()
+        rollup.create(conn)
+        self.assertEquals([sql for sql, params in conn.executed], [
+            'CREATE TABLE IF NOT EXISTS hourly (yyyymmddhh varchar, net_blocked boolean, row_count bigint);',
+            'CREATE UNIQUE INDEX IF NOT EXISTS hourly_dims_key ON hourly (yyyymmddhh, net_blocked);'])
+        conn = _RollupTestConnection(150000)
+        rollup.create(conn)
+        self.assertTrue(conn.executed[1][0].endswith(' NULLS NOT DISTINCT;'))
+
+    def testUpsert(self):
+        rollup = Rollup('hourly', ['net_blocked'], ['count', 'sum(agg_count)', 'min(agg_count)'])
+        conn = _RollupTestConnection()
+        groups = {('2015123123', True): [2, 5, 1], ('2015123122', None): [1, None, None],
+                  ('2015123123', False): [1, 4, 4]}
+        self.assertEquals(rollup.upsert(conn, groups, 2), 3)
+        self.assertEquals(conn.executed, [
+            ("INSERT INTO hourly AS r (yyyymmddhh, net_blocked, row_count, sum_agg_count, min_agg_count) VALUES "
+             "('2015123122', None, 1, None, None),('2015123123', False, 1, 4, 4) "
+             "ON CONFLICT (yyyymmddhh, net_blocked) DO UPDATE SET row_count = r.row_count + EXCLUDED.row_count, "
+             "sum_agg_count = COALESCE(r.sum_agg_count + EXCLUDED.sum_agg_count, r.sum_agg_count, "
+             "EXCLUDED.sum_agg_count), min_agg_count = LEAST(r.min_agg_count, EXCLUDED.min_agg_count);", None),
+            ("INSERT INTO hourly AS r (yyyymmddhh, net_blocked, row_count, sum_agg_count, min_agg_count) VALUES "
+             "('2015123123', True, 2, 5, 1) "
+             "ON CONFLICT (yyyymmddhh, net_blocked) DO UPDATE SET row_count = r.row_count + EXCLUDED.row_count, "
+             "sum_agg_count = COALESCE(r.sum_agg_count + EXCLUDED.sum_agg_count, r.sum_agg_count, "
+             "EXCLUDED.sum_agg_count), min_agg_count = LEAST(r.min_agg_count, EXCLUDED.min_agg_count);", None)])
+        conn = _RollupTestConnection()
+        self.assertEquals(rollup.upsert(conn, {}), 0)
+        self.assertEquals(conn.executed, [])
+
+    def testSink(self):
+        conn = _RollupTestConnection()
+        inner = _RollupTestSink()
+        sink = RollupSink(inner, conn, [Rollup('hourly', [], ['count'])])
+        sink.begin(Slot('20151231'))
+        self.assertEquals(sink.write('a', Slot('2015123123'), _rollup_rows()), 2)
+        self.assertEquals(sink.write('b', Slot('2015123123'), _rollup_rows()), 3)
+        sink.commit()
+        self.assertEquals(inner.calls, [('begin', Slot('20151231')), ('write', 'a', 4), ('write', 'b', 4),
+                                        ('commit',)])
+        self.assertEquals(conn.executed[0], ('DELETE FROM hourly WHERE yyyymmddhh >= %s AND yyyymmddhh < %s;',
+                                             ('20151231', '20160101')))
+        self.assertTrue("('2015123122', 2),('2015123123', 6)" in conn.executed[1][0])
+        # nothing is upserted after an abort
+        sink.write('c', None, _rollup_rows())
+        sink.abort()
+        sink.commit()
+        sink.close()
+        self.assertEquals(len(conn.executed), 2)
+        self.assertEquals(inner.calls[-3:], [('abort',), ('commit',), ('close',)])
+
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
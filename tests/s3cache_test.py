@@ -0,0 +1,126 @@
+'''
+Created on 18/10/2026
+'''
+import os
+import shutil
+import tempfile
+import unittest
+from timberslide.s3cache import S3Cache
+
+
+# Stand-in for a boto S3 Key that returns its data in reads of a fixed size
+class _S3CacheKey(object):
+    def __init__(self, name, data, etag='"e"'):
+        self.name = name
+        self.data = data
+        self.size = len(data)
+        self.etag = etag
+        self.pos = 0
+        self.closed = False
+
+    def read(self, size):
+        retval = self.data[self.pos:self.pos+size]
+        self.pos = self.pos + len(retval)
+        return retval
+
+    def close(self, fast=False):
+        self.closed = True
+
+
+def _readall(reader):
+    retval = []
+    while True:
+        data = reader.read(3)
+        if not data:
+            return ''.join(retval)
+        retval.append(str(data))
+
+
+class S3CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'cache')
+        self.cache = S3Cache(self.path, 25)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def _fill(self, key, mtime=None):
+        self.assertEquals(_readall(self.cache.fill(key, key)), key.data)
+        if mtime is not None:
+            os.utime(self.cache._entry(key.name, key.etag), (mtime, mtime))
+
+    def testFill(self):
+        key = _S3CacheKey('prefix/2015/01/01/00/a.bz2', 'abcdefghij')
+        self.assertEquals(self.cache.get(key), None)
+        reader = self.cache.fill(key, key)
+        self.assertEquals(reader.size, 10)
+        reader.read(9)
+        # not visible until the end was read
+        self.assertEquals(self.cache.get(_S3CacheKey(key.name, key.data)), None)
+        self.assertEquals(len(os.listdir(self.path)), 1)
+        reader.read(9)
+        reader.read(9)
+        cached = self.cache.get(_S3CacheKey(key.name, key.data))
+        self.assertEquals((cached.name, cached.size, cached.etag), (key.name, 10, '"e"'))
+        self.assertEquals(_readall(cached), 'abcdefghij')
+        self.assertEquals((self.cache.hits, self.cache.misses), (1, 2))
+        self.assertEquals(os.listdir(self.path), [os.path.basename(cached.path)])
+        # other processes sharing the directory see the entry too
+        self.assertNotEqual(S3Cache(self.path, 25).get(key), None)
+        # the entry can be read again after it was closed and evicted by another process
+        os.remove(cached.path)
+        cached.close(fast=True)
+        cached.open_read({'Range': 'bytes=2-'})
+        self.assertEquals(_readall(cached), 'cdefghij')
+
+    def testIncomplete(self):
+        key = _S3CacheKey('a', 'abcdefghij')
+        reader = self.cache.fill(key, key)
+        reader.read(5)
+        reader.close()
+        self.assertTrue(key.closed)
+        self.assertEquals(os.listdir(self.path), [])
+        # fewer bytes than the key size
+        key = _S3CacheKey('a', 'abcdefghij')
+        key.size = 11
+        self._fill(key)
+        self.assertEquals(os.listdir(self.path), [])
+        # no ETag to check the cached copy against
+        self._fill(_S3CacheKey('b', 'abc', None))
+        self.assertEquals(os.listdir(self.path), [])
+        self.assertEquals(self.cache.get(_S3CacheKey('b', 'abc', None)), None)
+
+    def testChanged(self):
+        self._fill(_S3CacheKey('a', 'old'))
+        self._fill(_S3CacheKey('b', 'other'))
+        key = _S3CacheKey('a', 'new', '"f"')
+        self.assertEquals(self.cache.get(key), None)
+        self._fill(key)
+        self.assertEquals(_readall(self.cache.get(key)), 'new')
+        self.assertEquals(self.cache.get(_S3CacheKey('a', 'old')), None)
+        self.assertEquals(len(os.listdir(self.path)), 2)
+
+    def testEvict(self):
+        a = _S3CacheKey('a', '0123456789')
+        b = _S3CacheKey('b', '0123456789')
+        self._fill(a, 1000)
+        self._fill(b, 2000)
+        self.assertNotEqual(self.cache.get(a), None)
+        self._fill(_S3CacheKey('c', '0123456789'))
+        self.assertEquals(self.cache.get(b), None)
+        self.assertNotEqual(self.cache.get(a), None)
+        self.assertNotEqual(self.cache.get(_S3CacheKey('c', '0123456789')), None)
+        # a file larger than the cache is kept until the next fill
+        self._fill(_S3CacheKey('d', 'x' * 30))
+        self.assertEquals(len(os.listdir(self.path)), 1)
+        # abandoned temporary files are removed
+        stale = os.path.join(self.path, '.fill-stale')
+        open(stale, 'w').close()
+        os.utime(stale, (1000, 1000))
+        self.cache.evict()
+        self.assertFalse(os.path.exists(stale))
+
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
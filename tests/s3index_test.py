@@ -0,0 +1,68 @@
+'''
+Created on 18/10/2026
+'''
+import unittest
+from timberslide.s3repository import S3Repository
+from timberslide.slots import Slot
+
+
+class _S3IndexTestKey(object):
+    def __init__(self, name, size=1, etag='"x"'):
+        self.name = name
+        self.size = size
+        self.etag = etag
+
+
+# Stand-in for a boto bucket that records the listings made
+class _S3IndexTestBucket(object):
+    def __init__(self, names):
+        self.keys = [_S3IndexTestKey(n) for n in names]
+        self.listings = []
+
+    def list(self, prefix='', delimiter='', marker=''):
+        self.listings.append((prefix, marker))
+        return [k for k in sorted(self.keys, key=lambda k: k.name) if k.name.startswith(prefix) and k.name > marker]
+
+
+class _S3IndexTestRepository(S3Repository):
+    def __init__(self, bucket):
+        S3Repository.__init__(self, "s3://bucket/prefix", index=':memory:')
+        self._bucket = bucket
+
+    def _open(self):
+        pass
+
+
+class S3IndexTest(unittest.TestCase):
+    def testIndex(self):
+        bucket = _S3IndexTestBucket(['prefix/2014/12/31/23/a.bz2', 'prefix/2015/01/01/00/b.bz2',
+                                     'prefix/2015/01/01/00/c.bz2', 'prefix/2015/01/02/05/d.bz2',
+                                     'prefix/README', 'other/2016/01/01/00/e.bz2'])
+        repo = _S3IndexTestRepository(bucket)
+        self.assertEquals(repo.get_min_slot(), Slot("2014123123"))
+        self.assertEquals(repo.get_max_slot(), Slot("2015010205"))
+        self.assertEquals(bucket.listings, [('prefix/', '')])
+        self.assertEquals(sorted([k.name for k in repo.get_slot_keys(Slot("2015"))]),
+                          ['prefix/2015/01/01/00/b.bz2', 'prefix/2015/01/01/00/c.bz2', 'prefix/2015/01/02/05/d.bz2'])
+        self.assertEquals(sorted([k.name for k in repo.get_slot_keys([Slot("2015010100"), Slot("2014")])]),
+                          ['prefix/2014/12/31/23/a.bz2', 'prefix/2015/01/01/00/b.bz2', 'prefix/2015/01/01/00/c.bz2'])
+        self.assertEquals(len(bucket.listings), 1)
+
+        # incremental refresh lists only from the latest indexed hour on
+        bucket.keys.append(_S3IndexTestKey('prefix/2015/01/02/05/f.bz2'))
+        bucket.keys.append(_S3IndexTestKey('prefix/2015/02/01/00/g.bz2'))
+        bucket.keys.append(_S3IndexTestKey('prefix/2014/12/31/23/h.bz2'))
+        repo.index.refresh()
+        self.assertEquals(bucket.listings[1], ('prefix/', 'prefix/2015/01/02/05'))
+        self.assertEquals(repo.index.get_max_slot(), Slot("2015020100"))
+        self.assertEquals(len(repo.get_slot_keys(Slot("2015010205"))), 2)
+        self.assertEquals(len(repo.get_slot_keys(Slot("2014"))), 1)
+
+        # invalidated slots are listed again
+        repo.index.invalidate(Slot("201412"))
+        self.assertEquals(len(repo.get_slot_keys(Slot("2014"))), 2)
+        self.assertEquals(bucket.listings[3], ('prefix/2014/12/', ''))
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
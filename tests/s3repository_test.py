@@ -3,11 +3,15 @@ Created on 30/12/2014
 
 @author: asieira
 '''
+import os
 import unittest
-from timberslide.s3repository import S3Repository, BZ2KeyIterator
+from timberslide.s3repository import S3Repository, BZ2KeyIterator, ParallelBZ2KeyIterator, \
+    BZ2RangeIterator, RangedKeyReader
 from timberslide.slots import Slot
-from bz2 import BZ2Compressor
+from bz2 import BZ2Compressor, compress
 from random import randrange
+from threading import current_thread, Lock
+from time import sleep
 
 
 # Streaming compression class that simulates the 'read' behavior of an S3 key that we use
@@ -37,6 +41,132 @@ class _S3RepositoryTestKey(object):
             return retval
 
 
+# Key that returns already compressed data in reads of random size, and an empty string at
+# the end like boto does.
+class _S3RepositoryChunkKey(object):
+    def __init__(self, data):
+        self.data = data
+        self.name = 'test'
+
+    def read(self, size):
+        numbytes = randrange(1, size + 1)
+        retval = self.data[0:numbytes]
+        self.data = self.data[numbytes:len(self.data)]
+        return retval
+
+
+# Key that also supports the ranged reads used by BZ2RangeIterator.
+class _S3RepositoryRangeKey(_S3RepositoryChunkKey):
+    def __init__(self, data):
+        super(_S3RepositoryRangeKey, self).__init__('')
+        self.all = data
+        self.opened = 0
+
+    def open_read(self, headers=None):
+        self.opened = self.opened + 1
+        self.data = self.all[int(headers['Range'][6:-1]):]
+
+    def close(self, fast=False):
+        self.data = ''
+
+
+class _S3RepositoryNamedKey(object):
+    def __init__(self, name):
+        self.name = name
+
+
+# Fetches ranges of a key that has its contents in the 'data' attribute for RangedKeyReader,
+# with random latency, failing the first attempt (or all if 'always') at each range starting
+# at an offset in 'failures', and counting the concurrent fetches. Ranges starting at a
+# multiple of 2000 fail by returning fewer bytes, others by raising an IOError.
+class _S3RepositoryRangeFetch(object):
+    def __init__(self, failures=(), always=False):
+        self.failures = set(failures)
+        self.always = always
+        self.lock = Lock()
+        self.active = 0
+        self.maxactive = 0
+        self.calls = 0
+
+    def __call__(self, key, start, end):
+        with self.lock:
+            self.active = self.active + 1
+            self.maxactive = max(self.maxactive, self.active)
+            self.calls = self.calls + 1
+            fail = start in self.failures
+            if not self.always:
+                self.failures.discard(start)
+        try:
+            sleep(randrange(0, 5) / 1000.0)
+            if fail and start % 2000 == 0:
+                return key.data[start:end]
+            elif fail:
+                raise IOError("connection reset")
+            return key.data[start:end+1]
+        finally:
+            with self.lock:
+                self.active = self.active - 1
+
+
+class _S3RepositoryBucket(object):
+    def __init__(self):
+        self.headers = None
+
+    def get_key(self, name, validate=True):
+        return self
+
+    def get_contents_as_string(self, headers=None):
+        self.headers = headers
+        return 'data'
+
+
+# Repository whose threads list prefixes from a fake bucket, recording which threads did it
+class _S3RepositoryThreadedRepo(S3Repository):
+    def __init__(self, names, listthreads):
+        S3Repository.__init__(self, "s3://bucket/prefix", listthreads=listthreads)
+        self.names = names
+        self.threads = set()
+
+    def _thread_bucket(self):
+        self.threads.add(current_thread().ident)
+        return self
+
+    def list(self, prefix):
+        sleep(0.01)
+        return [_S3RepositoryNamedKey(n) for n in self.names if n.startswith(prefix)]
+
+
+# List of keys or prefixes returned by _S3RepositoryListingBucket
+class _S3RepositoryResultSet(list):
+    is_truncated = False
+    next_marker = None
+
+
+# Stand-in for a boto bucket that implements a single LIST request like S3 does
+class _S3RepositoryListingBucket(object):
+    def __init__(self, names):
+        self.names = sorted(names)
+
+    def get_all_keys(self, prefix='', delimiter='', marker='', max_keys=1000):
+        retval = _S3RepositoryResultSet()
+        for n in self.names:
+            if n.startswith(prefix) and n > marker:
+                if delimiter and delimiter in n[len(prefix):]:
+                    n = n[0:n.index(delimiter, len(prefix))+1]
+                    if len(retval) > 0 and retval[len(retval)-1].name == n:
+                        continue
+                if len(retval) == max_keys:
+                    retval.is_truncated = True
+                    break
+                retval.append(_S3RepositoryNamedKey(n))
+        return retval
+
+
+def _multistream(text, parts):
+    size = len(text) // parts + 1
+    return "".join([compress(text[i:i+size]) for i in range(0, len(text), size)])
+
+
 class S3RepositoryTest(unittest.TestCase):
     def testInit(self):
         repo = S3Repository("s3://bucket-name/prefix1/prefix2/")
@@ -50,6 +180,47 @@ class S3RepositoryTest(unittest.TestCase):
         self.assertEquals(repo.get_slot_prefix(Slot("20140102")), "prefix1/prefix2/2014/01/02/")
         self.assertEquals(repo.get_slot_prefix(Slot("2014010212")), "prefix1/prefix2/2014/01/02/12/")
 
+    def testKeySlot(self):
+        repo = S3Repository("s3://bucket-name/prefix/")
+        self.assertEquals(repo.get_key_slot("prefix/2015/02/03/11/f.bz2"), Slot("2015020311"))
+        self.assertEquals(repo.get_key_slot("prefix/2015/02/03/f.bz2"), None)
+        self.assertEquals(repo.get_key_slot("other/2015/02/03/11/f.bz2"), None)
+
+    def testEndpoint(self):
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'timberslide')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'timberslide')
+        conn = S3Repository("s3://bucket-name/prefix/", endpoint='localhost:5000')._connect()
+        self.assertEquals((conn.host, conn.port, conn.is_secure), ('localhost', 5000, False))
+        conn = S3Repository("s3://bucket-name/prefix/", endpoint='minio')._connect()
+        self.assertEquals((conn.host, conn.is_secure), ('minio', False))
+
+    def testMinMaxSlot(self):
+        repo = S3Repository("s3://bucket/prefix")
+        repo._open = lambda: None
+        repo._bucket = _S3RepositoryListingBucket(['prefix/2014/.keep', 'prefix/2014/11/30/05/a.bz2',
+                                                   'prefix/2014/12/31/23/b.bz2', 'prefix/2015/01/01/00/c.bz2',
+                                                   'prefix/2015/02/01/00/d.bz2', 'prefix/2015/02/03/01/e.bz2',
+                                                   'prefix/2015/02/03/11/f.bz2', 'prefix/2015/02/03/11/g.bz2'])
+        self.assertEquals(repo.get_max_slot(), Slot("2015020311"))
+        self.assertEquals(repo.get_min_slot(), Slot("2014113005"))
+        self.assertEquals(repo.requests, 5)
+        # leading keys that are not data are skipped a page at a time
+        repo = S3Repository("s3://bucket/prefix")
+        repo._open = lambda: None
+        repo._bucket = _S3RepositoryListingBucket(['prefix/2014/.keep{0:04d}'.format(i) for i in range(2500)] +
+                                                  ['prefix/2014/11/30/05/a.bz2'])
+        self.assertEquals(repo.get_min_slot(), Slot("2014113005"))
+        # 3 pages for the minimum, and 6 for the maximum since the months are listed in 3 pages
+        self.assertEquals(repo.requests, 9)
+
+    def testSlotKeysThreaded(self):
+        names = ['prefix/2015/01/0{0}/{1:02d}/file.bz2'.format(d, h) for d in range(1, 4) for h in range(24)]
+        repo = _S3RepositoryThreadedRepo(names, 4)
+        slots = [Slot("2015010{0}{1:02d}".format(d, h)) for d in range(1, 4) for h in range(24)]
+        keys = repo.get_slot_keys(slots + [Slot("20150101")])
+        self.assertEquals(sorted([k.name for k in keys]), sorted(names))
+        self.assertTrue(len(repo.threads) > 1)
+
     def testBZ2decomp(self):
         i = BZ2KeyIterator(_S3RepositoryTestKey("blahblahblah"), 4)
         self.assertEquals("blahblahblah", i.next())
@@ -61,6 +232,110 @@ class S3RepositoryTest(unittest.TestCase):
         with self.assertRaises(StopIteration):
             i.next()
 
+    def testBZ2lines(self):
+        text = "".join(["line {0}\t{1}\n".format(i, "x" * (i % 7)) for i in range(500)]) + "\n\nlast"
+        self.assertEquals(list(BZ2KeyIterator(_S3RepositoryTestKey(text), 16)), text.splitlines(True))
+        self.assertEquals(list(BZ2KeyIterator(_S3RepositoryTestKey(text + "\n"), 1024)),
+                          (text + "\n").splitlines(True))
+
+    def testBZ2batch(self):
+        text = "".join(["line {0}\n".format(i) for i in range(500)]) + "last"
+        i = BZ2KeyIterator(_S3RepositoryTestKey(text), 64)
+        self.assertEquals("line 0\n", i.next())
+        lines = []
+        try:
+            while True:
+                batch = i.nextbatch()
+                self.assertTrue(len(batch) > 0)
+                lines.extend(batch)
+        except StopIteration:
+            pass
+        self.assertEquals(lines, text.splitlines(True)[1:])
+        with self.assertRaises(StopIteration):
+            i.next()
+
+    def testBZ2multistream(self):
+        text = "".join(["line {0}\n".format(i) for i in range(5000)]) + "last"
+        data = _multistream(text, 7)
+        self.assertEquals(list(BZ2KeyIterator(_S3RepositoryChunkKey(data), 512)), text.splitlines(True))
+
+    def testParallelBZ2(self):
+        text = "".join(["line {0}\n".format(i) for i in range(5000)]) + "last"
+        for parts in [1, 2, 7, 50]:
+            i = ParallelBZ2KeyIterator(_S3RepositoryChunkKey(_multistream(text, parts)), workers=3,
+                                       bufsize=512, maxpending=2)
+            self.assertEquals(list(i), text.splitlines(True))
+
+        # single stream larger than maxstream falls back to sequential decompression
+        i = ParallelBZ2KeyIterator(_S3RepositoryChunkKey(_multistream(text, 1) + _multistream(text, 3)),
+                                   workers=2, bufsize=256, maxstream=1024)
+        self.assertEquals(list(i), (text + text).splitlines(True))
+
+        # data split where there is no actual stream boundary is merged back together
+        data = compress(text)
+        i = ParallelBZ2KeyIterator(_S3RepositoryChunkKey(''), workers=2)
+        i._submit(data[0:100])
+        i._submit(data[100:200])
+        i._submit(data[200:])
+        self.assertEquals(list(i), text.splitlines(True))
+
+    def testBZ2range(self):
+        text = "header\n" + "".join(["line {0}\n".format(i) for i in range(5000)]) + "last"
+        lines = text.splitlines(True)
+        for parts in [1, 3, 7, 50]:
+            data = _multistream(text, parts)
+            for splitsize in [len(data), 997, 4096, len(data) // 3 + 1]:
+                result = []
+                for start in range(0, len(data), splitsize):
+                    it = BZ2RangeIterator(_S3RepositoryRangeKey(data), start, min(start + splitsize, len(data)), 512)
+                    part = list(it)
+                    if start > 0:
+                        self.assertEquals(part[0], lines[0])
+                        part = part[1:]
+                    result.extend(part)
+                self.assertEquals(result, lines)
+
+        # streams that end exactly at a line break
+        data = "".join([compress("".join(lines[i:i+100])) for i in range(0, len(lines), 100)])
+        for splitsize in [500, 1500, 5000]:
+            result = []
+            for start in range(0, len(data), splitsize):
+                part = list(BZ2RangeIterator(_S3RepositoryRangeKey(data), start, start + splitsize, 256))
+                result.extend(part[1:] if start > 0 else part)
+            self.assertEquals(result, lines)
+
+    def testRangedRead(self):
+        text = "".join(["line {0}\n".format(i) for i in range(20000)])
+        key = _S3RepositoryNamedKey('test')
+        key.data = _multistream(text, 5)
+        key.size = len(key.data)
+        fetch = _S3RepositoryRangeFetch()
+        reader = RangedKeyReader(key, fetch, workers=4, rangesize=1000, maxpending=6, delay=0)
+        self.assertEquals(list(BZ2KeyIterator(reader, 777)), text.splitlines(True))
+        self.assertEquals(fetch.calls, (key.size + 999) // 1000)
+        self.assertTrue(1 < fetch.maxactive <= 4)
+        self.assertTrue(reader._pool is None)
+
+        # failed ranges are fetched again, and read in order with parallel decompression too
+        fetch = _S3RepositoryRangeFetch([0, 3000, 5000])
+        reader = RangedKeyReader(key, fetch, workers=3, rangesize=1000, delay=0)
+        self.assertEquals(list(ParallelBZ2KeyIterator(reader, workers=2, bufsize=512)), text.splitlines(True))
+        self.assertEquals(fetch.calls, (key.size + 999) // 1000 + 3)
+
+        # ranges that keep failing make the read fail
+        reader = RangedKeyReader(key, _S3RepositoryRangeFetch([2000], True), workers=2, rangesize=1000,
+                                 retries=2, delay=0)
+        with self.assertRaises(IOError):
+            list(BZ2KeyIterator(reader))
+
+    def testGetRange(self):
+        repo = S3Repository("s3://bucket/prefix")
+        repo._local.bucket = _S3RepositoryBucket()
+        key = _S3RepositoryNamedKey('prefix/2015/01/01/00/a.bz2')
+        key.etag = '"abc"'
+        self.assertEquals(repo.get_range(key, 10, 19), 'data')
+        self.assertEquals(repo._local.bucket.headers, {'Range': 'bytes=10-19', 'If-Match': '"abc"'})
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
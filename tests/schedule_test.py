@@ -0,0 +1,64 @@
+'''
+Created on 18/10/2026
+'''
+import unittest
+from timberslide.schedule import plan_tasks, plan_units, split_groups, makespan
+from timberslide.slots import Slot
+
+
+class _ScheduleTestKey(object):
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+
+class ScheduleTest(unittest.TestCase):
+    def testPlan(self):
+        keys = [_ScheduleTestKey('a', 10), _ScheduleTestKey('b', 1000), _ScheduleTestKey('c', 100)]
+        self.assertEquals(plan_tasks(keys), [('b', None, None, 1000), ('c', None, None, 100),
+                                             ('a', None, None, 10)])
+        self.assertEquals(plan_tasks(keys, 400), [('b', 0, 400, 400), ('b', 400, 800, 400),
+                                                  ('b', 800, 1000, 200), ('c', None, None, 100),
+                                                  ('a', None, None, 10)])
+
+    def testPlanUnits(self):
+        groups = {Slot('2015010100'): [_ScheduleTestKey('a', 10), _ScheduleTestKey('b', 1000)],
+                  Slot('20150102'): [_ScheduleTestKey('c', 600), _ScheduleTestKey('d', 600)],
+                  Slot('2015010300'): []}
+        self.assertEquals(plan_units(groups), [
+            (Slot('20150102'), [('c', None, None), ('d', None, None)], 1200),
+            (Slot('2015010100'), [('b', None, None), ('a', None, None)], 1010),
+            (Slot('2015010300'), [], 0)])
+        # keys outside any slot are grouped under None
+        self.assertEquals(plan_units({None: [_ScheduleTestKey('a', 5)], Slot('2015010100'): [_ScheduleTestKey('b', 5)]}), [
+            (Slot('2015010100'), [('b', None, None)], 5), (None, [('a', None, None)], 5)])
+
+    def testSplitGroups(self):
+        def slot_of(name):
+            return Slot(name[0:10])
+        a, b, c = _ScheduleTestKey('2015020300a', 1), _ScheduleTestKey('2015020300b', 1), _ScheduleTestKey('2015020305', 1)
+        groups = split_groups({Slot('2015'): [a, b, c], Slot('2016'): []}, slot_of)
+        self.assertEquals(groups[Slot('2015020300')], [a, b])
+        self.assertEquals(groups[Slot('2015020305')], [c])
+        # parts without keys are kept whole
+        self.assertEquals(sorted([s for s, ks in groups.items() if len(ks) == 0]),
+                          sorted([Slot('2015' + m) for m in ['01'] + ['{0:02d}'.format(i) for i in range(3, 13)]] +
+                                 [Slot('201502{0:02d}'.format(i)) for i in range(1, 29) if i != 3] +
+                                 [Slot('20150203{0:02d}'.format(i)) for i in range(24) if i not in (0, 5)] +
+                                 [Slot('2016')]))
+        # days, e.g. for tables partitioned by day
+        groups = split_groups({Slot('2015'): [a, b, c]}, slot_of, 8)
+        self.assertEquals(groups[Slot('20150203')], [a, b, c])
+        self.assertEquals(max([len(s) for s in groups]), 8)
+        self.assertEquals(split_groups({Slot('2015020300'): [a]}, slot_of), {Slot('2015020300'): [a]})
+
+    def testMakespan(self):
+        self.assertEquals(makespan([7, 5, 4, 3, 3, 2], 2), 12)
+        self.assertEquals(makespan([7, 5, 4, 3, 3, 2], 3), 9)
+        self.assertEquals(makespan([10], 4), 10)
+        self.assertEquals(makespan([], 2), 0)
+
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -6,7 +6,9 @@ Created on 30/12/2014
 import unittest
 from timberslide.slots import Slot
 from timberslide.s3repository import S3Repository
-from timberslide.slots import parseSlotRange
+from timberslide.slots import parseSlotRange, mergeSlotSets, SlotSet
+from random import Random
+import pickle
 
 
 class DummyS3Repository(S3Repository):
@@ -50,6 +52,18 @@ class SlotTest(unittest.TestCase):
         self.assertEquals(slot.day(), 30)
         self.assertEquals(slot.hour(), 10)
 
+    def testSlotValidation(self):
+        for slot in ["201", "2014a", "0000", "201413", "20140230", "2014022924", u"2014", 2014]:
+            with self.assertRaises(ValueError):
+                Slot(slot)
+        self.assertEquals(Slot("20160229").day(), 29)
+
+    def testSlotInterned(self):
+        self.assertIs(Slot("2014123010"), Slot("2014123010"))
+        self.assertIs(Slot("2014123010").parent(), Slot("20141230"))
+        self.assertIs(Slot("20141230") + 1, Slot("20141231"))
+        self.assertIs(pickle.loads(pickle.dumps(Slot("201412"), 2)), Slot("201412"))
+
     def testSlotParent(self):
         self.assertIsNone(Slot("2014").parent())
         self.assertEquals(Slot("201412").parent(), Slot("2014"))
@@ -95,6 +109,9 @@ class SlotTest(unittest.TestCase):
         self.assertEquals(Slot("2014120100") + 1, Slot("2014120101"))
         self.assertEquals(Slot("2014120100") - 1, Slot("2014113023"))
         self.assertEquals(Slot("2014123123") + 1, Slot("2015010100"))
+        self.assertEquals(Slot("201401") - 25, Slot("201112"))
+        self.assertEquals(Slot("2015022823") + 2, Slot("2015030101"))
+        self.assertEquals(Slot("2015010100") - 24 * 365, Slot("2014010100"))
 
     def testRangeTo(self):
         # basic tests
@@ -160,6 +177,57 @@ class SlotTest(unittest.TestCase):
                           Slot("2100123122").rangeto(repo.get_max_slot()))
         self.assertEquals(parseSlotRange(":", repo), repo.get_min_slot().rangeto(repo.get_max_slot()))
 
+    def testSlotHours(self):
+        self.assertEquals(Slot("1970010100").hours(), (0, 1))
+        self.assertEquals(Slot("19700102").hours(), (24, 48))
+        self.assertEquals(Slot("197002").hours(), (31 * 24, 59 * 24))
+        self.assertEquals(Slot("197012").hours(), (334 * 24, 365 * 24))
+        self.assertEquals(Slot("1972").hours(), (730 * 24, 1096 * 24))
+
+    def testSlotSet(self):
+        a = Slot("2014").rangeto("201502")
+        b = Slot("20141231").rangeto("2015031005")
+        self.assertTrue(isinstance(a, SlotSet))
+        self.assertEquals(a | b, set([Slot("2014"), Slot("201501"), Slot("201502"), Slot("20150301"),
+                                      Slot("20150302"), Slot("20150303"), Slot("20150304"), Slot("20150305"),
+                                      Slot("20150306"), Slot("20150307"), Slot("20150308"), Slot("20150309"),
+                                      Slot("2015031000"), Slot("2015031001"), Slot("2015031002"),
+                                      Slot("2015031003"), Slot("2015031004"), Slot("2015031005")]))
+        self.assertEquals(a & b, set([Slot("20141231"), Slot("201501"), Slot("201502")]))
+        self.assertEquals(a - b, Slot("201401").rangeto("20141230"))
+        self.assertEquals(b - a, Slot("201503").rangeto("2015031005"))
+        self.assertEquals(a - a, set())
+        self.assertTrue(Slot("2014") in a)
+        self.assertTrue(Slot("2015022823") in a)
+        self.assertFalse(Slot("2015030100") in a)
+        self.assertFalse(Slot("2015") in a)
+        self.assertTrue(Slot("2014").hours()[0] in a)
+        self.assertFalse(Slot("2013").hours()[0] in a)
+        self.assertEquals(len(a), 3)
+        self.assertEquals(sorted(a), [Slot("2014"), Slot("201501"), Slot("201502")])
+
+    def testMergeSlotSets(self):
+        rnd = Random(0)
+        for i in range(20):
+            sets = []
+            hours = set()
+            for j in range(rnd.randint(1, 5)):
+                start = Slot("2014010100") + rnd.randint(0, 24 * 800)
+                end = start + rnd.randint(0, 24 * 100)
+                length = rnd.choice([4, 6, 8, 10])
+                start = Slot(start.slot[0:length])
+                end = Slot(end.slot[0:length])
+                sets.append(start.rangeto(end))
+                hours.update(range(start.hours()[0], end.hours()[1]))
+            merged = mergeSlotSets(sets)
+            covered = set()
+            for slot in merged:
+                self.assertTrue(slot.parents().isdisjoint(merged.slots()))
+                if slot.parent() is not None:
+                    self.assertFalse(slot.parent().children().issubset(merged.slots()))
+                covered.update(range(*slot.hours()))
+            self.assertEquals(covered, hours)
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testSlots']
     unittest.main()
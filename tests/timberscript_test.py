@@ -0,0 +1,186 @@
+'''
+Created on 18/10/2026
+'''
+import imp
+import os
+import sys
+import unittest
+from Queue import Empty
+from timberslide.slots import Slot
+
+_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin', 'timberscript')
+
+
+# Minimal stand-in for a psycopg2 connection that records the statements executed by all
+# connections
+class _TimberscriptTestCursor(object):
+    def execute(self, sql, params=None):
+        _TimberscriptTestConnection.executed.append(sql)
+
+    def close(self):
+        pass
+
+
+class _TimberscriptTestConnection(object):
+    server_version = 120000
+    executed = []
+
+    def cursor(self):
+        return _TimberscriptTestCursor()
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _TimberscriptTestKey(object):
+    def __init__(self, name, etag, size):
+        self.name = name
+        self.etag = etag
+        self.size = size
+
+
+# Stand-in for S3Repository with a fixed list of keys
+class _TimberscriptTestRepository(object):
+    location = 's3://bucket/prefix/'
+    index = None
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    def get_slot_keys(self, slots):
+        return self.keys
+
+    def get_key_slot(self, name):
+        return Slot(''.join(name.split('/')[1:5]))
+
+
+# Stand-in for InserterProcess that takes every unit from the queue without loading it, and
+# reports all of its tasks as committed except those of the keys in 'failed'
+class _TimberscriptTestWorker(object):
+    units = []
+    failed = set()
+
+    def __init__(self, name, queue, args, results=None):
+        self.name = name
+        self.queue = queue
+        self.results = results
+
+    def start(self):
+        try:
+            while True:
+                unit = self.queue.get(True, 0.5)
+                _TimberscriptTestWorker.units.append(unit)
+                for name, start, end in unit[1]:
+                    if name not in _TimberscriptTestWorker.failed:
+                        self.results.put({'worker': self.name, 'key': name, 'start': start, 'end': end,
+                                          'size': 1, 'seconds': 1.0})
+        except Empty:
+            pass
+
+    def is_alive(self):
+        return False
+
+
+class TimberscriptTest(unittest.TestCase):
+    def setUp(self):
+        sys.dont_write_bytecode, self._bytecode = True, sys.dont_write_bytecode
+        self.script = imp.load_source('timberscript', _script)
+        # the script takes its description from the docstring of the __main__ module
+        self._main, sys.modules['__main__'] = sys.modules['__main__'], self.script
+        self._argv = sys.argv
+        self.script.connect = lambda *args: _TimberscriptTestConnection()
+        self.script.InserterProcess = _TimberscriptTestWorker
+        _TimberscriptTestWorker.units = []
+        _TimberscriptTestWorker.failed = set()
+        _TimberscriptTestConnection.executed = []
+        # unexpected errors are raised instead of ending with exit code 2
+        self.script.TESTRUN = 1
+
+    def tearDown(self):
+        sys.modules['__main__'] = self._main
+        sys.argv = self._argv
+        sys.dont_write_bytecode = self._bytecode
+
+    # Runs the script with the given arguments over a repository with the given keys, and
+    # returns its exit code.
+    def _run(self, args, keys=(), loaded=None):
+        self.script.open_repository = lambda *a, **kw: _TimberscriptTestRepository(list(keys))
+        # files recorded as loaded into the table, and none into the staging table
+        self.script.loaded_keys = lambda conn, manifest, table: dict(loaded or {}) if table == 'logs' else {}
+        sys.argv = ['timberscript', '-p', 'password'] + args
+        try:
+            return self.script.main()
+        except SystemExit as e:
+            return e.code
+
+    def testIncrementalChanged(self):
+        keys = [_TimberscriptTestKey('p/2015/01/01/00/a.bz2', '"a"', 1), _TimberscriptTestKey('p/2015/01/01/00/b.bz2', '"b"', 1)]
+        # nothing to do if only unchanged files were loaded
+        self.assertEquals(self._run(['--manifest', 'm', '-i', '2015'], keys,
+                                    {'p/2015/01/01/00/a.bz2': ('"a"', 1), 'p/2015/01/01/00/b.bz2': ('"b"', 1)}), 0)
+        self.assertEquals(self._run(['--manifest', 'm', '-i', '2015'], keys, {'p/2015/01/01/00/a.bz2': ('"a"', 1)}), 0)
+        self.assertEquals(_TimberscriptTestWorker.units, [(None, [('p/2015/01/01/00/b.bz2', None, None)])])
+        _TimberscriptTestWorker.units = []
+        # a changed file cannot be appended again without --replace
+        self.assertEquals(self._run(['--manifest', 'm', '-i', '2015'], keys,
+                                    {'p/2015/01/01/00/a.bz2': ('"old"', 1)}), 2)
+        self.assertEquals(_TimberscriptTestWorker.units, [])
+        # with --replace its slot is loaded again
+        self.assertEquals(self._run(['--manifest', 'm', '-i', '--replace', '2015'], keys,
+                                    {'p/2015/01/01/00/a.bz2': ('"old"', 1)}), 0)
+        self.assertEquals(len(_TimberscriptTestWorker.units), 1)
+        self.assertEquals(sorted([t[0] for t in _TimberscriptTestWorker.units[0][1]]), ['p/2015/01/01/00/a.bz2', 'p/2015/01/01/00/b.bz2'])
+
+    def testStagingIncremental(self):
+        keys = [_TimberscriptTestKey('p/2015/01/01/00/a.bz2', '"a"', 1), _TimberscriptTestKey('p/2015/01/01/00/b.bz2', '"b"', 1)]
+        # the table is replaced, so files loaded into it are loaded into the staging table again
+        self.assertEquals(self._run(['--overwrite', '--staging', '--create-index', 'net_src_ip', '--manifest', 'm', '-i', '2015'], keys,
+                                    {'p/2015/01/01/00/a.bz2': ('"a"', 1)}), 0)
+        self.assertEquals(sorted([u[1][0][0] for u in _TimberscriptTestWorker.units]), ['p/2015/01/01/00/a.bz2', 'p/2015/01/01/00/b.bz2'])
+        self.assertTrue('ALTER TABLE logs_staging RENAME TO logs;' in _TimberscriptTestConnection.executed)
+        # the staging table is made durable before it is indexed, since that rebuilds indexes
+        executed = _TimberscriptTestConnection.executed
+        indexes = [i for i in range(len(executed)) if executed[i].startswith('CREATE INDEX IF NOT EXISTS logs_staging_')]
+        self.assertTrue(len(indexes) > 0)
+        self.assertTrue(executed.index('ALTER TABLE logs_staging SET LOGGED;') < min(indexes))
+
+    def testStagingFailed(self):
+        keys = [_TimberscriptTestKey('p/2015/01/01/00/a.bz2', '"a"', 1), _TimberscriptTestKey('p/2015/01/01/00/b.bz2', '"b"', 1)]
+        _TimberscriptTestWorker.failed = set(['p/2015/01/01/00/b.bz2'])
+        self.assertEquals(self._run(['--overwrite', '--staging', '2015'], keys), 2)
+        self.assertEquals(len(_TimberscriptTestWorker.units), 2)
+        self.assertFalse('ALTER TABLE logs_staging RENAME TO logs;' in _TimberscriptTestConnection.executed)
+        # a unit is only committed if all of its tasks were
+        self.assertEquals(self._run(['--overwrite', '--staging', '--replace', '2015'], keys), 2)
+        self.assertFalse('ALTER TABLE logs_staging RENAME TO logs;' in _TimberscriptTestConnection.executed)
+
+    def testDedupHours(self):
+        keys = [_TimberscriptTestKey('p/2015/01/01/00/a.bz2', '"a"', 3), _TimberscriptTestKey('p/2015/01/01/01/b.bz2', '"b"', 2),
+                _TimberscriptTestKey('p/2015/01/01/00/c.bz2', '"c"', 1)]
+        # the keys of each hour of a partition are loaded one after another, largest first
+        self.assertEquals(self._run(['--replace', '--partition', 'day', '--dedup', '2015'], keys), 0)
+        self.assertEquals([t[0] for t in _TimberscriptTestWorker.units[0][1]],
+                          ['p/2015/01/01/00/a.bz2', 'p/2015/01/01/00/c.bz2', 'p/2015/01/01/01/b.bz2'])
+        _TimberscriptTestWorker.units = []
+        self.assertEquals(self._run(['--replace', '--partition', 'day', '2015'], keys), 0)
+        self.assertEquals([t[0] for t in _TimberscriptTestWorker.units[0][1]],
+                          ['p/2015/01/01/00/a.bz2', 'p/2015/01/01/01/b.bz2', 'p/2015/01/01/00/c.bz2'])
+
+    def testReplaceHours(self):
+        keys = [_TimberscriptTestKey('p/2015/01/01/00/a.bz2', '"a"', 3), _TimberscriptTestKey('p/2015/01/01/01/b.bz2', '"b"', 2),
+                _TimberscriptTestKey('p/2015/03/01/00/c.bz2', '"c"', 1)]
+        # each hour is replaced as a unit, and the rest of the year is deleted at once
+        self.assertEquals(self._run(['--replace', '2015'], keys), 0)
+        self.assertEquals(sorted([(u[0], [t[0] for t in u[1]]) for u in _TimberscriptTestWorker.units]), [
+            (Slot('2015010100'), ['p/2015/01/01/00/a.bz2']), (Slot('2015010101'), ['p/2015/01/01/01/b.bz2']),
+            (Slot('2015030100'), ['p/2015/03/01/00/c.bz2'])])
+        deleted = [s for s in _TimberscriptTestConnection.executed if s.startswith('DELETE FROM logs ')]
+        self.assertEquals(len(deleted), 10 + 30 + 22 + 30 + 23)
+
+
+if __name__ == "__main__":
+    # import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,125 @@
+'''
+Created on 18/10/2026
+'''
+
+import csv
+import logging
+import numpy
+from itertools import islice
+from timberslide.parse import _default_func, _default_nonevals
+# compatability shim for python3
+import sys
+if sys.version_info > (3,):
+    long = int
+
+# NumPy types used for columns converted by each of the functions in _default_func, chosen
+# so values are the same as the ones TSVIterator would return
+_default_dtypes = {int: numpy.int64, long: numpy.int64, float: numpy.float64, bool: numpy.bool_}
+
+
+'''
+This class holds a block of rows read by ColumnarTSVReader in columnar format.
+
+'columns' maps each column name to a NumPy array with one value per row, and 'valid' maps
+each column name to a boolean array that is False for rows where the value was one of the
+nonevals. Converted columns use the types in _default_dtypes, with 0 (or False) where the
+value is not valid, and other columns are object arrays of strings with None where the
+value is not valid. 'size' is the number of rows.
+'''
+
+
+class ColumnBatch(object):
+    def __init__(self, colnames, columns, valid, size):
+        self.colnames = colnames
+        self.columns = columns
+        self.valid = valid
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+
+'''
+This class reads the lines of a given iterator as tab-delimited fields, like TSVIterator,
+but returns blocks of rows as ColumnBatch instances instead of one list per row.
+
+Each block is split with a CSV reader and transposed, and then every column that has a
+function in 'func' with a known NumPy type is checked against 'nonevals' and converted in
+a single vectorized operation. Errors are reported the same way as TSVIterator does.
+'''
+
+
+class ColumnarTSVReader(object):
+    def __init__(self, reader, func=_default_func, nonevals=_default_nonevals, dtypes=_default_dtypes):
+        self._reader = iter(reader)
+        self.nonevals = list(nonevals)
+        self.colnames = next(csv.reader([next(self._reader)], delimiter='\t'))
+        self.func = [func.get(c) for c in self.colnames]
+        self.dtypes = [dtypes.get(f) for f in self.func]
+        self._row = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.nextbatch()
+
+    # Logs the first value of a column that cannot be converted, in the same format used
+    # by TSVIterator, and raises the corresponding exception.
+    def _report(self, i, raw, valid, rownums):
+        for j in numpy.flatnonzero(valid):
+            try:
+                self.func[i](raw[j])
+            except Exception as e:
+                logging.fatal('Error in row {0} processing column {1} with value {2}'.format(str(rownums[j]),
+                                                                                             self.colnames[i],
+                                                                                             raw[j]))
+                raise e
+
+    # Converts the values of the column at index 'i' given as a tuple of strings.
+    def _column(self, i, values, rownums):
+        raw = numpy.array(values)
+        valid = numpy.ones(len(values), dtype=numpy.bool_)
+        for v in self.nonevals:
+            valid &= raw != v
+
+        dtype = self.dtypes[i]
+        if dtype is None:
+            column = numpy.array(values, dtype=object)
+            column[~valid] = None
+        elif dtype is numpy.bool_:
+            # same as bool() applied to a string
+            column = (raw != '') & valid
+        else:
+            column = numpy.zeros(len(values), dtype=dtype)
+            try:
+                column[valid] = raw[valid].astype(dtype)
+            except ValueError:
+                self._report(i, raw, valid, rownums)
+                raise
+        return column, valid
+
+    # Returns a ColumnBatch with the rows in the next 'size' lines, raising StopIteration
+    # if there are no more rows.
+    def nextbatch(self, size=65536):
+        rows = []
+        rownums = []
+        ncols = len(self.colnames)
+        while len(rows) == 0:
+            lines = list(islice(self._reader, size))
+            if len(lines) == 0:
+                raise StopIteration
+            for row in csv.reader(lines, delimiter='\t'):
+                self._row = self._row + 1
+                if len(row) == 0:
+                    continue
+                # just a sanity check, need to do proper exception here later
+                assert(len(row) == ncols)
+                rows.append(row)
+                rownums.append(self._row)
+
+        columns = {}
+        valid = {}
+        for i, values in enumerate(zip(*rows)):
+            columns[self.colnames[i]], valid[self.colnames[i]] = self._column(i, values, rownums)
+        return ColumnBatch(self.colnames, columns, valid, len(rows))
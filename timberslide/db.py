@@ -6,7 +6,10 @@ Created on 02/01/2015
 
 import psycopg2
 from argparse import ArgumentTypeError
-from re import compile, IGNORECASE, sub
+from re import compile, IGNORECASE, MULTILINE, sub
+from socket import inet_pton, AF_INET, AF_INET6
+from struct import Struct, error as StructError
+from timberslide.slots import Slot
 import logging
 
 # regular expression to validate identifiers such as table and database names
@@ -85,6 +88,10 @@ def is_valid_id(name):
         return name
 
 
+# regular expression to find column definitions in a CREATE TABLE query, used by column_types
+_column_def = compile('^\\s*(?P<name>[a-z][a-z0-9_]*)\\s+(?P<type>[a-z]+)(\\([0-9]+\\))?\\s*,?\\s*$',
+                      IGNORECASE | MULTILINE)
+
 # query to create table
 _create_table_query = '''
     CREATE TABLE IF NOT EXISTS {0}
@@ -161,18 +168,200 @@ def createtable(conn, name, query=_create_table_query):
     conn.cursor().execute(query.format(name))
 
 
+# number of characters of a slot that identify its partition, by partitioning interval
+_partition_lengths = {'day': 8, 'month': 6}
+
+
+'''
+Creates a table of the given name partitioned by range on the yyyymmddhh column, optionally
+using a given query. Partitions are created with createpartitions.
+'''
+
+
+def createpartitioned(conn, name, query=_create_table_query):
+    conn.cursor().execute(sub('\\)\\s*;\\s*$', ') PARTITION BY RANGE (yyyymmddhh);', query.format(name)))
+
+
+'''
+Returns the Slot of the partition that holds the rows of a given slot, when the table is
+partitioned by 'day' or 'month'.
+'''
+
+
+def partition_slot(slot, by):
+    return Slot(slot.slot[0:_partition_lengths[by]])
+
+
+'''
+Returns the length of the slots of the partitions of a table partitioned by 'day' or 'month'.
+'''
+
+
+def partition_length(by):
+    return _partition_lengths[by]
+
+
+'''
+Returns the name of the partition of a table that holds the rows of a given partition Slot.
+'''
+
+
+def partition_name(name, slot):
+    return '{0}_{1}'.format(name, slot.slot)
+
+
+'''
+Creates the partitions of a table created by createpartitioned for each of the given
+partition Slots, if they do not exist yet. Old data can then be removed by detaching or
+dropping a partition instead of deleting its rows.
+'''
+
+
+def createpartitions(conn, name, slots):
+    cursor = conn.cursor()
+    for slot in sorted(slots):
+        cursor.execute("CREATE TABLE IF NOT EXISTS {0} PARTITION OF {1} FOR VALUES FROM ('{2}') TO ('{3}');".format(
+            partition_name(name, slot), name, slot.slot, (slot + 1).slot))
+
+
+'''
+Removes the rows of a Slot from a table, so it can be loaded again without duplicating
+them. If the table was created by createpartitioned with the given 'partition' interval and
+the slot is exactly one partition, the partition is truncated instead. The transaction is
+left open, so the rows can be loaded again before anyone sees them missing.
+'''
+
+
+def replace_slot(conn, name, slot, partition=None):
+    cursor = conn.cursor()
+    if partition is not None and len(slot.slot) == _partition_lengths[partition]:
+        cursor.execute("TRUNCATE {0};".format(partition_name(name, slot)))
+    else:
+        cursor.execute("DELETE FROM {0} WHERE yyyymmddhh >= %s AND yyyymmddhh < %s;".format(name),
+                       (slot.slot, (slot + 1).slot))
+    cursor.close()
+
+
+'''
+Creates an UNLOGGED table of the given name to load data into before it replaces another
+table with swaptable, dropping it first if it was left behind by a previous run. Rows
+written to it skip the write-ahead log, and it has no indexes until createindexes is called.
+'''
+
+
+def createstaging(conn, name, query=_create_table_query):
+    droptable(conn, name)
+    conn.cursor().execute(sub('CREATE TABLE', 'CREATE UNLOGGED TABLE', query.format(name), 1))
+
+
+'''
+Returns the name of the index of a table on a column created by createindexes.
+'''
+
+
+def index_name(name, column):
+    return '{0}_{1}_idx'.format(name, column).lower()
+
+
+'''
+Creates an index on each of the given columns of a table, if it does not exist yet. If
+'workers' is given and the server is PostgreSQL 11 or newer, each index is built by up to
+that many parallel workers.
+'''
+
+
+def createindexes(conn, name, columns, workers=None):
+    cursor = conn.cursor()
+    if workers is not None and conn.server_version >= 110000:
+        cursor.execute("SET max_parallel_maintenance_workers = {0:d};".format(workers))
+    for column in columns:
+        cursor.execute("CREATE INDEX IF NOT EXISTS {0} ON {1} ({2});".format(index_name(name, column), name, column))
+    cursor.close()
+
+
+'''
+Makes the table 'staging' that was created by createstaging durable and analyzes it, once
+all rows were loaded into it. This must be done before createindexes is called, since
+making an unlogged table durable rewrites it along with all of its indexes.
+'''
+
+
+def logstaging(conn, staging):
+    cursor = conn.cursor()
+    cursor.execute("ALTER TABLE {0} SET LOGGED;".format(staging))
+    cursor.execute("ANALYZE {0};".format(staging))
+    cursor.close()
+
+
+'''
+Replaces table 'name' with the table 'staging' that was created by createstaging, in a
+single transaction so readers see either the old or the new data and never a partial load.
+The staging table must have been made durable by logstaging. Its indexes on 'columns' are
+renamed to match the new table name, and if 'manifest' is given the keys recorded as loaded
+into 'staging' are moved to 'name', replacing those recorded for the old table.
+
+The connection must not be in autocommit mode.
+'''
+
+
+def swaptable(conn, staging, name, columns=(), manifest=None):
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS {0};".format(name))
+    cursor.execute("ALTER TABLE {0} RENAME TO {1};".format(staging, name))
+    for column in columns:
+        cursor.execute("ALTER INDEX {0} RENAME TO {1};".format(index_name(staging, column), index_name(name, column)))
+    if manifest is not None:
+        cursor.execute("DELETE FROM {0} WHERE tablename = %s;".format(manifest), (name,))
+        cursor.execute("UPDATE {0} SET tablename = %s WHERE tablename = %s;".format(manifest), (name, staging))
+    conn.commit()
+    cursor.close()
+
+
+'''
+Returns a dictionary mapping the lower case name of every column defined in a CREATE TABLE
+query to its type, without any length modifiers (e.g. 'varchar(3)' becomes 'varchar').
+'''
+
+
+def column_types(query=_create_table_query):
+    return dict(table_columns(query))
+
+
+'''
+Returns a list with the lower case name and type of every column defined in a CREATE TABLE
+query, in the order they are defined, with types as in column_types.
+'''
+
+
+def table_columns(query=_create_table_query):
+    return [(m.group('name').lower(), m.group('type').lower()) for m in _column_def.finditer(query)]
+
+
 def _column_sub_repl(m):
     return '_' * len(m.group(0))
 
 
+'''
+Converts the column names found by a TSV Iterator into valid PostgreSQL column names,
+replacing any sequence of invalid characters by the same number of underscores.
+'''
+
+
+def sqlcolnames(colnames):
+    return [is_valid_id(sub('[^0-9a-zA-Z_]+', _column_sub_repl, s)) for s in colnames]
+
+
 '''
 Loops through a TSV Iterator and writes each entry as a new row in the given table
 
 Inspired by this: http://stackoverflow.com/questions/8134602/psycopg2-insert-multiple-rows-with-one-query
+
+If 'commit' is False the transaction is left open, so the caller can do more work in it
+before committing.
 '''
 
 
-def insert(conn, name, tsviter, chunksize=1024):
+def insert(conn, name, tsviter, chunksize=1024, commit=True):
     cursor = conn.cursor()
 
     # build query strings based on column names found
@@ -180,9 +369,7 @@ def insert(conn, name, tsviter, chunksize=1024):
     qval = None
     try:
         row = tsviter.next()
-        sqlcolnames = [is_valid_id(sub('[^0-9a-zA-Z_]+', _column_sub_repl, s))
-                       for s in tsviter.colnames]
-        qmain = qmain.format(name, ", ".join(sqlcolnames))
+        qmain = qmain.format(name, ", ".join(sqlcolnames(tsviter.colnames)))
         qval = "(" + ", ".join(["%s"] * len(tsviter.colnames)) + ")"
     except StopIteration:
         logging.error("File is empty!")
@@ -204,5 +391,438 @@ def insert(conn, name, tsviter, chunksize=1024):
             cursor.execute(qmain + ",".join([cursor.mogrify(qval, x) for x in chunk]))
             count = count + len(chunk)
         cursor.close()
+        if commit:
+            conn.commit()
+        return count
+
+
+# characters that must be escaped in the COPY text format, backslash must come first
+_copy_escapes = [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]
+
+
+'''
+Returns the representation of a single value as expected by the text format of
+COPY ... FROM STDIN, where None becomes \\N and booleans become 't' or 'f'.
+
+See http://www.postgresql.org/docs/current/static/sql-copy.html
+'''
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    elif value is True:
+        return 't'
+    elif value is False:
+        return 'f'
+    elif isinstance(value, float):
+        return repr(value)
+    value = str(value)
+    for c, r in _copy_escapes:
+        if c in value:
+            value = value.replace(c, r)
+    return value
+
+
+'''
+This class is a read-only file-like object over the rows of a TSV Iterator, which
+encodes each row as one line of the COPY text format. It is meant to be passed to
+psycopg2's copy_expert so rows are streamed to the server as they are parsed.
+
+The 'count' attribute contains the number of rows read so far.
+'''
+
+
+class CopyTextReader(object):
+    def __init__(self, tsviter, first=None):
+        self._tsviter = tsviter
+        self._first = first
+        self._buf = ''
+        self._done = False
+        self.count = 0
+
+    # Returns the next row encoded as a line, or None if there are no more rows.
+    def _nextline(self):
+        if self._first is not None:
+            row = self._first
+            self._first = None
+        else:
+            try:
+                row = self._tsviter.next()
+            except StopIteration:
+                self._done = True
+                return None
+        self.count = self.count + 1
+        return '\t'.join([copy_value(v) for v in row]) + '\n'
+
+    def readline(self, size=-1):
+        if len(self._buf) > 0:
+            line = self._buf
+            self._buf = ''
+            return line
+        line = self._nextline()
+        if line is None:
+            return ''
+        return line
+
+    def read(self, size=-1):
+        parts = [self._buf]
+        length = len(self._buf)
+        while not self._done and (size < 0 or length < size):
+            line = self._nextline()
+            if line is not None:
+                parts.append(line)
+                length = length + len(line)
+        data = ''.join(parts)
+        if size < 0 or len(data) <= size:
+            self._buf = ''
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
+
+'''
+Loops through a TSV Iterator and streams every entry to the given table using
+COPY ... FROM STDIN, which avoids building and parsing a large INSERT statement
+for every chunk of rows. 'commit' works as in insert.
+'''
+
+
+def copy(conn, name, tsviter, bufsize=64*1024, commit=True):
+    try:
+        row = tsviter.next()
+    except StopIteration:
+        logging.error("File is empty!")
+        return
+
+    reader = CopyTextReader(tsviter, row)
+    cursor = conn.cursor()
+    cursor.copy_expert("COPY {0} ({1}) FROM STDIN;".format(name, ", ".join(sqlcolnames(tsviter.colnames))),
+                       reader, bufsize)
+    cursor.close()
+    if commit:
         conn.commit()
+    return reader.count
+
+
+# structures and constants of the binary COPY format, see
+# http://www.postgresql.org/docs/current/static/sql-copy.html
+_int2 = Struct('!h')
+_int4 = Struct('!i')
+_field_int4 = Struct('!ii')
+_field_int8 = Struct('!iq')
+_field_float4 = Struct('!if')
+_field_bool = Struct('!i?')
+_field_inet4 = Struct('!iBBBB4s')
+_field_inet6 = Struct('!iBBBB16s')
+_binary_header = b'PGCOPY\n\xff\r\n\x00' + _field_int4.pack(0, 0)
+_binary_trailer = _int2.pack(-1)
+
+# address family codes used by PostgreSQL for inet and cidr values
+_pgsql_af_inet = 2
+_pgsql_af_inet6 = 3
+
+
+# Each encoder function below writes one non-NULL field (length and value) at offset 'off'
+# of bytearray 'buf' and returns the offset after it, raising IndexError if the buffer is
+# not large enough, and StructError or OverflowError if the value is out of the range of
+# the column type.
+
+def _encode_int4(buf, off, value):
+    if off + 8 > len(buf):
+        raise IndexError('buffer too small')
+    _field_int4.pack_into(buf, off, 4, value)
+    return off + 8
+
+
+def _encode_int8(buf, off, value):
+    if off + 12 > len(buf):
+        raise IndexError('buffer too small')
+    _field_int8.pack_into(buf, off, 8, value)
+    return off + 12
+
+
+def _encode_float4(buf, off, value):
+    if off + 8 > len(buf):
+        raise IndexError('buffer too small')
+    _field_float4.pack_into(buf, off, 4, value)
+    return off + 8
+
+
+def _encode_bool(buf, off, value):
+    if off + 5 > len(buf):
+        raise IndexError('buffer too small')
+    _field_bool.pack_into(buf, off, 1, value)
+    return off + 5
+
+
+def _encode_text(buf, off, value):
+    if not isinstance(value, str):
+        value = str(value)
+    end = off + 4 + len(value)
+    if end > len(buf):
+        raise IndexError('buffer too small')
+    _int4.pack_into(buf, off, len(value))
+    buf[off+4:end] = value
+    return end
+
+
+def _encode_network(buf, off, value, cidr):
+    addr, _, bits = value.partition('/')
+    if ':' in addr:
+        addr = inet_pton(AF_INET6, addr)
+        if off + 24 > len(buf):
+            raise IndexError('buffer too small')
+        _field_inet6.pack_into(buf, off, 20, _pgsql_af_inet6, int(bits) if bits else 128, cidr, 16, addr)
+        return off + 24
+    else:
+        addr = inet_pton(AF_INET, addr)
+        if off + 12 > len(buf):
+            raise IndexError('buffer too small')
+        _field_inet4.pack_into(buf, off, 8, _pgsql_af_inet, int(bits) if bits else 32, cidr, 4, addr)
+        return off + 12
+
+
+def _encode_inet(buf, off, value):
+    return _encode_network(buf, off, value, 0)
+
+
+def _encode_cidr(buf, off, value):
+    return _encode_network(buf, off, value, 1)
+
+
+# encoder functions by column type, any type not listed here is sent as text
+_binary_encoders = {'integer': _encode_int4, 'bigint': _encode_int8, 'real': _encode_float4,
+                    'boolean': _encode_bool, 'inet': _encode_inet, 'cidr': _encode_cidr}
+
+
+'''
+This class is a read-only file-like object over the rows of a TSV Iterator, which
+encodes each row in the binary COPY format according to the column types given as
+a dictionary such as the one returned by column_types.
+
+Rows are packed directly into a preallocated bytearray of at least 'bufsize' bytes,
+which only grows if a single row does not fit in it. The 'count' attribute contains
+the number of rows read so far.
+'''
+
+
+class CopyBinaryReader(object):
+    def __init__(self, tsviter, types, first=None, bufsize=64*1024):
+        self._tsviter = tsviter
+        self._first = first
+        self._colnames = sqlcolnames(tsviter.colnames)
+        self._encoders = [_binary_encoders.get(types.get(c.lower()), _encode_text) for c in self._colnames]
+        self._buf = bytearray(max(bufsize, len(_binary_header)))
+        self._buf[0:len(_binary_header)] = _binary_header
+        self._start = 0
+        self._end = len(_binary_header)
+        self._done = False
+        self.count = 0
+
+    # Writes a row at offset 'off' of the buffer and returns the offset after it, raising
+    # IndexError if it does not fit and ValueError if a value is out of range.
+    def _packrow(self, row, off):
+        buf = self._buf
+        if off + 2 > len(buf):
+            raise IndexError('buffer too small')
+        _int2.pack_into(buf, off, len(row))
+        off = off + 2
+        i = 0
+        try:
+            for encode, value in zip(self._encoders, row):
+                if value is None:
+                    if off + 4 > len(buf):
+                        raise IndexError('buffer too small')
+                    _int4.pack_into(buf, off, -1)
+                    off = off + 4
+                else:
+                    off = encode(buf, off, value)
+                i = i + 1
+        except (StructError, OverflowError) as e:
+            raise ValueError("value {0} of column {1} is out of range: {2}".format(
+                repr(row[i]), self._colnames[i], str(e)))
+        return off
+
+    # Appends the given bytes or row to the buffer, moving unread data to the start of the
+    # buffer or growing it as needed.
+    def _append(self, row=None, data=None):
+        while True:
+            try:
+                if data is not None:
+                    if self._end + len(data) > len(self._buf):
+                        raise IndexError('buffer too small')
+                    self._buf[self._end:self._end+len(data)] = data
+                    self._end = self._end + len(data)
+                else:
+                    self._end = self._packrow(row, self._end)
+                return
+            except IndexError:
+                if self._start > 0:
+                    self._buf[0:self._end-self._start] = self._buf[self._start:self._end]
+                    self._end = self._end - self._start
+                    self._start = 0
+                else:
+                    self._buf.extend(bytearray(len(self._buf)))
+
+    def read(self, size=-1):
+        while not self._done and (size < 0 or self._end - self._start < size):
+            if self._first is not None:
+                row = self._first
+                self._first = None
+            else:
+                try:
+                    row = self._tsviter.next()
+                except StopIteration:
+                    self._append(data=_binary_trailer)
+                    self._done = True
+                    break
+            self._append(row=row)
+            self.count = self.count + 1
+
+        if size < 0 or size > self._end - self._start:
+            size = self._end - self._start
+        data = bytes(self._buf[self._start:self._start+size])
+        self._start = self._start + size
+        if self._start == self._end:
+            self._start = 0
+            self._end = 0
+        return data
+
+
+'''
+Same as copy, but using the binary COPY format so the server does not need to parse the
+text representation of each value. The column types are taken from the CREATE TABLE
+query used to create the table.
+'''
+
+
+def copy_binary(conn, name, tsviter, query=_create_table_query, bufsize=64*1024, commit=True):
+    try:
+        row = tsviter.next()
+    except StopIteration:
+        logging.error("File is empty!")
+        return
+
+    reader = CopyBinaryReader(tsviter, column_types(query), row, bufsize)
+    cursor = conn.cursor()
+    cursor.copy_expert("COPY {0} ({1}) FROM STDIN WITH (FORMAT binary);".format(name, ", ".join(sqlcolnames(tsviter.colnames))),
+                       reader, bufsize)
+    cursor.close()
+    if commit:
+        conn.commit()
+    return reader.count
+
+
+# query to create the table where loaded S3 keys are recorded
+_create_manifest_query = '''
+    CREATE TABLE IF NOT EXISTS {0}
+    (
+        tablename text NOT NULL,
+        keyname text NOT NULL,
+        etag text,
+        size bigint,
+        rowcount bigint,
+        loaded timestamp with time zone NOT NULL DEFAULT now(),
+        PRIMARY KEY (tablename, keyname)
+    );
+'''
+
+
+'''
+Creates a manifest table of the given name, used to record which S3 keys were loaded into
+which tables.
+'''
+
+
+def createmanifest(conn, name):
+    conn.cursor().execute(_create_manifest_query.format(name))
+
+
+'''
+Records in the manifest table that a boto S3 Key was loaded into a table with the given
+number of rows, replacing any previous record for the same key. Meant to be called with
+the transaction used to load the data still open, so both are committed together.
+'''
+
+
+def record_load(conn, manifest, table, key, count):
+    cursor = conn.cursor()
+    cursor.execute(("INSERT INTO {0} (tablename, keyname, etag, size, rowcount) VALUES (%s, %s, %s, %s, %s) "
+                    "ON CONFLICT (tablename, keyname) DO UPDATE SET etag = EXCLUDED.etag, size = EXCLUDED.size, "
+                    "rowcount = EXCLUDED.rowcount, loaded = now();").format(manifest),
+                   (table, key.name, key.etag, key.size, count or 0))
+    cursor.close()
+
+
+'''
+Removes all records of keys loaded into a table from the manifest table, e.g. after the
+table was dropped.
+'''
+
+
+def forget_loads(conn, manifest, table):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM {0} WHERE tablename = %s;".format(manifest), (table,))
+    cursor.close()
+
+
+'''
+Returns a dictionary mapping the name of each key recorded in the manifest table as loaded
+into a table to a tuple with its ETag and size at the time.
+'''
+
+
+def loaded_keys(conn, manifest, table):
+    cursor = conn.cursor()
+    cursor.execute("SELECT keyname, etag, size FROM {0} WHERE tablename = %s;".format(manifest), (table,))
+    retval = dict([(r[0], (r[1], r[2])) for r in cursor.fetchall()])
+    cursor.close()
+    return retval
+
+
+'''
+This class is the sink InserterProcess writes rows to by default, a PostgreSQL table. Sinks
+have the following methods, which ParquetSink also implements:
+
+ - begin(slot) starts a unit of work that replaces everything previously written for the
+   slot, here by deleting its rows (or truncating its partition, see replace_slot).
+ - write(key, slot, rows, first=None) writes the rows of a TSV Iterator read from a boto S3
+   Key (from byte offset 'first' if not None) under the hour 'slot' (or None) and returns
+   the number of rows written. Here they are written with 'load' (e.g. insert or copy) to
+   the table, or to the partition of the slot if 'partition' is 'day' or 'month', and
+   recorded in the 'manifest' table if given.
+ - commit() makes everything written since the last commit visible at once.
+ - abort() discards everything written since the last commit.
+ - close() releases the sink, discarding anything not committed.
+'''
+
+
+class PostgresSink(object):
+    def __init__(self, conn, load, table, partition=None, manifest=None):
+        self.conn = conn
+        self.load = load
+        self.table = table
+        self.partition = partition
+        self.manifest = manifest
+
+    def begin(self, slot):
+        replace_slot(self.conn, self.table, slot, self.partition)
+
+    def write(self, key, slot, rows, first=None):
+        table = self.table
+        if self.partition is not None and slot is not None:
+            table = partition_name(table, partition_slot(slot, self.partition))
+        count = self.load(self.conn, table, rows, commit=False)
+        if self.manifest is not None:
+            record_load(self.conn, self.manifest, self.table, key, count)
         return count
+
+    def commit(self):
+        self.conn.commit()
+
+    def abort(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,185 @@
+'''
+Created on 18/10/2026
+'''
+
+import logging
+from hashlib import sha1
+from marshal import dumps
+from math import exp
+from struct import Struct
+
+# approximate number of bytes taken by each hash in a Python set, including the int object
+_entrysize = 64
+# number of bits set for each row in the Bloom filter, which gives a false positive rate
+# under 1e-4 while fewer than one row per 23 bits was added
+_bloomhashes = 7
+_mask64 = (1 << 64) - 1
+_digest = Struct('<Q')
+
+
+'''
+This class is a Bloom filter of 64-bit hashes over 'size' bytes, with _bloomhashes bits
+derived from each hash by double hashing.
+'''
+
+
+class _BloomFilter(object):
+    def __init__(self, size):
+        self.bits = bytearray(size)
+        self.nbits = size * 8
+        self.count = 0
+
+    # Adds a hash, returning True if it may have been added before.
+    def add(self, h):
+        h = h & _mask64
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        bits = self.bits
+        nbits = self.nbits
+        present = True
+        for i in range(_bloomhashes):
+            p = (h1 + i * h2) % nbits
+            b = bits[p >> 3]
+            mask = 1 << (p & 7)
+            if not b & mask:
+                present = False
+                bits[p >> 3] = b | mask
+        if not present:
+            self.count += 1
+        return present
+
+    # Returns the probability that a row that was never added is taken for a duplicate.
+    def error_rate(self):
+        return (1.0 - exp(-float(_bloomhashes) * self.count / self.nbits)) ** _bloomhashes
+
+
+'''
+This class tells rows seen before apart from new ones by a 64-bit hash of their values (the
+first 8 bytes of the SHA-1 digest of their serialization, which unlike hash() gives the same
+64 bits on every platform), taking up to 'maxmemory' bytes.
+
+Hashes are kept in an exact set until it would take more than 'maxmemory' bytes, at which
+point they are moved to a Bloom filter of that size, so memory stays bounded however many
+rows there are. From then on a new row may be taken for a duplicate with the probability
+given by error_rate(), which stays under 1e-4 until about 20 times more rows than fit in the
+set were seen. Rows are never taken for new ones once seen.
+
+'rows' and 'dropped' are the number of rows checked and found to be duplicates.
+'''
+
+
+class Deduplicator(object):
+    def __init__(self, maxmemory):
+        self.maxmemory = maxmemory
+        self._limit = maxmemory // _entrysize
+        self._seen = set()
+        self._bloom = None
+        self.rows = 0
+        self.dropped = 0
+
+    # Returns True if a row with the same values was seen before, otherwise records it.
+    def seen(self, row):
+        h = _digest.unpack(sha1(dumps(tuple(row))).digest()[:8])[0]
+        self.rows += 1
+        if self._bloom is None:
+            if h in self._seen:
+                self.dropped += 1
+                return True
+            self._seen.add(h)
+            if len(self._seen) > self._limit:
+                self._spill()
+            return False
+        if self._bloom.add(h):
+            self.dropped += 1
+            return True
+        return False
+
+    # Moves the hashes of the set to a Bloom filter.
+    def _spill(self):
+        logging.warning("More than {0} distinct rows, deduplicating with a Bloom filter from now on".format(
+            self._limit))
+        self._bloom = _BloomFilter(self.maxmemory)
+        for h in self._seen:
+            self._bloom.add(h)
+        self._seen = set()
+
+    # Returns the probability that a new row is taken for a duplicate, 0 while exact.
+    def error_rate(self):
+        return 0.0 if self._bloom is None else self._bloom.error_rate()
+
+    # Iterator over the rows of a TSV Iterator that skips the rows seen before, with the same
+    # 'colnames' attribute.
+    def filter(self, rows):
+        return _DedupRows(self, rows)
+
+
+class _DedupRows(object):
+    def __init__(self, dedup, rows):
+        self.colnames = rows.colnames
+        self._rows = rows
+        self._dedup = dedup
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        seen = self._dedup.seen
+        row = self._rows.next()
+        while seen(row):
+            row = self._rows.next()
+        return row
+
+
+'''
+This class is a sink (see PostgresSink) that writes the rows given to it to another 'sink'
+without the rows already written for the same hour slot (the one given to write()) since
+the last begin() or commit(), keeping up to 'maxmemory' bytes to tell them apart (see
+Deduplicator). Rows seen are forgotten when the hour changes, so the keys of each hour must
+be written one after another. 'dropped' is the number of rows left out by the last write().
+'''
+
+
+class DedupSink(object):
+    def __init__(self, sink, maxmemory):
+        self.sink = sink
+        self.maxmemory = maxmemory
+        self.dropped = 0
+        self._dedup = Deduplicator(maxmemory)
+        self._hour = None
+
+    def _clear(self):
+        self._dedup = Deduplicator(self.maxmemory)
+        self._hour = None
+
+    # Warns about the rows of the hour that may have been dropped by mistake.
+    def _log(self):
+        if self._dedup.error_rate() > 0:
+            logging.warning("Deduplicated {0} rows of {1} with a false positive rate of {2:.2g}".format(
+                self._dedup.rows, self._hour, self._dedup.error_rate()))
+
+    def begin(self, slot):
+        self._clear()
+        self.sink.begin(slot)
+
+    def write(self, key, slot, rows, first=None):
+        # slots are compared as strings, since Slot instances cannot be compared with None
+        if str(slot) != self._hour:
+            self._log()
+            self._clear()
+            self._hour = str(slot)
+        before = self._dedup.dropped
+        retval = self.sink.write(key, slot, self._dedup.filter(rows), first)
+        self.dropped = self._dedup.dropped - before
+        return retval
+
+    def commit(self):
+        self._log()
+        self._clear()
+        self.sink.commit()
+
+    def abort(self):
+        self._clear()
+        self.sink.abort()
+
+    def close(self):
+        self._clear()
+        self.sink.close()
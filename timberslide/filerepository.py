@@ -0,0 +1,177 @@
+'''
+Created on 18/10/2026
+'''
+
+import mmap
+import os
+from re import compile
+from timberslide.slots import Slot
+from timberslide.s3repository import _slot_prefix, _key_slot
+
+_locationregex = compile("^file://(?P<path>/.*?)/?$")
+_yregex = compile("^[0-9]{4}$")
+_mdhregex = compile("^[0-9]{2}$")
+
+# Python 3 shim
+try:
+    _view = buffer
+except NameError:
+    def _view(data, offset, size):
+        return memoryview(data)[offset:offset+size]
+
+
+'''
+This class is a stand-in for a boto S3 Key of a file in a FileRepository, with the same
+'name', 'size' and 'etag' attributes and the read(), open_read() and close() methods used
+by BZ2KeyIterator and its subclasses.
+
+The file is memory-mapped when first read, and read() returns read-only views of the
+mapping instead of copies, which the bz2 decompressor accepts as they are. The mapping is
+released once the key and every view of it are gone, so views stay valid after the end of
+the file is reached.
+
+The file is at 'path', which is 'name' by default. Unless an 'etag' is given (e.g. that of
+the S3 object a cached file is a copy of), the ETag is made of the size and modification
+time of the file, so it changes whenever the file does. If 'keep' is true the file is mapped
+at once and close() keeps the mapping, so the key can still be read, e.g. from the start of
+its first bz2 block after a range reader read its header, once the file was deleted.
+'''
+
+
+class FileKey(object):
+    def __init__(self, name, path=None, etag=None, keep=False):
+        self.name = name
+        self.path = path if path is not None else name
+        st = os.stat(self.path)
+        self.size = st.st_size
+        self.etag = etag if etag is not None else '"{0:x}-{1:x}"'.format(st.st_size, int(st.st_mtime * 1000000))
+        self._map = None
+        self._pos = 0
+        self.keep = keep
+        if keep:
+            self._open()
+
+    # Maps the file into memory, unless it is empty since empty files cannot be mapped.
+    def _open(self):
+        if self._map is None and self.size > 0:
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # Returns up to 'size' bytes from the current position, and an empty string at the end
+    # like boto does.
+    def read(self, size=-1):
+        self._open()
+        if self._pos >= self.size:
+            return ''
+        if size < 0 or self._pos + size > self.size:
+            size = self.size - self._pos
+        retval = _view(self._map, self._pos, size)
+        self._pos = self._pos + size
+        return retval
+
+    # Starts reading at the first offset of a 'bytes=<start>-' Range header, if given.
+    def open_read(self, headers=None):
+        self._pos = 0
+        if headers is not None and 'Range' in headers:
+            self._pos = int(headers['Range'][len('bytes='):].split('-')[0])
+
+    # Drops the mapping unless it is kept, which is released once no view of it is left.
+    def close(self, fast=False):
+        if not self.keep:
+            self._map = None
+        self._pos = 0
+
+    # Returns the bytes from 'start' to 'end' (inclusive) as a string.
+    def get_range(self, start, end):
+        self._open()
+        return self._map[start:end+1] if self._map is not None else ''
+
+
+'''
+This class has the same interface as S3Repository over a local directory with the same
+<YYYY>/<MM>/<DD>/<HH>/ layout, e.g. a mirror of a bucket prefix, given as a file:// URL
+location such as 'file:///data/niddel-aggregated/'. Keys are FileKey instances named after
+the absolute path of their file.
+'''
+
+
+class FileRepository(object):
+    def __init__(self, location):
+        m = _locationregex.match(location)
+        if m is None:
+            raise ValueError("location is not valid")
+        self.location = location
+        self.prefix = m.group('path') + '/'
+        self.index = None
+        self._minslot = None
+        self._maxslot = None
+
+    # Returns the names of the subdirectories of a directory that match a regex, in
+    # ascending or descending order.
+    def _subdirs(self, path, regex, reverse):
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return []
+        return sorted([n for n in names if regex.match(n) is not None and os.path.isdir(os.path.join(path, n))],
+                      reverse=reverse)
+
+    # Returns the first hour with files in ascending or descending order, or None.
+    def _find_hour(self, reverse):
+        for y in self._subdirs(self.prefix, _yregex, reverse):
+            for m in self._subdirs(self.prefix + y + '/', _mdhregex, reverse):
+                for d in self._subdirs(self.prefix + y + '/' + m + '/', _mdhregex, reverse):
+                    for h in self._subdirs(self.prefix + y + '/' + m + '/' + d + '/', _mdhregex, reverse):
+                        path = self.prefix + y + '/' + m + '/' + d + '/' + h + '/'
+                        for _, _, files in os.walk(path):
+                            if len(files) > 0:
+                                return Slot(y + m + d + h)
+        return None
+
+    # Returns the earliest slot for which there is data in the repository,
+    # in YYYYMMDDHH format.
+    def get_min_slot(self):
+        if self._minslot is None:
+            self._minslot = self._find_hour(False)
+            if self._minslot is None:
+                raise Exception("repository empty or not consistent")
+        return self._minslot
+
+    # Returns the latest slot for which there is data in the repository,
+    # in YYYYMMDDHH format.
+    def get_max_slot(self):
+        if self._maxslot is None:
+            self._maxslot = self._find_hour(True)
+            if self._maxslot is None:
+                raise Exception("repository empty or not consistent")
+        return self._maxslot
+
+    # Returns the directory associated with a given slot.
+    def get_slot_prefix(self, slot):
+        return _slot_prefix(self.prefix, slot)
+
+    # Returns the hour Slot of a key name, or None if it is not under an hour directory.
+    def get_key_slot(self, name):
+        return _key_slot(self.prefix, name)
+
+    # Returns a list of FileKey instances of all files under the directories of a given
+    # slot or iterable of slots, without repeated file names.
+    def get_slot_keys(self, slots):
+        if isinstance(slots, Slot):
+            slots = [slots]
+        retval = {}
+        for slot in slots:
+            for path, dirs, files in os.walk(self.get_slot_prefix(slot)):
+                for f in files:
+                    name = os.path.join(path, f)
+                    if name not in retval and os.path.isfile(name):
+                        retval[name] = FileKey(name)
+        return list(retval.values())
+
+    # Returns a FileKey instance for a given file name.
+    def get_prefix_key(self, prefix):
+        return FileKey(prefix)
+
+    # Returns the bytes from 'start' to 'end' (inclusive) of a FileKey, for RangedKeyReader.
+    def get_range(self, key, start, end):
+        return key.get_range(start, end)
@@ -0,0 +1,126 @@
+'''
+Created on 18/10/2026
+'''
+
+import json
+import os
+from time import time
+
+# metrics recorded for each key loaded, in the order they are exported
+fields = ('compressed_bytes', 'decompressed_bytes', 'rows_parsed', 'rows_written', 'rows_duplicate',
+          's3_read_seconds', 'bz2_seconds', 'parse_seconds', 'db_seconds', 'commit_seconds')
+
+# help text of each metric in the Prometheus textfile
+_help = {'keys': 'Number of S3 keys (or byte ranges of keys) loaded',
+         'compressed_bytes': 'Compressed bytes read from S3',
+         'decompressed_bytes': 'Bytes of decompressed lines',
+         'rows_parsed': 'Rows parsed from TSV lines',
+         'rows_written': 'Rows written to the database',
+         'rows_duplicate': 'Duplicate rows dropped by --dedup',
+         's3_read_seconds': 'Seconds spent waiting for S3 reads',
+         'bz2_seconds': 'Seconds spent decompressing and splitting lines',
+         'parse_seconds': 'Seconds spent parsing TSV lines into rows',
+         'db_seconds': 'Seconds spent executing statements that write rows',
+         'commit_seconds': 'Seconds spent committing transactions'}
+
+
+'''
+File-like wrapper around an S3 Key (or RangedKeyReader) that counts the bytes returned by
+read() and the time spent in it. Every other attribute is the wrapped object's.
+'''
+
+
+class MeteredReader(object):
+    def __init__(self, key):
+        self._key = key
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._key, name)
+
+    def read(self, size):
+        start = time()
+        retval = self._key.read(size)
+        self.seconds += time() - start
+        if retval:
+            self.bytes += len(retval)
+        return retval
+
+
+'''
+Wrapper around a line iterator such as BZ2KeyIterator that counts the bytes of the lines
+returned by nextbatch() and the time spent in it. If the iterator reads from a
+MeteredReader given as 'reader', the time spent reading is not counted, so 'seconds' is the
+time spent decompressing and splitting lines.
+'''
+
+
+class MeteredSource(object):
+    def __init__(self, source, reader=None):
+        self._source = source
+        self._reader = reader
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def nextbatch(self):
+        start = time()
+        before = self._reader.seconds if self._reader is not None else 0.0
+        try:
+            retval = self._source.nextbatch()
+        finally:
+            after = self._reader.seconds if self._reader is not None else 0.0
+            self.seconds += time() - start - (after - before)
+        for line in retval:
+            self.bytes += len(line)
+        return retval
+
+
+'''
+This class aggregates the metrics of the keys loaded by every worker process, which are
+dictionaries with a 'worker' and a 'key' entry plus the entries listed in 'fields'.
+
+Each record added is written as a JSON line to the file at 'jsonpath', if given. The totals
+of each worker are written by write(), as one more JSON line and as a Prometheus textfile
+(for the node_exporter textfile collector) at 'prompath', if given. The textfile is written
+to a temporary file that is renamed over it, so it is never read half written.
+'''
+
+
+class MetricsAggregator(object):
+    def __init__(self, jsonpath=None, prompath=None):
+        self.prompath = prompath
+        self.totals = {}
+        self._json = open(jsonpath, 'a') if jsonpath is not None else None
+
+    def add(self, record):
+        totals = self.totals.setdefault(record['worker'], dict([(f, 0) for f in ('keys',) + fields]))
+        totals['keys'] += 1
+        for f in fields:
+            totals[f] += record.get(f) or 0
+        if self._json is not None:
+            self._json.write(json.dumps(dict(record, type='key', time=time()), sort_keys=True) + '\n')
+
+    def write(self):
+        if self._json is not None:
+            self._json.write(json.dumps({'type': 'totals', 'time': time(), 'workers': self.totals},
+                                        sort_keys=True) + '\n')
+            self._json.flush()
+        if self.prompath is not None:
+            lines = []
+            for f in ('keys',) + fields:
+                name = 'timberslide_{0}_total'.format(f)
+                lines.append('# HELP {0} {1}'.format(name, _help[f]))
+                lines.append('# TYPE {0} counter'.format(name))
+                for worker in sorted(self.totals.keys()):
+                    lines.append('{0}{{worker="{1}"}} {2}'.format(name, worker, str(self.totals[worker][f])))
+            temp = self.prompath + '.tmp'
+            with open(temp, 'w') as out:
+                out.write('\n'.join(lines) + '\n')
+            os.rename(temp, self.prompath)
+
+    def close(self):
+        self.write()
+        if self._json is not None:
+            self._json.close()
+            self._json = None
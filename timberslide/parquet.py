@@ -0,0 +1,149 @@
+'''
+Created on 18/10/2026
+'''
+
+import logging
+import os
+import pyarrow
+import pyarrow.parquet as pq
+from timberslide.db import _create_table_query, table_columns, sqlcolnames
+from timberslide.s3repository import _slot_prefix
+# compatability shim for python3
+import sys
+if sys.version_info > (3,):
+    long = int
+
+# Arrow types of the columns of each type in the CREATE TABLE query, any type not listed
+# here (text, varchar, inet and cidr) is stored as a string
+_arrow_types = {'integer': pyarrow.int32(), 'bigint': pyarrow.int64(), 'real': pyarrow.float32(),
+                'boolean': pyarrow.bool_()}
+
+# text values PostgreSQL accepts as true for a boolean column
+_true = set(['t', 'true', 'y', 'yes', 'on', '1'])
+
+
+def _boolean(value):
+    return value if isinstance(value, bool) else value.lower() in _true
+
+
+# functions that convert values of each column type that TSVIterator left as strings
+_converters = {'integer': int, 'bigint': long, 'real': float, 'boolean': _boolean}
+
+
+'''
+This class is a sink (see PostgresSink) that writes rows to Parquet files under the
+'directory' given instead of a PostgreSQL table, with one column for every column of the
+table defined by 'query' and of the corresponding Arrow type. Columns missing from a file
+are null, and string columns are dictionary encoded since most of their values repeat.
+
+Rows of each key are written to a file named after it in the <YYYY>/<MM>/<DD>/<HH>/
+subdirectory of its slot (or in 'directory' if it has none), with the byte offset of the
+task appended to the name if it only covers part of the key. After begin(slot) is called,
+rows of all keys are written to a single file named after the slot instead, until the
+next commit. Files are written under a temporary name, as row groups of up to 'rowgroup'
+rows compressed with 'compression', and renamed into place (replacing any previous file of
+the same key or slot) on commit.
+'''
+
+
+class ParquetSink(object):
+    def __init__(self, directory, query=_create_table_query, rowgroup=65536, compression='snappy'):
+        self.directory = directory.rstrip('/') + '/'
+        self.rowgroup = rowgroup
+        self.compression = compression
+        self.columns = table_columns(query)
+        self._types = [_arrow_types.get(t, pyarrow.string()) for name, t in self.columns]
+        self.schema = pyarrow.schema([pyarrow.field(name, a) for (name, t), a in zip(self.columns, self._types)])
+        self._strings = [name for name, t in self.columns if t not in _arrow_types]
+        self._writer = None
+        self._slot = None
+        # (temporary path, final path) of the files written since the last commit
+        self._files = []
+
+    # Opens a new file to be renamed to 'path' on commit.
+    def _open(self, path):
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                if not os.path.isdir(os.path.dirname(path)):
+                    raise
+        temp = '{0}.tmp-{1}'.format(path, os.getpid())
+        self._files.append((temp, path))
+        self._writer = pq.ParquetWriter(temp, self.schema, compression=self.compression,
+                                        use_dictionary=self._strings)
+
+    # Returns the directory of a slot, or the top directory if it is None.
+    def _slotdir(self, slot):
+        return self.directory if slot is None else _slot_prefix(self.directory, slot)
+
+    def begin(self, slot):
+        self._slot = slot
+        self._open(self._slotdir(slot) + str(slot) + '.parquet')
+
+    # Writes a batch of rows given as lists in the order of 'positions', which has the index
+    # of each table column in the rows or None if it is missing.
+    def _writebatch(self, batch, positions):
+        values = list(zip(*batch)) if len(batch) > 0 else []
+        arrays = []
+        for (name, t), pos, a in zip(self.columns, positions, self._types):
+            if pos is None:
+                column = [None] * len(batch)
+            else:
+                column = values[pos] if len(batch) > 0 else []
+                convert = _converters.get(t)
+                if convert is not None:
+                    column = [v if v is None else convert(v) for v in column]
+            arrays.append(pyarrow.array(column, type=a))
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def write(self, key, slot, rows, first=None):
+        if self._slot is None:
+            name = os.path.basename(key.name) + ('' if first is None else '.{0}'.format(first))
+            self._open(self._slotdir(slot) + name + '.parquet')
+        index = dict([(c.lower(), i) for i, c in enumerate(sqlcolnames(rows.colnames))])
+        unknown = set(index.keys()) - set([c for c, t in self.columns])
+        if len(unknown) > 0:
+            raise ValueError("columns not in table: " + ", ".join(sorted(unknown)))
+        positions = [index.get(c) for c, t in self.columns]
+
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.rowgroup:
+                self._writebatch(batch, positions)
+                count = count + len(batch)
+                batch = []
+        if len(batch) > 0 or count == 0:
+            self._writebatch(batch, positions)
+            count = count + len(batch)
+        if self._slot is None:
+            self._writer.close()
+            self._writer = None
+        return count
+
+    def commit(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for temp, path in self._files:
+            os.rename(temp, path)
+            logging.debug("Wrote {0}".format(path))
+        self._files = []
+        self._slot = None
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for temp, path in self._files:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+        self._files = []
+        self._slot = None
+
+    def close(self):
+        self.abort()
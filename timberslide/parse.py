@@ -23,16 +23,42 @@ _default_func = {'net.src.port': int, 'net.dst.port': int, 'net.blocked': bool,
 # Default list of values that must be replaced with None
 _default_nonevals = set(["NA", ""])
 
+'''
+Generates and returns a function that converts one row (a list of strings) read from a TSV
+file into a new list, where values found in 'nonevals' are replaced by None and each
+function in 'func' is applied to the non-None value of the column with the same index.
+
+The nonevals replacement is done for all columns at once using map and dict.get, and code
+is only generated for columns that have a function, so pass-through text columns cost no
+Python-level work.
+'''
+
+
+def row_converter(func, nonevals=_default_nonevals):
+    namespace = {'_map': map, '_get': dict.fromkeys(nonevals).get}
+    code = ['def convert(row):',
+            '    row = _map(_get, row, row)']
+    for i in range(len(func)):
+        if func[i] is not None:
+            namespace['f' + str(i)] = func[i]
+            code.append('    if row[{0}] is not None:'.format(i))
+            code.append('        row[{0}] = f{0}(row[{0}])'.format(i))
+    code.append('    return row')
+    exec('\n'.join(code), namespace)
+    return namespace['convert']
+
+
 '''
 This class is an iterator (https://docs.python.org/2/glossary.html#term-iterator)
 over the lines of a given iterator, which will read each line each line using a CSV
 reader for tab-delimited fields.
 
 Will replace any of the values in 'nonevals' by None, and will apply any function mapped to
-the column name in 'func' to every non-None value.
+the column name in 'func' to every non-None value. The conversion is done by a function
+created once from the header by row_converter.
 
 Will return one list for each row, and the 'colnames' attribute will contain the
-corresponding column names.
+corresponding column names. nextbatch() will return a list of up to 'size' rows at a time.
 '''
 
 
@@ -45,21 +71,15 @@ class TSVIterator(object):
         for i in range(len(self.colnames)):
             if self.colnames[i] in func.keys():
                 self.func[i] = func[self.colnames[i]]
+        self._convert = row_converter(self.func, nonevals)
         self._row = 0
 
     def __iter__(self):
         return self
 
-    def next(self):
-        retval = self._reader.next()
-        self._row = self._row + 1
-        while len(retval) == 0:
-            retval = self._reader.next()
-            self._row = self._row + 1
-
-        # just a sanity check, need to do proper exception here later
-        assert(len(retval) == len(self.colnames))
-
+    # Converts a row one column at a time, used to report which column and value caused an
+    # error in the generated converter.
+    def _convertslow(self, retval):
         for i in range(len(retval)):
             if retval[i] in self.nonevals:
                 retval[i] = None
@@ -72,3 +92,40 @@ class TSVIterator(object):
                                                                                                  retval[i]))
                     raise e
         return retval
+
+    def next(self):
+        retval = self._reader.next()
+        self._row = self._row + 1
+        while len(retval) == 0:
+            retval = self._reader.next()
+            self._row = self._row + 1
+
+        # just a sanity check, need to do proper exception here later
+        assert(len(retval) == len(self.colnames))
+
+        try:
+            return self._convert(retval)
+        except Exception:
+            return self._convertslow(retval)
+
+    # Same as calling next() up to 'size' times, but avoiding the per-row call overhead.
+    def nextbatch(self, size=1024):
+        retval = []
+        reader = self._reader
+        convert = self._convert
+        ncols = len(self.colnames)
+        try:
+            while len(retval) < size:
+                row = reader.next()
+                self._row = self._row + 1
+                if len(row) == 0:
+                    continue
+                assert(len(row) == ncols)
+                try:
+                    retval.append(convert(row))
+                except Exception:
+                    retval.append(self._convertslow(row))
+        except StopIteration:
+            if len(retval) == 0:
+                raise
+        return retval
@@ -0,0 +1,228 @@
+'''
+Created on 18/10/2026
+'''
+
+from collections import deque
+from threading import Thread, Event, Lock
+from time import time
+from Queue import Queue, Full, Empty
+from timberslide.parse import TSVIterator
+
+
+# raised in a stage when another stage failed, so it stops without reporting anything
+class _Stopped(Exception):
+    pass
+
+
+'''
+This class loads a sequence of tasks in three stages connected by bounded queues, so that
+reading from S3, parsing and writing to the database overlap instead of blocking each other:
+
+ - 'read', in its own thread, calls 'open(task)' for each task, which must return an
+   iterator with a nextbatch() method returning lists of lines (e.g. BZ2KeyIterator). It
+   does the S3 requests and bz2 decompression, which releases the GIL.
+ - 'parse', in the thread that calls run(), turns the lines into rows with 'parse' (which
+   is TSVIterator by default).
+ - 'write', in its own thread, calls 'write(task, rows)' once per task, where 'rows' is an
+   iterator with a 'colnames' attribute like TSVIterator. It should write and commit them.
+   Once all rows were read, its 'parsed' and 'parse_seconds' attributes have the number of
+   rows parsed and the time spent parsing them, and its 'wait' attribute the time spent
+   waiting for them.
+
+As soon as a task has been read the next one is opened, so it is prefetched while the
+current one is still being written and committed. At most 'depth' batches of lines and
+'depth' batches of 'batchsize' rows are waiting between stages at a time.
+
+The time each stage spends working (not waiting on the queues) and the queue depths are
+returned by stats(). If a stage fails, the others stop and run() raises its exception;
+tasks that were opened but never started being written are then left in 'pending'.
+'''
+
+
+class Pipeline(object):
+    def __init__(self, tasks, open, write, depth=8, batchsize=1024, parse=TSVIterator):
+        self.tasks = tasks
+        self.open = open
+        self.write = write
+        self.batchsize = batchsize
+        self.parse = parse
+        self.pending = deque()
+        self._lines = Queue(depth)
+        self._rows = Queue(depth)
+        self._stop = Event()
+        self._lock = Lock()
+        self._error = None
+        self._busy = {'read': 0.0, 'parse': 0.0, 'write': 0.0}
+        self._maxdepth = {'lines': 0, 'rows': 0}
+        self._count = 0
+
+    # Returns a dictionary with the seconds each stage spent working, the current and
+    # maximum number of batches waiting in each queue, and the number of tasks written.
+    def stats(self):
+        retval = dict([(k + '_busy', v) for k, v in self._busy.items()])
+        retval['lines_depth'] = self._lines.qsize()
+        retval['rows_depth'] = self._rows.qsize()
+        retval['lines_maxdepth'] = self._maxdepth['lines']
+        retval['rows_maxdepth'] = self._maxdepth['rows']
+        retval['tasks'] = self._count
+        return retval
+
+    # Records the first error raised by any stage and tells the others to stop.
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    # Puts an item on one of the queues, giving up if another stage failed.
+    def _put(self, name, queue, item):
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                queue.put(item, True, 0.1)
+                break
+            except Full:
+                pass
+        self._maxdepth[name] = max(self._maxdepth[name], queue.qsize())
+
+    # Gets an item from one of the queues, giving up if another stage failed.
+    def _get(self, queue):
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                return queue.get(True, 0.1)
+            except Empty:
+                pass
+
+    def _read(self):
+        try:
+            # the time spent waiting for the next task is not counted
+            for task in self.tasks:
+                busy = time()
+                self.pending.append(task)
+                source = self.open(task)
+                self._busy['read'] += time() - busy
+                self._put('lines', self._lines, ('task', task))
+                busy = time()
+                while True:
+                    try:
+                        batch = source.nextbatch()
+                    except StopIteration:
+                        break
+                    self._busy['read'] += time() - busy
+                    self._put('lines', self._lines, ('data', batch))
+                    busy = time()
+                self._busy['read'] += time() - busy
+                self._put('lines', self._lines, ('end', None))
+            self._put('lines', self._lines, ('done', None))
+        except _Stopped:
+            pass
+        except Exception as e:
+            self._fail(e)
+
+    # Generates the lines of the current task, not counting the time spent waiting.
+    def _task_lines(self):
+        while True:
+            wait = time()
+            kind, value = self._get(self._lines)
+            self._busy['parse'] -= time() - wait
+            if kind != 'data':
+                return
+            for line in value:
+                yield line
+
+    def _write(self):
+        try:
+            while True:
+                kind, value = self._get(self._rows)
+                if kind == 'done':
+                    return
+                task, colnames = value
+                self.pending.popleft()
+                rows = _QueueRows(self, colnames)
+                busy = time()
+                self.write(task, rows)
+                for row in rows:
+                    pass
+                self._busy['write'] += time() - busy - rows.wait
+                self._count += 1
+        except _Stopped:
+            pass
+        except Exception as e:
+            self._fail(e)
+
+    # Runs all stages until every task is written, raising the error of any stage that fails.
+    def run(self):
+        threads = [Thread(target=self._read, name='read'), Thread(target=self._write, name='write')]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        try:
+            while True:
+                kind, task = self._get(self._lines)
+                if kind == 'done':
+                    self._put('rows', self._rows, ('done', None))
+                    break
+                before = self._busy['parse']
+                count = 0
+                busy = time()
+                rows = self.parse(self._task_lines())
+                self._busy['parse'] += time() - busy
+                self._put('rows', self._rows, ('task', (task, rows.colnames)))
+                while True:
+                    busy = time()
+                    try:
+                        batch = rows.nextbatch(self.batchsize)
+                    except StopIteration:
+                        break
+                    finally:
+                        self._busy['parse'] += time() - busy
+                    count += len(batch)
+                    self._put('rows', self._rows, ('data', batch))
+                self._put('rows', self._rows, ('end', (count, self._busy['parse'] - before)))
+        except _Stopped:
+            pass
+        except Exception as e:
+            self._fail(e)
+
+        for t in threads:
+            t.join()
+        if self._error is not None:
+            raise self._error
+
+
+# Iterator over the rows of one task that the parse stage puts on the rows queue, with the
+# time spent waiting for them in the 'wait' attribute, and the number of rows and time
+# taken by the parse stage in 'parsed' and 'parse_seconds' once they were all read.
+class _QueueRows(object):
+    def __init__(self, pipeline, colnames):
+        self.colnames = colnames
+        self.wait = 0.0
+        self.parsed = None
+        self.parse_seconds = None
+        self._pipeline = pipeline
+        self._batch = []
+        self._pos = 0
+        self._end = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while self._pos >= len(self._batch):
+            if self._end:
+                raise StopIteration
+            wait = time()
+            kind, value = self._pipeline._get(self._pipeline._rows)
+            self.wait += time() - wait
+            if kind == 'end':
+                self._end = True
+                self.parsed, self.parse_seconds = value
+            else:
+                self._batch = value
+                self._pos = 0
+        self._pos += 1
+        return self._batch[self._pos - 1]
@@ -0,0 +1,234 @@
+'''
+Created on 18/10/2026
+'''
+
+import logging
+from argparse import ArgumentTypeError
+from re import compile
+from timberslide.db import _create_table_query, is_valid_id, column_types, sqlcolnames, replace_slot
+# compatability shim for python3
+import sys
+if sys.version_info > (3,):
+    long = int
+
+_measureregex = compile('^(?P<func>sum|min|max)\\((?P<column>[a-z][a-z0-9_]*)\\)$')
+
+# functions that convert values of each numeric column type, for the columns TSVIterator
+# leaves as strings
+_converters = {'integer': int, 'bigint': long, 'real': float}
+
+# type of the sum of a column of each numeric type, wide enough not to overflow
+_sumtypes = {'integer': 'bigint', 'bigint': 'numeric', 'real': 'double precision'}
+
+# expression that merges the value of a measure of each function already in the table
+# with the one being upserted, ignoring NULLs (sums of NULLs only) like the functions do
+_merges = {'sum': 'COALESCE({0}.{1} + EXCLUDED.{1}, {0}.{1}, EXCLUDED.{1})',
+           'min': 'LEAST({0}.{1}, EXCLUDED.{1})', 'max': 'GREATEST({0}.{1}, EXCLUDED.{1})',
+           'count': '{0}.{1} + EXCLUDED.{1}'}
+
+
+'''
+This class describes a rollup table, with one row of 'measures' for each combination of the
+values of the 'dimensions' columns of the table defined by 'query' (by default the one
+loaded by timberslide). Each measure is either 'count', the number of rows, or
+'sum(<column>)', 'min(<column>)' or 'max(<column>)' of a numeric column, which are stored
+in the row_count and <function>_<column> columns of the rollup table respectively.
+
+yyyymmddhh is always the first dimension, so rollups are at most hourly and the rows of a
+slot can be replaced like those of the table (see replace_slot).
+'''
+
+
+class Rollup(object):
+    def __init__(self, table, dimensions, measures=('sum(agg_count)',), query=_create_table_query):
+        self.table = is_valid_id(table)
+        types = column_types(query)
+        self.dimensions = ['yyyymmddhh'] + [d.lower() for d in dimensions if d.lower() != 'yyyymmddhh']
+        for d in self.dimensions:
+            if d not in types:
+                raise ValueError("dimension {0} is not a column of the table".format(d))
+        if len(set(self.dimensions)) != len(self.dimensions):
+            raise ValueError("dimensions are repeated")
+        # (function, column or None, rollup column, rollup column type, converter) tuples
+        self.measures = []
+        for spec in measures:
+            spec = spec.lower()
+            if spec == 'count':
+                self.measures.append(('count', None, 'row_count', 'bigint', None))
+                continue
+            match = _measureregex.match(spec)
+            if match is None:
+                raise ValueError("measure {0} is not count, sum(<column>), min(<column>) or max(<column>)".format(spec))
+            func, column = match.group('func'), match.group('column')
+            if types.get(column) not in _converters:
+                raise ValueError("measure column {0} is not a numeric column of the table".format(column))
+            self.measures.append((func, column, func + '_' + column,
+                                  _sumtypes[types[column]] if func == 'sum' else types[column], _converters[types[column]]))
+        if len(self.measures) == 0:
+            raise ValueError("no measures given")
+        if len(set([m[2] for m in self.measures])) != len(self.measures):
+            raise ValueError("measures are repeated")
+        self.columns = [(d, types[d]) for d in self.dimensions] + [(m[2], m[3]) for m in self.measures]
+
+    # Creates the rollup table if it does not exist, with a unique index on the dimensions
+    # that upserts are matched against. On PostgreSQL 15 or newer NULLs are matched as equal
+    # values; on older servers rows with NULL dimensions are never merged, which only makes
+    # the table larger since queries group them anyway.
+    def create(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS {0} ({1});".format(
+            self.table, ", ".join(["{0} {1}".format(c, t) for c, t in self.columns])))
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS {0}_dims_key ON {0} ({1}){2};".format(
+            self.table, ", ".join(self.dimensions), ' NULLS NOT DISTINCT' if conn.server_version >= 150000 else ''))
+        cursor.close()
+
+    # Adds the rows of a dictionary of groups filled by an aggregator to the rollup table,
+    # merging them with the existing rows of the same groups. Groups are written in order,
+    # so that concurrent upserts from other workers lock rows in the same order and cannot
+    # deadlock. Returns the number of groups written. The transaction is left open.
+    def upsert(self, conn, groups, chunksize=1024):
+        cursor = conn.cursor()
+        qmain = "INSERT INTO {0} AS r ({1}) VALUES ".format(self.table, ", ".join([c for c, t in self.columns]))
+        qend = " ON CONFLICT ({0}) DO UPDATE SET {1};".format(
+            ", ".join(self.dimensions), ", ".join(["{0} = {1}".format(m[2], _merges[m[0]].format('r', m[2]))
+                                                  for m in self.measures]))
+        qval = "(" + ", ".join(["%s"] * len(self.columns)) + ")"
+        keys = sorted(groups.keys())
+        for i in range(0, len(keys), chunksize):
+            cursor.execute(qmain + ",".join([cursor.mogrify(qval, k + tuple(groups[k]))
+                                             for k in keys[i:i+chunksize]]) + qend)
+        cursor.close()
+        return len(keys)
+
+
+'''
+Parses a --rollup argument in <table>:<dimension>,...[:<measure>,...] format into a Rollup,
+with the sum of agg_count as the only measure by default.
+'''
+
+
+def parse_rollup(spec):
+    parts = spec.split(':')
+    if len(parts) not in (2, 3):
+        raise ArgumentTypeError("rollup must be in <table>:<dimension>,...[:<measure>,...] format")
+    try:
+        return Rollup(parts[0], [d for d in parts[1].split(',') if d != ''],
+                      *([[m for m in parts[2].split(',') if m != '']] if len(parts) == 3 else []))
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+
+
+'''
+Generates and returns a function that adds one row with the given column names (as in a
+TSV file) to the groups of each Rollup, given as a list of dictionaries in the same order
+as 'rollups' that map the tuple of values of the dimensions of each group to the list of
+values of its measures. Dimensions missing from the columns are None.
+
+Like row_converter, the code is generated for the columns once, so that each row only
+costs a dictionary lookup and a few additions per rollup.
+'''
+
+
+def aggregator(rollups, colnames, groups):
+    index = dict([(c.lower(), i) for i, c in enumerate(sqlcolnames(colnames))])
+    namespace = {}
+    code = ['def update(row):']
+    for r in range(len(rollups)):
+        rollup = rollups[r]
+        namespace['g' + str(r)] = groups[r]
+        key = ", ".join(['row[{0}]'.format(index[d]) if d in index else 'None' for d in rollup.dimensions])
+        code.append('    key = ({0},)'.format(key))
+        code.append('    g = g{0}.get(key)'.format(r))
+        # values of the measures in this row, None if their column is missing or NULL
+        values = []
+        for m in range(len(rollup.measures)):
+            func, column, name, t, convert = rollup.measures[m]
+            if func == 'count':
+                values.append('1')
+            elif column not in index:
+                values.append('None')
+            else:
+                namespace['f{0}_{1}'.format(r, m)] = convert
+                code.append('    v{0} = row[{1}]'.format(m, index[column]))
+                code.append('    if v{0} is not None:'.format(m))
+                code.append('        v{0} = f{1}_{0}(v{0})'.format(m, r))
+                values.append('v{0}'.format(m))
+        code.append('    if g is None:')
+        code.append('        g{0}[key] = [{1}]'.format(r, ", ".join(values)))
+        code.append('    else:')
+        for m in range(len(rollup.measures)):
+            func, v = rollup.measures[m][0], values[m]
+            if func == 'count':
+                code.append('        g[{0}] += 1'.format(m))
+            elif v != 'None':
+                code.append('        if {0} is not None:'.format(v))
+                if func == 'sum':
+                    code.append('            g[{0}] = {1} if g[{0}] is None else g[{0}] + {1}'.format(m, v))
+                else:
+                    code.append('            if g[{0}] is None or {1} {2} g[{0}]:'.format(m, v, '<' if func == 'min' else '>'))
+                    code.append('                g[{0}] = {1}'.format(m, v))
+        code.append('        pass')
+    exec('\n'.join(code), namespace)
+    return namespace['update']
+
+
+# Iterator over the rows of a TSV Iterator that adds each of them to the groups of the
+# rollups as it goes, with the same 'colnames' attribute.
+class _RollupRows(object):
+    def __init__(self, rows, rollups, groups):
+        self.colnames = rows.colnames
+        self._rows = rows
+        self._update = aggregator(rollups, rows.colnames, groups)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        row = self._rows.next()
+        self._update(row)
+        return row
+
+
+'''
+This class is a sink (see PostgresSink) that writes rows to another 'sink' and also adds
+them to in-memory hash aggregates of each of the given 'rollups', which are upserted into
+their tables through 'conn' (the connection of the sink, so both are committed in the same
+transaction) when the sink is committed. Groups are merged with the rows already in the
+tables, so rollups written by several workers add up. begin(slot) also replaces the rows of
+the slot in the rollup tables.
+'''
+
+
+class RollupSink(object):
+    def __init__(self, sink, conn, rollups):
+        self.sink = sink
+        self.conn = conn
+        self.rollups = rollups
+        self._groups = [{} for r in rollups]
+
+    def _clear(self):
+        self._groups = [{} for r in self.rollups]
+
+    def begin(self, slot):
+        self._clear()
+        self.sink.begin(slot)
+        for r in self.rollups:
+            replace_slot(self.conn, r.table, slot)
+
+    def write(self, key, slot, rows, first=None):
+        return self.sink.write(key, slot, _RollupRows(rows, self.rollups, self._groups), first)
+
+    def commit(self):
+        for r, groups in zip(self.rollups, self._groups):
+            count = r.upsert(self.conn, groups)
+            logging.debug("Upserted {0} groups into {1}".format(count, r.table))
+        self._clear()
+        self.sink.commit()
+
+    def abort(self):
+        self._clear()
+        self.sink.abort()
+
+    def close(self):
+        self._clear()
+        self.sink.close()
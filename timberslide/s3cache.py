@@ -0,0 +1,178 @@
+'''
+Created on 18/10/2026
+'''
+
+import errno
+import logging
+import os
+import tempfile
+from hashlib import sha1
+from time import time
+from timberslide.filerepository import FileKey
+
+# prefix of the temporary files being filled, which are not entries of the cache yet
+_fillprefix = '.fill-'
+# seconds after which a temporary file is considered abandoned by a failed load
+_stale = 24 * 3600
+
+
+'''
+This class is a read-through cache of S3 objects in a local directory, which may be shared
+by several processes (e.g. all InserterProcess workers and concurrent runs). Entries are
+files named after a hash of the key name followed by a hash of its ETag, so an object that
+changed is never read from the cache.
+
+get() returns a FileKey over the cached copy of a boto S3 Key, or None if there is none.
+fill() wraps the file-like object the key is being read from (the key itself or e.g. a
+RangedKeyReader) so that everything read is also written to a temporary file in the
+directory, which is renamed into place only once the end of the object was read with the
+expected size. Renames are atomic, so other processes see either no entry or a complete
+one, and concurrent fills of the same object just replace each other.
+
+The entries are kept under 'maxsize' bytes by deleting the least recently used ones after
+each fill, with the modification time of the files marking their last use. Files of the
+cache that are deleted while being read stay readable until they are closed.
+'''
+
+
+class S3Cache(object):
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST or not os.path.isdir(path):
+                raise
+
+    # Returns the path of the entry of a key name and ETag.
+    def _entry(self, name, etag):
+        return os.path.join(self.path, sha1(name).hexdigest() + '-' + sha1(etag).hexdigest())
+
+    # Returns a FileKey over the cached copy of a boto S3 Key, or None if it is not cached.
+    def get(self, key):
+        if key.etag is None:
+            return None
+        path = self._entry(key.name, key.etag)
+        try:
+            # mapped for as long as the key is used, so it can still be read if evicted by
+            # another process
+            retval = FileKey(key.name, path, key.etag, keep=True)
+            os.utime(path, None)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return retval
+
+    # Returns a file-like object that reads from 'reader' and stores what it read as the
+    # entry of 'key' once all of it was read.
+    def fill(self, key, reader):
+        return _FillReader(self, key, reader)
+
+    # Moves a complete temporary file into place as the entry of a key, removing the entries
+    # of other versions of it, and evicts entries if needed.
+    def _store(self, key, temp):
+        path = self._entry(key.name, key.etag)
+        os.rename(temp, path)
+        prefix = os.path.basename(path).split('-')[0] + '-'
+        for name in os.listdir(self.path):
+            if name.startswith(prefix) and os.path.join(self.path, name) != path:
+                self._remove(os.path.join(self.path, name))
+        logging.debug("Cached {0} as {1}".format(key.name, path))
+        self.evict(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    # Deletes the least recently used entries until they take up at most 'maxsize' bytes,
+    # never deleting the entry at 'keep', as well as abandoned temporary files.
+    def evict(self, keep=None):
+        now = time()
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.startswith(_fillprefix):
+                if now - st.st_mtime > _stale:
+                    self._remove(path)
+            else:
+                entries.append((st.st_mtime, path, st.st_size))
+                total = total + st.st_size
+        for mtime, path, size in sorted(entries):
+            if total <= self.maxsize:
+                break
+            if path != keep:
+                self._remove(path)
+                total = total - size
+
+
+# File-like object returned by S3Cache.fill(). Every other attribute is the wrapped reader's.
+class _FillReader(object):
+    def __init__(self, cache, key, reader):
+        self._cache = cache
+        self._key = key
+        self._reader = reader
+        self._file = None
+        self._temp = None
+        self._written = 0
+        if key.etag is not None:
+            try:
+                handle, self._temp = tempfile.mkstemp(prefix=_fillprefix, dir=cache.path)
+                self._file = os.fdopen(handle, 'wb')
+            except (IOError, OSError) as e:
+                logging.warning("Could not cache {0}: {1}".format(key.name, repr(e)))
+                self._discard()
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+    def read(self, size):
+        data = self._reader.read(size)
+        if self._file is not None:
+            try:
+                if data:
+                    self._file.write(data)
+                    self._written = self._written + len(data)
+                else:
+                    self._finish()
+            except (IOError, OSError) as e:
+                # the cache is best effort, a full disk must not fail the load
+                logging.warning("Could not cache {0}: {1}".format(self._key.name, repr(e)))
+                self._discard()
+        return data
+
+    # Stores the temporary file as the entry of the key if the whole object was read.
+    def _finish(self):
+        self._file.close()
+        self._file = None
+        if self._written == self._key.size:
+            self._cache._store(self._key, self._temp)
+        else:
+            self._cache._remove(self._temp)
+        self._temp = None
+
+    # Deletes the temporary file, if any.
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._temp is not None:
+            self._cache._remove(self._temp)
+            self._temp = None
+
+    # Closes the wrapped reader, discarding what was read if it was not read to the end.
+    def close(self, *args, **kwargs):
+        self._discard()
+        if hasattr(self._reader, 'close'):
+            self._reader.close(*args, **kwargs)
@@ -0,0 +1,130 @@
+'''
+Created on 18/10/2026
+'''
+
+import sqlite3
+import logging
+from re import compile, escape
+from time import time
+from boto.s3.key import Key
+from timberslide.slots import Slot
+
+_schema = '''
+    CREATE TABLE IF NOT EXISTS state (location TEXT PRIMARY KEY, refreshed REAL);
+    CREATE TABLE IF NOT EXISTS keys (name TEXT PRIMARY KEY, slot TEXT NOT NULL, size INTEGER, etag TEXT);
+    CREATE INDEX IF NOT EXISTS keys_slot ON keys (slot);
+    CREATE TABLE IF NOT EXISTS invalid (slot TEXT PRIMARY KEY);
+'''
+
+
+'''
+This class is a local index of the keys in a S3Repository, stored in a SQLite database file,
+that allows the slot boundaries and the keys of a slot to be found without listing S3.
+
+The first refresh lists the whole repository. Further refreshes only list keys starting at
+the latest hour already in the index (using a marker, so a single listing is needed no
+matter how many hours are new), plus any slots explicitly invalidated. The index is
+refreshed automatically when queried if it is older than 'maxage' seconds, or if there are
+invalidated slots.
+'''
+
+
+class S3Index(object):
+    def __init__(self, path, repo, maxage=3600):
+        self.path = path
+        self.repo = repo
+        self.maxage = maxage
+        self._keyregex = compile('^' + escape(repo.prefix) +
+                                 '(?P<y>[0-9]{4})/(?P<m>[0-9]{2})/(?P<d>[0-9]{2})/(?P<h>[0-9]{2})/')
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_schema)
+        row = self._db.execute('SELECT location FROM state;').fetchone()
+        if row is None:
+            self._db.execute('INSERT INTO state (location, refreshed) VALUES (?, NULL);', (repo.location,))
+            self._db.commit()
+        elif row[0] != repo.location:
+            raise ValueError("index at {0} belongs to repository {1}".format(path, row[0]))
+
+    def close(self):
+        self._db.close()
+
+    # Adds the boto S3 Key instances given to the index, ignoring those that are not
+    # inside an hour prefix.
+    def _add(self, keys):
+        rows = []
+        for key in keys:
+            m = self._keyregex.match(key.name)
+            if m is not None:
+                rows.append((key.name, m.group('y') + m.group('m') + m.group('d') + m.group('h'),
+                             key.size, key.etag))
+        self._db.executemany('INSERT OR REPLACE INTO keys (name, slot, size, etag) VALUES (?, ?, ?, ?);', rows)
+        return len(rows)
+
+    # Marks a Slot to be listed again on the next refresh.
+    def invalidate(self, slot):
+        self._db.execute('INSERT OR REPLACE INTO invalid (slot) VALUES (?);', (str(slot),))
+        self._db.commit()
+
+    # Updates the index by listing the latest hour in the index and everything after it,
+    # as well as any invalidated slots.
+    def refresh(self):
+        self.repo._open()
+        bucket = self.repo._bucket
+        last = self._db.execute('SELECT max(slot) FROM keys;').fetchone()[0]
+        if last is None:
+            count = self._add(bucket.list(self.repo.prefix))
+        else:
+            self._db.execute('DELETE FROM keys WHERE slot >= ?;', (last,))
+            marker = self.repo.get_slot_prefix(Slot(str(last)))
+            count = self._add(bucket.list(self.repo.prefix, marker=marker[0:len(marker)-1]))
+        logging.debug("Indexed {0} keys from {1} after slot {2}".format(count, self.repo.location, last))
+
+        for row in self._db.execute('SELECT slot FROM invalid;').fetchall():
+            slot = Slot(str(row[0]))
+            self._db.execute('DELETE FROM keys WHERE slot BETWEEN ? AND ?;',
+                             (slot.slot.ljust(10, '0'), slot.slot.ljust(10, '9')))
+            count = self._add(bucket.list(self.repo.get_slot_prefix(slot)))
+            logging.debug("Indexed {0} keys from invalidated slot {1}".format(count, slot))
+        self._db.execute('DELETE FROM invalid;')
+        self._db.execute('UPDATE state SET refreshed = ?;', (time(),))
+        self._db.commit()
+
+    # Refreshes the index if it is too old or there are invalidated slots.
+    def _fresh(self):
+        refreshed = self._db.execute('SELECT refreshed FROM state;').fetchone()[0]
+        invalid = self._db.execute('SELECT count(*) FROM invalid;').fetchone()[0]
+        if refreshed is None or time() - refreshed > self.maxage or invalid > 0:
+            self.refresh()
+
+    # Returns the slot with the given aggregate (min or max) of all indexed slots.
+    def _slot(self, aggregate):
+        self._fresh()
+        slot = self._db.execute('SELECT {0}(slot) FROM keys;'.format(aggregate)).fetchone()[0]
+        if slot is None:
+            raise Exception("repository empty or not consistent")
+        return Slot(str(slot))
+
+    # Returns the earliest slot for which there is data in the repository.
+    def get_min_slot(self):
+        return self._slot('min')
+
+    # Returns the latest slot for which there is data in the repository.
+    def get_max_slot(self):
+        return self._slot('max')
+
+    # Returns a list of boto S3 Key class instances associated with a given slot or
+    # iterable of slots, with the size and etag attributes set.
+    def get_slot_keys(self, slots):
+        self._fresh()
+        self.repo._open()
+        if isinstance(slots, Slot):
+            slots = [slots]
+        retval = {}
+        for slot in slots:
+            for name, size, etag in self._db.execute('SELECT name, size, etag FROM keys WHERE slot BETWEEN ? AND ?;',
+                                                     (slot.slot.ljust(10, '0'), slot.slot.ljust(10, '9'))):
+                key = Key(self.repo._bucket, str(name))
+                key.size = size
+                key.etag = str(etag) if etag is not None else None
+                retval[key.name] = key
+        return list(retval.values())
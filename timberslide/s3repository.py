@@ -6,14 +6,49 @@ Created on 30/12/2014
 
 from re import compile
 from boto.s3 import connect_to_region
-from boto.s3.connection import OrdinaryCallingFormat
+from boto.s3.connection import OrdinaryCallingFormat, S3Connection
 from bz2 import BZ2Decompressor
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from threading import local
+from time import sleep
 from timberslide.slots import Slot
+from timberslide.s3index import S3Index
 import logging
 
 _bucketregex = compile("^s3://(?P<bucket>[^/]+)/(?P<prefix>.*?)/?$")
 _yregex = compile("/(?P<val>[0-9]{4})/$")
 _mdhregex = compile("/(?P<val>[0-9]{2})/$")
+_keyregex = compile("^(?P<y>[0-9]{4})/(?P<m>[0-9]{2})/(?P<d>[0-9]{2})/(?P<h>[0-9]{2})/")
+_lineregex = compile("[^\n]*\n|[^\n]+$")
+# stream header followed by the first block header, which is how every bzip2 stream starts
+_streamregex = compile("BZh[1-9]1AY&SY")
+_streamheaderlen = 10
+
+
+# Returns the prefix of a slot in a repository with the given prefix, e.g. 'prefix/2014/01/'.
+def _slot_prefix(prefix, slot):
+    retval = prefix + format(slot.year(), "04") + '/'
+    if slot.month() is None:
+        return retval
+    retval = retval + format(slot.month(), "02") + '/'
+    if slot.day() is None:
+        return retval
+    retval = retval + format(slot.day(), "02") + '/'
+    if slot.hour() is None:
+        return retval
+    return retval + format(slot.hour(), "02") + '/'
+
+
+# Returns the hour Slot of a key name in a repository with the given prefix, or None if it
+# is not under an hour prefix.
+def _key_slot(prefix, name):
+    if not name.startswith(prefix):
+        return None
+    m = _keyregex.match(name[len(prefix):])
+    if m is None:
+        return None
+    return Slot(m.group('y') + m.group('m') + m.group('d') + m.group('h'))
 
 
 '''
@@ -21,11 +56,21 @@ This class encapsulates access to an S3 bucket and prefix where data files are s
 using the <prefix>/<YYYY>/<MM>/<DD>/<HH>/ prefixes according to the slot.
 
 It will allow all S3 Key objects associated with a Slot set to be easily obtained.
+
+If 'index' is the path to a SQLite database file, slot boundaries and keys will be obtained
+from a local S3Index stored in it, which is refreshed if older than 'maxage' seconds.
+
+Slot prefixes are listed by up to 'listthreads' threads at a time, each with its own
+connection.
+
+If 'endpoint' is given in host[:port] format, it is used over plain HTTP instead of the
+AWS endpoint of 'region', e.g. for a local S3 stand-in such as moto_server or MinIO.
 '''
 
 
 class S3Repository(object):
-    def __init__(self, location, profile=None, region='us-west-2'):
+    def __init__(self, location, profile=None, region='us-west-2', index=None, maxage=3600, listthreads=1,
+                 endpoint=None):
         m = _bucketregex.match(location)
         if m is None:
             raise ValueError("location is not valid")
@@ -38,121 +83,167 @@ class S3Repository(object):
         self._maxslot = None
         self._conn = None
         self._bucket = None
+        self._local = local()
+        self.requests = 0
+        self.listthreads = listthreads
+        self.endpoint = endpoint
+        self.index = None if index is None else S3Index(index, self, maxage)
+
+    # Returns a new boto S3 connection to the region or endpoint of the repository.
+    def _connect(self):
+        if self.endpoint is None:
+            return connect_to_region(self.region, calling_format=OrdinaryCallingFormat())
+        host, _, port = self.endpoint.partition(':')
+        return S3Connection(host=host, port=int(port) if port else None, is_secure=False,
+                            calling_format=OrdinaryCallingFormat())
 
     def _open(self):
         if self._conn is None:
-            self._conn = connect_to_region(self.region, calling_format=OrdinaryCallingFormat())
+            self._conn = self._connect()
             self._bucket = self._conn.get_bucket(self.bucket, validate=False)
 
+    # Issues a single LIST request and returns the boto ResultSet, counting the requests
+    # made in the 'requests' attribute.
+    def _list_once(self, prefix, delimiter='', marker='', max_keys=1000):
+        self._open()
+        self.requests = self.requests + 1
+        return self._bucket.get_all_keys(prefix=prefix, delimiter=delimiter, marker=marker, max_keys=max_keys)
+
+    # Returns the largest value of the two or four digit component found with 'regex' in
+    # the names of the prefixes immediately below 'prefix'.
+    def _max_component(self, prefix, regex, level):
+        retval = None
+        marker = ''
+        while True:
+            listing = self._list_once(prefix, '/', marker)
+            for p in listing:
+                m = regex.search(p.name)
+                if m is not None and (retval is None or m.group('val') > retval):
+                    retval = m.group('val')
+            if not listing.is_truncated:
+                break
+            marker = listing.next_marker or listing[len(listing)-1].name
+        if retval is None:
+            raise Exception("repository empty or not consistent (" + level + ")")
+        return retval
+
+    # Finds both the earliest and latest slots for which there is data in the repository.
+    #
+    # Since keys are listed in lexicographical order, the earliest is the slot of the first
+    # key under an hour prefix, which is found with a max-keys=1 listing (followed by more
+    # of those starting after any key that is not under an hour prefix). S3 can only list
+    # in ascending order, so the latest still needs one delimiter listing per level, but
+    # each of those is a single request. The number of requests made is logged and added
+    # to the 'requests' attribute.
+    def _find_slots(self):
+        before = self.requests
+        marker = ''
+        # keys that are not data (e.g. placeholders) sort first, so pages are scanned locally
+        while self._minslot is None:
+            listing = self._list_once(self.prefix, marker=marker)
+            if len(listing) == 0:
+                raise Exception("repository empty or not consistent (first key)")
+            for key in listing:
+                m = _keyregex.match(key.name[len(self.prefix):])
+                if m is not None:
+                    self._minslot = Slot(m.group('y') + m.group('m') + m.group('d') + m.group('h'))
+                    break
+            marker = listing[len(listing)-1].name
+
+        if self._maxslot is None:
+            year = self._max_component(self.prefix, _yregex, 'year')
+            month = self._max_component(self.prefix+year+'/', _mdhregex, 'month')
+            day = self._max_component(self.prefix+year+'/'+month+'/', _mdhregex, 'day')
+            hour = self._max_component(self.prefix+year+'/'+month+'/'+day+'/', _mdhregex, 'hour')
+            self._maxslot = Slot(year+month+day+hour)
+
+        logging.debug("Slots in repository go from {0} to {1}, found with {2} requests".format(
+            self._minslot, self._maxslot, self.requests - before))
+
     # Returns the earliest slot for which there is data in the repository,
     # in YYYYMMDDHH format.
     def get_min_slot(self):
+        if self._minslot is None and self.index is not None:
+            self._minslot = self.index.get_min_slot()
         if self._minslot is None:
-            self._open()
-
-            # find smallest year
-            year = [int(_yregex.search(s.name).group('val'))
-                    for s in self._bucket.list(self.prefix, '/')]
-            if len(year) == 0:
-                raise Exception("repository empty or not consistent (year)")
-            year = format(min(year), "04")
-
-            # find smallest month
-            month = [int(_mdhregex.search(s.name).group('val'))
-                     for s in self._bucket.list(self.prefix+year+'/', '/')]
-            if len(month) == 0:
-                raise Exception("repository empty or not consistent (month)")
-            month = format(min(month), "02")
-
-            # find smallest day
-            day = [int(_mdhregex.search(s.name).group('val'))
-                   for s in self._bucket.list(self.prefix+year+'/'+month+'/', '/')]
-            if len(day) == 0:
-                raise Exception("repository empty or not consistent (day)")
-            day = format(min(day), "02")
-
-            # find smallest hour
-            hour = [int(_mdhregex.search(s.name).group('val'))
-                    for s in self._bucket.list(self.prefix+year+'/'+month+'/'+day+'/', '/')]
-            if len(hour) == 0:
-                raise Exception("repository empty or not consistent (hour)")
-            hour = format(min(hour), "02")
-
-            self._minslot = Slot(year+month+day+hour)
-            logging.debug("Smallest slot in repository is "+str(self._minslot))
+            self._find_slots()
         return self._minslot
 
     # Returns the latest slot for which there is data in the repository,
     # in YYYYMMDDHH format.
     def get_max_slot(self):
+        if self._maxslot is None and self.index is not None:
+            self._maxslot = self.index.get_max_slot()
         if self._maxslot is None:
-            self._open()
-
-            # find smallest year
-            year = [int(_yregex.search(s.name).group('val'))
-                    for s in self._bucket.list(self.prefix, '/')]
-            if len(year) == 0:
-                raise Exception("repository empty or not consistent (year)")
-            year = format(max(year), "04")
-
-            # find smallest month
-            month = [int(_mdhregex.search(s.name).group('val'))
-                     for s in self._bucket.list(self.prefix+year+'/', '/')]
-            if len(month) == 0:
-                raise Exception("repository empty or not consistent (month)")
-            month = format(max(month), "02")
-
-            # find smallest day
-            day = [int(_mdhregex.search(s.name).group('val'))
-                   for s in self._bucket.list(self.prefix+year+'/'+month+'/', '/')]
-            if len(day) == 0:
-                raise Exception("repository empty or not consistent (day)")
-            day = format(max(day), "02")
-
-            # find smallest hour
-            hour = [int(_mdhregex.search(s.name).group('val'))
-                    for s in self._bucket.list(self.prefix+year+'/'+month+'/'+day+'/', '/')]
-            if len(hour) == 0:
-                raise Exception("repository empty or not consistent (hour)")
-            hour = format(max(hour), "02")
-
-            self._maxslot = Slot(year+month+day+hour)
-            logging.debug("Biggest slot in repository is "+str(self._maxslot))
+            self._find_slots()
         return self._maxslot
 
     # Returns the S3 prefix associated with a given slot.
     def get_slot_prefix(self, slot):
-        retval = self.prefix + format(slot.year(), "04") + '/'
-        if slot.month() is None:
-            return retval
-        retval = retval + format(slot.month(), "02") + '/'
-        if slot.day() is None:
-            return retval
-        retval = retval + format(slot.day(), "02") + '/'
-        if slot.hour() is None:
-            return retval
-        return retval + format(slot.hour(), "02") + '/'
-
-    # Returns a list of boto S3 Key class instances associated with a given slot.
+        return _slot_prefix(self.prefix, slot)
+
+    # Returns the bucket to be used by the current thread, since boto connections cannot
+    # be shared between threads.
+    def _thread_bucket(self):
+        if getattr(self._local, 'bucket', None) is None:
+            self._local.bucket = self._connect().get_bucket(self.bucket, validate=False)
+        return self._local.bucket
+
+    # Returns a list with all keys under a prefix, using the current thread's connection.
+    def _list_prefix(self, prefix):
+        return list(self._thread_bucket().list(prefix))
+
+    # Returns the hour Slot of a key name, or None if it is not under an hour prefix.
+    def get_key_slot(self, name):
+        return _key_slot(self.prefix, name)
+
+    # Returns a list of boto S3 Key class instances associated with a given slot or
+    # iterable of slots, without repeated key names.
     def get_slot_keys(self, slots):
-        self._open()
-        retval = set()
+        if self.index is not None:
+            return self.index.get_slot_keys(slots)
         if isinstance(slots, Slot):
             slots = [slots]
-        for slot in slots:
-            for key in self._bucket.list(self.get_slot_prefix(slot)):
-                retval.add(key)
-        return list(retval)
+        prefixes = [self.get_slot_prefix(slot) for slot in slots]
+        if self.listthreads > 1 and len(prefixes) > 1:
+            pool = ThreadPool(min(self.listthreads, len(prefixes)))
+            try:
+                listings = pool.map(self._list_prefix, prefixes)
+            finally:
+                pool.close()
+        else:
+            self._open()
+            listings = [self._bucket.list(prefix) for prefix in prefixes]
+
+        retval = {}
+        for listing in listings:
+            for key in listing:
+                retval[key.name] = key
+        return list(retval.values())
 
     # Returns a boto S3 Key class instance for a given prefix.
     def get_prefix_key(self, prefix):
         self._open()
         return self._bucket.get_key(prefix)
 
+    # Returns the bytes from 'start' to 'end' (inclusive) of a boto S3 Key, using the
+    # current thread's connection. Fails if the key changed since it was listed.
+    def get_range(self, key, start, end):
+        headers = {'Range': 'bytes={0}-{1}'.format(start, end)}
+        if key.etag is not None:
+            headers['If-Match'] = key.etag
+        return self._thread_bucket().get_key(key.name, validate=False).get_contents_as_string(headers=headers)
+
 
 '''
 This class is an iterator (https://docs.python.org/2/glossary.html#term-iterator)
 over the lines of an S3 Key object that also decompresses the contents using BZ2.
+
+Each decompressed chunk is kept as is and lines are handed out by moving a read offset
+through it, so only the partial line at the end of a chunk is ever copied (into a
+bytearray that is completed by the next chunk). Besides next(), nextbatch() returns all
+lines available in the current chunk at once. 'bufsize' is the number of compressed bytes
+read from the key at a time.
 '''
 
 
@@ -161,30 +252,427 @@ class BZ2KeyIterator(object):
         self.key = key
         self.bufsize = bufsize
         self._decomp = BZ2Decompressor()
-        self._lines = []
+        self._data = ''
+        self._pos = 0
+        self._end = 0
+        self._tail = bytearray()
         self._done = False
 
     def __iter__(self):
         return self
 
+    # Decompresses a chunk of data read from the key, starting a new decompressor whenever
+    # a stream ends since files may contain several concatenated streams (e.g. pbzip2
+    # output). Returns None if the chunk is empty and the last stream has ended.
+    def _decompress(self, chunk):
+        try:
+            data = self._decomp.decompress(chunk)
+        except EOFError:
+            if len(chunk) == 0:
+                return None
+            self._decomp = BZ2Decompressor()
+            data = self._decomp.decompress(chunk)
+        while len(self._decomp.unused_data) > 0:
+            rest = self._decomp.unused_data
+            self._decomp = BZ2Decompressor()
+            data = data + self._decomp.decompress(rest)
+        return data
+
+    # Returns the next piece of decompressed data, or None if there is nothing left.
+    def _read(self):
+        chunk = self.key.read(self.bufsize)
+        if chunk is None:
+            return None
+        return self._decompress(chunk)
+
+    # Reads and decompresses data from the key until there is at least one full line to
+    # return, or until the end of the data is reached. Returns False in the latter case if
+    # there is nothing left to return.
+    def _fill(self):
+        while not self._done:
+            data = self._read()
+            if data is None:
+                self._done = True
+                break
+            last = data.rfind('\n')
+            if last < 0:
+                self._tail += data
+            elif len(self._tail) > 0:
+                self._tail += memoryview(data)[0:last+1]
+                self._data = str(self._tail)
+                self._pos = 0
+                self._end = len(self._data)
+                self._tail = bytearray(memoryview(data)[last+1:])
+                return True
+            else:
+                self._data = data
+                self._pos = 0
+                self._end = last + 1
+                self._tail += memoryview(data)[last+1:]
+                return True
+
+        if len(self._tail) > 0:
+            self._data = str(self._tail)
+            self._pos = 0
+            self._end = len(self._data)
+            self._tail = bytearray()
+            return True
+        return False
+
     def next(self):
-        while True:
-            if len(self._lines) > 1:
-                return self._lines.pop(0) + '\n'
-            elif self._done and len(self._lines) == 1:
-                return self._lines.pop(0)
-            elif self._done and len(self._lines) == 0:
-                raise StopIteration
+        if self._pos >= self._end and not self._fill():
+            raise StopIteration
+        i = self._data.find('\n', self._pos, self._end)
+        if i < 0:
+            i = self._end - 1
+        line = self._data[self._pos:i+1]
+        self._pos = i + 1
+        return line
+
+    # Returns a list with all the lines that are available without further reads, which
+    # is the same sequence of values that would be returned by calling next().
+    def nextbatch(self):
+        if self._pos >= self._end and not self._fill():
+            raise StopIteration
+        lines = _lineregex.findall(self._data, self._pos, self._end)
+        self._pos = self._end
+        return lines
+
+
+'''
+Decompresses a string with one or more complete bzip2 streams, returning None if the data
+does not start or end at a stream boundary. Used by ParallelBZ2KeyIterator.
+'''
+
+
+def _decompress_streams(data):
+    retval = []
+    try:
+        while len(data) > 0:
+            decomp = BZ2Decompressor()
+            retval.append(decomp.decompress(data))
+            data = decomp.unused_data
+            if len(data) == 0:
+                # will raise EOFError only if the end of the stream was reached
+                decomp.decompress('')
+                return None
+    except EOFError:
+        return ''.join(retval)
+    except IOError:
+        return None
+    return ''.join(retval)
+
+
+'''
+Same as BZ2KeyIterator, but for files with multiple bzip2 streams such as those created by
+pbzip2. The compressed data is split at stream boundaries as it is read, and each stream
+is decompressed in a thread pool (the bz2 module releases the GIL, and InserterProcess is
+a daemon so it cannot start child processes) while lines are still returned in order.
+
+At most 'maxpending' streams are being decompressed or waiting to be returned at a time,
+which bounds memory usage. If no stream boundary is found in the first 'maxstream'
+compressed bytes (i.e. a single-stream file), it falls back to sequential decompression.
+If 'pool' is None, a pool with 'workers' threads is created and closed by the iterator.
+'''
+
+
+class ParallelBZ2KeyIterator(BZ2KeyIterator):
+    def __init__(self, key, pool=None, workers=2, bufsize=100*1024, maxpending=None,
+                 maxstream=16*1024*1024):
+        super(ParallelBZ2KeyIterator, self).__init__(key, bufsize)
+        self._ownpool = pool is None
+        self._pool = ThreadPool(workers) if pool is None else pool
+        self._maxpending = maxpending if maxpending is not None else 2 * workers
+        self._maxstream = maxstream
+        self._pending = deque()
+        self._comp = bytearray()
+        self._eof = False
+        self._sequential = False
+
+    # Submits compressed data with one or more streams to the pool.
+    def _submit(self, data):
+        self._pending.append((data, self._pool.apply_async(_decompress_streams, (data,))))
+
+    # Reads a chunk from the key and submits all streams that are complete.
+    def _readstreams(self):
+        chunk = self.key.read(self.bufsize)
+        if not chunk:
+            self._eof = True
+            if len(self._comp) > 0:
+                self._submit(str(self._comp))
+                self._comp = bytearray()
+            return
+
+        start = max(len(self._comp) - _streamheaderlen + 1, 1)
+        self._comp += chunk
+        pos = 0
+        for m in _streamregex.finditer(self._comp, start):
+            if m.start() > pos:
+                self._submit(str(self._comp[pos:m.start()]))
+                pos = m.start()
+        if pos > 0:
+            del self._comp[:pos]
+        elif len(self._comp) > self._maxstream:
+            logging.debug("No bzip2 stream boundary found in {0}, decompressing sequentially".format(
+                getattr(self.key, 'name', self.key)))
+            self._sequential = True
+
+    # Returns the decompressed data of the oldest submitted stream. Data that could not be
+    # decompressed on its own (because the stream header pattern also occurred inside the
+    # compressed data) is merged with the data that follows it and decompressed again.
+    def _result(self):
+        data, result = self._pending.popleft()
+        retval = result.get()
+        while retval is None:
+            while len(self._pending) == 0 and not self._eof and not self._sequential:
+                self._readstreams()
+            if len(self._pending) > 0:
+                data = data + self._pending.popleft()[0]
+            elif self._sequential:
+                data = data + str(self._comp)
+                self._comp = bytearray()
+                return self._decompress(data)
             else:
+                raise IOError("compressed data ended before the end-of-stream marker")
+            retval = _decompress_streams(data)
+        return retval
+
+    def _read(self):
+        while True:
+            if len(self._pending) > 0:
+                if (self._eof or self._sequential or len(self._pending) >= self._maxpending or
+                        self._pending[0][1].ready()):
+                    return self._result()
+            elif self._sequential:
+                if len(self._comp) > 0:
+                    data = str(self._comp)
+                    self._comp = bytearray()
+                    return self._decompress(data)
+                return BZ2KeyIterator._read(self)
+            elif self._eof:
+                self._close()
+                return None
+            self._readstreams()
+
+    # Releases the thread pool if it was created by this instance.
+    def _close(self):
+        if self._ownpool and self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+
+'''
+File-like object that downloads an S3 Key with several concurrent ranged GET requests of
+'rangesize' bytes, so that a single object can be read faster than one HTTP stream allows.
+It only has the read() method used by BZ2KeyIterator and its subclasses, which returns the
+bytes in order and an empty string at the end, like a boto Key.
+
+Ranges are fetched with 'fetch(key, start, end)' (e.g. S3Repository.get_range) in a thread
+pool, and kept in a reorder buffer until read. At most 'maxpending' ranges are being fetched
+or waiting to be read at a time, which bounds memory to about maxpending * rangesize bytes.
+A range that fails or comes back short is fetched again up to 'retries' times, waiting
+'delay' seconds and twice as long after each failure. If 'pool' is None, a pool with
+'workers' threads is created and closed by the reader.
+'''
+
+
+class RangedKeyReader(object):
+    def __init__(self, key, fetch, pool=None, workers=4, rangesize=8*1024*1024, maxpending=None,
+                 retries=3, delay=0.5):
+        self.key = key
+        self.name = key.name
+        self.size = key.size
+        self.fetch = fetch
+        self.rangesize = rangesize
+        self.retries = retries
+        self.delay = delay
+        self._ownpool = pool is None
+        self._pool = ThreadPool(workers) if pool is None else pool
+        self._maxpending = maxpending if maxpending is not None else 2 * workers
+        self._pending = deque()
+        self._next = 0
+        self._data = ''
+        self._pos = 0
+
+    # Fetches one range, retrying on failure. Runs in the thread pool.
+    def _fetch(self, start, end):
+        attempt = 0
+        while True:
+            try:
+                data = self.fetch(self.key, start, end)
+                if len(data) != end - start + 1:
+                    raise IOError("got {0} bytes instead of {1}".format(len(data), end - start + 1))
+                return data
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                logging.debug("Retrying bytes {0}-{1} of {2} after error: {3}".format(start, end, self.name, repr(e)))
+                sleep(self.delay * 2 ** attempt)
+                attempt = attempt + 1
+
+    # Submits ranges to the pool until 'maxpending' of them are pending or all were submitted.
+    def _submit(self):
+        while len(self._pending) < self._maxpending and self._next < self.size:
+            end = min(self._next + self.rangesize, self.size) - 1
+            self._pending.append(self._pool.apply_async(self._fetch, (self._next, end)))
+            self._next = end + 1
+
+    def read(self, size):
+        if self._pos >= len(self._data):
+            self._submit()
+            if len(self._pending) == 0:
+                self.close()
+                return ''
+            try:
+                self._data = self._pending.popleft().get()
+            except Exception:
+                self.close()
+                raise
+            self._pos = 0
+            self._submit()
+        retval = self._data[self._pos:self._pos+size]
+        self._pos = self._pos + len(retval)
+        return retval
+
+    # Releases the thread pool if it was created by this instance.
+    def close(self):
+        if self._ownpool and self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+
+'''
+Same as BZ2KeyIterator, but only over the part of a file with multiple bzip2 streams that
+lies between the 'start' and 'end' byte offsets, so that a large file can be loaded as
+several independent tasks. The compressed data is read with ranged GET requests.
+
+A task owns the streams that start inside its range. Lines that cross the end of the last
+owned stream belong to the task they start in, so each task discards everything up to the
+first line break of its data (unless it starts at offset 0) and keeps reading past its last
+owned stream until the first line break. Every task other than the first one also returns
+the first line of the file (the TSV header) before its own lines.
+
+A file with a single stream is owned entirely by the task that starts at offset 0.
+'''
+
+
+class BZ2RangeIterator(BZ2KeyIterator):
+    def __init__(self, key, start, end, bufsize=100*1024):
+        super(BZ2RangeIterator, self).__init__(key, bufsize)
+        self.start = start
+        self.end = end
+        self._pieces = None
+
+    def _read(self):
+        if self._pieces is None:
+            self._pieces = self._generate()
+        return next(self._pieces, None)
+
+    # Returns the first line of the file, read from its beginning.
+    def _readheader(self):
+        self.key.open_read(headers={'Range': 'bytes=0-'})
+        try:
+            decomp = BZ2Decompressor()
+            data = ''
+            while '\n' not in data:
                 chunk = self.key.read(self.bufsize)
-                if chunk is not None:
-                    try:
-                        lines = self._decomp.decompress(chunk).split('\n')
-                        if len(self._lines) > 0:
-                            self._lines[len(self._lines)-1] = self._lines[len(self._lines)-1] + lines.pop(0)
-                        for l in lines:
-                            self._lines.append(l)
-                    except EOFError:
-                        self._done = True
+                if not chunk:
+                    break
+                data = data + decomp.decompress(chunk)
+        finally:
+            self.key.close(fast=True)
+        i = data.find('\n')
+        return data if i < 0 else data[0:i+1]
+
+    # Generates the decompressed data of the range, header first.
+    def _generate(self):
+        if self.start > 0:
+            yield self._readheader()
+        self.key.open_read(headers={'Range': 'bytes={0}-'.format(self.start)})
+        try:
+            for data in self._streams():
+                yield data
+        finally:
+            self.key.close(fast=True)
+
+    # Reads compressed data from the current position of the key until a stream that starts
+    # inside the range is found, returning the data starting at it and its offset, or None
+    # if there is no such stream. Candidates that cannot be decompressed are skipped, since
+    # the stream header pattern may also occur inside compressed data.
+    def _seek(self):
+        offset = self.start
+        comp = ''
+        pos = 0
+        while True:
+            m = _streamregex.search(comp, pos)
+            if m is not None and offset + m.start() >= self.end:
+                return None
+            if m is not None and len(comp) - m.start() >= self.bufsize:
+                try:
+                    BZ2Decompressor().decompress(comp[m.start():])
+                    return offset + m.start(), comp[m.start():]
+                except IOError:
+                    pos = m.start() + 1
+                    continue
+            chunk = self.key.read(self.bufsize)
+            if not chunk:
+                if m is not None:
+                    return offset + m.start(), comp[m.start():]
+                return None
+            if m is None:
+                keep = max(len(comp) - _streamheaderlen + 1, 0)
+                offset = offset + keep
+                comp = comp[keep:]
+                pos = 0
+            comp = comp + str(chunk)
+
+    # Generates the decompressed data of the streams owned by the range, as described above.
+    def _streams(self):
+        offset, comp = self.start, ''
+        skip = self.start > 0
+        if skip:
+            found = self._seek()
+            if found is None:
+                return
+            offset, comp = found
+        finishing = False
+        decomp = BZ2Decompressor()
+        while True:
+            if len(comp) == 0:
+                comp = self.key.read(self.bufsize)
+                if not comp:
+                    return
+            data = decomp.decompress(comp)
+            rest = decomp.unused_data
+            eos = len(rest) > 0
+            if not eos:
+                # may still return buffered data if the end of the stream was not reached
+                try:
+                    data = data + decomp.decompress('')
+                except EOFError:
+                    eos = True
+            offset = offset + len(comp) - len(rest)
+            comp = rest
+
+            if skip:
+                i = data.find('\n')
+                if i >= 0:
+                    data = data[i+1:]
+                    skip = False
                 else:
-                    self._done = True
+                    data = ''
+            if finishing:
+                i = data.find('\n')
+                if i >= 0:
+                    yield data[0:i+1]
+                    return
+            if len(data) > 0:
+                yield data
+
+            if eos:
+                decomp = BZ2Decompressor()
+                if offset >= self.end:
+                    # no line starts in the owned streams, all of them belong to a previous task
+                    if skip:
+                        return
+                    finishing = True
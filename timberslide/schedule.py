@@ -0,0 +1,93 @@
+'''
+Created on 18/10/2026
+'''
+
+from heapq import heapify, heapreplace
+from timberslide.slots import Slot
+
+
+'''
+Returns the list of tasks needed to load a set of boto S3 Key instances, largest first, as
+(name, start, end, size) tuples. When 'splitsize' is given, keys larger than it are split
+into byte ranges of that size (see BZ2RangeIterator), otherwise 'start' and 'end' are None
+and the whole key is loaded by a single task.
+
+Since workers take tasks from a single queue in order, queueing them largest first is the
+LPT (longest processing time) rule, which keeps a huge file from being started last while
+every other worker is idle.
+'''
+
+
+def plan_tasks(keys, splitsize=None):
+    tasks = []
+    for key in keys:
+        size = key.size or 0
+        if splitsize and size > splitsize:
+            for start in range(0, size, splitsize):
+                end = min(start + splitsize, size)
+                tasks.append((key.name, start, end, end - start))
+        else:
+            tasks.append((key.name, None, None, size))
+    tasks.sort(key=lambda t: (-t[3], t[0], t[1]))
+    return tasks
+
+
+'''
+Returns the list of units needed to replace the data of several slots, largest first, as
+(slot, tasks, size) tuples where 'tasks' has the (name, start, end) tasks that load each of
+the keys of 'slot' as a whole, and 'size' is their total size. 'groups' is a dictionary
+mapping each Slot, or None for keys that are not in any slot, to a list of boto S3 Key
+instances. Units of the same size are ordered by slot name, None last.
+'''
+
+
+def plan_units(groups):
+    units = []
+    for slot, keys in groups.items():
+        tasks = plan_tasks(keys)
+        units.append((slot, [t[0:3] for t in tasks], sum([t[3] for t in tasks])))
+    # Slot instances cannot be compared with None
+    units.sort(key=lambda u: (-u[2], u[0] is None, str(u[0])))
+    return units
+
+
+'''
+Splits the slots of 'groups' (see plan_units) into the slots of 'length' characters, hours
+by default, that their keys are in according to 'slot_of', a function that returns the hour
+Slot of a key name, so that they are replaced as separate units by several workers. Parts
+of a slot without any keys are kept as large as possible, so their rows are deleted at once.
+Returns a new dictionary.
+'''
+
+
+def split_groups(groups, slot_of, length=10):
+    retval = {}
+    for slot, keys in groups.items():
+        _split_group(retval, slot, keys, slot_of, length)
+    return retval
+
+
+def _split_group(groups, slot, keys, slot_of, length):
+    if len(keys) == 0 or len(slot) >= length:
+        groups[slot] = keys
+        return
+    children = dict([(child, []) for child in slot.children()])
+    for k in keys:
+        children[Slot(slot_of(k.name).slot[0:len(slot)+2])].append(k)
+    for child, ks in children.items():
+        _split_group(groups, child, ks, slot_of, length)
+
+
+'''
+Returns the largest total size assigned to any of 'workers' workers when the given task
+sizes are taken in order, each by the worker that is the least loaded so far. This is the
+makespan predicted for plan_tasks() output if load time is proportional to size.
+'''
+
+
+def makespan(sizes, workers):
+    loads = [0] * max(workers, 1)
+    heapify(loads)
+    for size in sizes:
+        heapreplace(loads, loads[0] + size)
+    return max(loads)
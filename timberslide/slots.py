@@ -4,9 +4,13 @@ Created on 23/12/2014
 @author: asieira
 '''
 from types import StringType, IntType
-from datetime import datetime, timedelta
-import pytz
-from calendar import monthrange
+from datetime import date, datetime, timedelta
+from bisect import bisect_right
+from calendar import monthrange, timegm
+
+
+# all Slot instances created so far, by their string representation
+_interned = {}
 
 
 '''
@@ -16,38 +20,54 @@ in YYYY, YYYYMM, YYYYMMDD or YYYYMMDDHH formats (UTC).
 
 
 class Slot(object):
-    def __init__(self, slot):
-        self.slot = slot
+    __slots__ = ('slot', '_year', '_month', '_day', '_hour', '_hours')
+
+    # Slot instances are immutable and interned, so constructing a Slot that was already
+    # constructed before (e.g. by parent() or children()) returns the same instance.
+    def __new__(cls, slot):
+        retval = _interned.get(slot) if type(slot) is StringType else None
+        if retval is not None:
+            return retval
         if not type(slot) is StringType or not slot.isdigit() or not len(slot) in [4, 6, 8, 10]:
             raise ValueError("slot must be a string with 4, 6, 8 or 10 digits only")
-        params = {'tzinfo': pytz.utc, 'year': self.year(), 'month': 1, 'day': 1}
-        if self.month() is not None:
-            params['month'] = self.month()
-        if self.day() is not None:
-            params['day'] = self.day()
-        if self.hour() is not None:
-            params['hour'] = self.hour()
-        datetime(**params)
+
+        year = int(slot[0:4])
+        month = int(slot[4:6]) if len(slot) >= 6 else None
+        day = int(slot[6:8]) if len(slot) >= 8 else None
+        hour = int(slot[8:10]) if len(slot) >= 10 else None
+        if year < 1:
+            raise ValueError("year is out of range")
+        if month is not None and (month < 1 or month > 12):
+            raise ValueError("month must be in 1..12")
+        if day is not None and (day < 1 or day > monthrange(year, month)[1]):
+            raise ValueError("day is out of range for month")
+        if hour is not None and hour > 23:
+            raise ValueError("hour must be in 0..23")
+
+        retval = object.__new__(cls)
+        retval.slot = slot
+        retval._year = year
+        retval._month = month
+        retval._day = day
+        retval._hour = hour
+        retval._hours = None
+        _interned[slot] = retval
+        return retval
+
+    def __reduce__(self):
+        return (Slot, (self.slot,))
 
     def year(self):
-        if self.slot is None:
-            return None
-        return int(self.slot[0:4])
+        return self._year
 
     def month(self):
-        if self.slot is None or len(self.slot) < 6:
-            return None
-        return int(self.slot[4:6])
+        return self._month
 
     def day(self):
-        if self.slot is None or len(self.slot) < 8:
-            return None
-        return int(self.slot[6:8])
+        return self._day
 
     def hour(self):
-        if self.slot is None or len(self.slot) < 10:
-            return None
-        return int(self.slot[8:10])
+        return self._hour
 
     def parent(self):
         if len(self) == 4:
@@ -104,7 +124,21 @@ class Slot(object):
         if start > end:
             return other.rangeto(self)
 
-        return _rangeto(start, end)
+        return SlotSet.between(start, end)
+
+    # Returns the half-open interval of hours since the epoch covered by this slot.
+    def hours(self):
+        if self._hours is None:
+            start = _hours(self._year, self._month or 1, self._day or 1, self._hour or 0)
+            if len(self) == 4:
+                self._hours = (start, _hours(self._year+1, 1, 1, 0))
+            elif len(self) == 6:
+                self._hours = (start, _hours(self._year + self._month // 12, self._month % 12 + 1, 1, 0))
+            elif len(self) == 8:
+                self._hours = (start, start + 24)
+            else:
+                self._hours = (start, start + 1)
+        return self._hours
 
     def __repr__(self):
         return "Slot(\""+self.slot+"\")"
@@ -158,79 +192,196 @@ class Slot(object):
         if not type(other) is IntType:
             raise TypeError("slots should be added to integers")
         if len(self) == 4:
-            return Slot(format(self.year()+other, "04"))
+            return Slot(format(self._year+other, "04"))
         elif len(self) == 6:
-            year = self.year()
-            month = self.month() + other
-            while month < 1:
-                year = year - 1
-                month = month + 12
-            while month > 12:
-                year = year + 1
-                month = month - 12
-            return Slot(format(year, "04")+format(month, "02"))
+            year, month = divmod(self._year * 12 + self._month - 1 + other, 12)
+            return Slot(format(year, "04")+format(month + 1, "02"))
         elif len(self) == 8:
-            dt = datetime(self.year(), self.month(), self.day()) + timedelta(days=other)
-            return Slot(format(dt, "%Y%m%d"))
+            dt = date.fromordinal(date(self._year, self._month, self._day).toordinal() + other)
+            return Slot(format(dt.year, "04")+format(dt.month, "02")+format(dt.day, "02"))
         else:
-            dt = datetime(self.year(), self.month(), self.day(), self.hour()) + timedelta(hours=other)
-            return Slot(format(dt, "%Y%m%d%H"))
+            days, hour = divmod(self._hour + other, 24)
+            dt = date.fromordinal(date(self._year, self._month, self._day).toordinal() + days)
+            return Slot(format(dt.year, "04")+format(dt.month, "02")+format(dt.day, "02")+format(hour, "02"))
 
     def __sub__(self, other):
         return self.__add__(-other)
 
 '''
-Called internally by Slot.rangeto to handle the recursive resolution.
+Returns the number of hours since the epoch (1970-01-01 00:00 UTC) of the given time.
+'''
+
+
+def _hours(year, month, day, hour):
+    return timegm((year, month, day, hour, 0, 0)) // 3600
 
-Expects two Slot instances as parameters, and returns a set of Slot instances.
+
+_epoch = datetime(1970, 1, 1)
+
+
+'''
+This class represents a set of hours as a sorted list of disjoint half-open intervals of
+hours since the epoch, so that ranges spanning years take constant space.
+
+It supports union (|), intersection (&) and difference (-) with other SlotSet instances
+in linear time on the number of intervals, and membership tests of Slot instances or hours
+in O(log n). Iterating over it, or comparing it to a set, is done using the minimal set
+of YYYY, YYYYMM, YYYYMMDD or YYYYMMDDHH slots that covers exactly the same hours, which is
+what slots() returns.
 '''
 
 
-def _rangeto(start, end):
-    # trivial cases
-    if start == end:
-        return set([start])
-    if start > end:
-        return set()
-    if len(start) == 4:
-        return set([Slot(format(i, "04")) for i in range(start.year(), end.year()+1)])
-
-    # now handle more complex cases
-    startpar = start.parent()
-    endpar = end.parent()
-    if startpar == endpar:
-        # same parent
-        if start == startpar.children_start() and end == startpar.children_end():
-            # completely cover parent, so return it
-            return set([startpar])
-        else:
-            # same parent, doesn't cover all of it so we range through last component
-            return set([Slot(startpar.slot+format(i, "02"))
-                        for i in range(int(start.slot[len(start.slot)-2:len(start.slot)]),
-                                       int(end.slot[len(end.slot)-2:len(end.slot)])+1)])
-    else:
-        # parents are different, recurse
-        if startpar+1 > endpar-1:
-            return (start.rangeto(startpar.children_end())
-                    | endpar.children_start().rangeto(end))
+class SlotSet(object):
+    def __init__(self, slots=()):
+        intervals = sorted([s.hours() for s in slots])
+        self._starts, self._ends = SlotSet._merge(intervals)
+        self._slots = None
+
+    # Returns a SlotSet for the inclusive range of slots between 'start' and 'end', which
+    # must have the same length.
+    @staticmethod
+    def between(start, end):
+        retval = SlotSet()
+        if start <= end:
+            retval._starts = [start.hours()[0]]
+            retval._ends = [end.hours()[1]]
+        return retval
+
+    # Merges a list of (start, end) tuples sorted by start, returning the lists of starts
+    # and ends of the disjoint intervals.
+    @staticmethod
+    def _merge(intervals):
+        starts = []
+        ends = []
+        for start, end in intervals:
+            if len(ends) > 0 and start <= ends[len(ends)-1]:
+                ends[len(ends)-1] = max(ends[len(ends)-1], end)
+            elif start < end:
+                starts.append(start)
+                ends.append(end)
+        return starts, ends
+
+    @staticmethod
+    def _create(starts, ends):
+        retval = SlotSet()
+        retval._starts = starts
+        retval._ends = ends
+        return retval
+
+    def intervals(self):
+        return list(zip(self._starts, self._ends))
+
+    def union(self, other):
+        return SlotSet._create(*SlotSet._merge(sorted(self.intervals() + other.intervals())))
+
+    def intersection(self, other):
+        starts = []
+        ends = []
+        i = 0
+        j = 0
+        while i < len(self._starts) and j < len(other._starts):
+            start = max(self._starts[i], other._starts[j])
+            end = min(self._ends[i], other._ends[j])
+            if start < end:
+                starts.append(start)
+                ends.append(end)
+            if self._ends[i] < other._ends[j]:
+                i = i + 1
+            else:
+                j = j + 1
+        return SlotSet._create(starts, ends)
+
+    def difference(self, other):
+        starts = []
+        ends = []
+        j = 0
+        for start, end in zip(self._starts, self._ends):
+            while j < len(other._starts) and other._ends[j] <= start:
+                j = j + 1
+            k = j
+            while k < len(other._starts) and other._starts[k] < end:
+                if other._starts[k] > start:
+                    starts.append(start)
+                    ends.append(other._starts[k])
+                start = max(start, other._ends[k])
+                k = k + 1
+            if start < end:
+                starts.append(start)
+                ends.append(end)
+        return SlotSet._create(starts, ends)
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    # Accepts either a Slot instance or an hour since the epoch.
+    def __contains__(self, item):
+        if isinstance(item, Slot):
+            start, end = item.hours()
         else:
-            return (start.rangeto(startpar.children_end())
-                    | (startpar+1).rangeto(endpar-1)
-                    | endpar.children_start().rangeto(end))
+            start, end = item, item + 1
+        i = bisect_right(self._starts, start) - 1
+        return i >= 0 and self._ends[i] >= end
+
+    # Returns the minimal set of Slot instances covering the same hours, using the longest
+    # slot (year, month, day or hour) that starts at each point and fits in the interval.
+    def slots(self):
+        if self._slots is None:
+            self._slots = set()
+            for start, end in zip(self._starts, self._ends):
+                while start < end:
+                    dt = _epoch + timedelta(hours=start)
+                    slot = Slot(format(dt, "%Y%m%d%H"))
+                    if dt.hour == 0:
+                        for parent in [Slot(format(dt, "%Y")), Slot(format(dt, "%Y%m")), Slot(format(dt, "%Y%m%d"))]:
+                            pstart, pend = parent.hours()
+                            if pstart == start and pend <= end:
+                                slot = parent
+                                break
+                    self._slots.add(slot)
+                    start = slot.hours()[1]
+        return set(self._slots)
+
+    def __iter__(self):
+        return iter(self.slots())
+
+    def __len__(self):
+        return len(self.slots())
+
+    def __eq__(self, other):
+        if isinstance(other, (set, frozenset)):
+            other = SlotSet(other)
+        if not isinstance(other, SlotSet):
+            return NotImplemented
+        return self._starts == other._starts and self._ends == other._ends
+
+    def __ne__(self, other):
+        retval = self.__eq__(other)
+        if retval is NotImplemented:
+            return retval
+        return not retval
+
+    def __repr__(self):
+        return "SlotSet([" + ", ".join([repr(s) for s in sorted(self.slots())]) + "])"
 
 '''
 Parses a slot range string in the '<slot>:<slot>' format, replacing any missing slots by the
 boundaries of existing slots in the given repository (repo) which must be a S3Repository
 instance.
 
-Returns a set of Slot instances.
+Returns a SlotSet instance.
 '''
 
 
 def parseSlotRange(text, repo):
     text = text.split(':')
     if len(text) == 1:
-        return set([Slot(text[0])])
+        return SlotSet([Slot(text[0])])
     elif len(text) == 2:
         if len(text[0]) == 0:
             text[0] = repo.get_min_slot()
@@ -251,46 +402,18 @@ def parseSlotRange(text, repo):
         raise ValueError('slot \"'+text+'\" is invalid')
 
 '''
-Receives a list of sets of Slot instances, and consolidates all of them into a single set
-of Slot instances.
+Receives a list of SlotSet instances (or sets of Slot instances), and consolidates all of
+them into a single SlotSet instance.
 
-The processing will ensure that the slots with the smallest length possible are used, and that
-slots contained by other slots will be removed.
+Iterating over the result will use the slots with the smallest length possible, without
+slots contained by other slots.
 '''
 
 
 def mergeSlotSets(slotSetList):
-    # merge entries
-    allSlots = set()
+    intervals = []
     for slotSet in slotSetList:
-        allSlots.update(slotSet)
-
-    # remove entries with parents already in the list
-    redundant = set()
-    for slot in allSlots:
-        if not allSlots.isdisjoint(slot.parents()):
-            redundant.add(slot)
-    allSlots.difference_update(redundant)
-    redundant.clear()
-
-    # consolidate entries by using parent if all of its children
-    # are present
-    parents = set()
-    done = False
-    while not done:
-        done = True
-        for slot in allSlots:
-            par = slot.parent()
-            if par is not None and par not in parents:
-                siblings = par.children()
-                if siblings.issubset(allSlots):
-                    done = False
-                    parents.add(par)
-                    redundant.update(siblings)
-        allSlots.difference_update(redundant)
-        redundant.clear()
-        allSlots.update(parents)
-        parents.clear()
-
-    # we're done
-    return allSlots
+        if not isinstance(slotSet, SlotSet):
+            slotSet = SlotSet(slotSet)
+        intervals.extend(slotSet.intervals())
+    return SlotSet._create(*SlotSet._merge(sorted(intervals)))